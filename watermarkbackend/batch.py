@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import zipfile
+from functools import partial
+
+from fastapi import HTTPException
+
+from watermark.visible import apply_visible_watermark
+from watermark.invisible import apply_invisible_watermark_advanced, payload_bits
+from watermark.logo import apply_logo_watermark
+from watermark.encoder import OutputFormat
+from watermark.timing import timed
+from uploads import read_image, run_upload, discard, stream_result
+from metrics import observe_timings, PAYLOAD_BITS
+
+
+BATCH_MODES = ("visible", "invisible", "logo")
+
+
+def apply_batch_watermark(mode: str, image_bytes: bytes, text: str, logo_bytes, options: dict,
+                          output: OutputFormat = None) -> bytes:
+    """
+    Applica il watermark richiesto a una singola immagine del batch
+
+    Funzione a livello di modulo perché deve poter essere eseguita nei worker
+    del process pool. Le opzioni assenti usano i default delle funzioni apply_*;
+    logo_bytes può essere anche l'ID di un logo registrato o un RegisteredLogo.
+    """
+    if mode == "visible":
+        return apply_visible_watermark(image_bytes, text, output=output, **options)
+    elif mode == "invisible":
+        return apply_invisible_watermark_advanced(image_bytes, text, output=output, **options)
+    elif mode == "logo":
+        return apply_logo_watermark(image_bytes, logo_bytes, output=output, **options)
+    else:
+        raise ValueError(f"Modalità non supportata: {mode}")
+
+
+class _ChunkBuffer:
+    """Stream di sola scrittura: zipfile lo tratta come non seekable e usa i data descriptor"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def output_name(filename: str, index: int, extension: str = "png") -> str:
+    stem = os.path.splitext(os.path.basename(filename or ""))[0] or f"image_{index}"
+    return f"{index:05d}_{stem}.{extension}"
+
+
+async def stream_batch_zip(pool, files: list, mode: str, text: str, logo_bytes, options: dict,
+                           output: OutputFormat = None):
+    """
+    Elabora i file in parallelo sul pool e produce lo ZIP un pezzo alla volta
+
+    Ogni immagine viene scritta nell'archivio appena è pronta. Gli errori sui
+    singoli file finiscono in manifest.json senza interrompere il batch.
+    In modalità invisible options["method"] deve essere già risolto dal chiamante.
+    """
+    limit = asyncio.Semaphore(pool.size)
+
+    async def process(index, upload):
+        name = output_name(upload.filename, index, output.extension if output else "png")
+        async with limit:
+            image = None
+            try:
+                # Limiti di byte e pixel come negli endpoint singoli; in memoria al massimo pool.size upload
+                image = await read_image(upload)
+                result = await pool.run(timed, run_upload, partial(apply_batch_watermark, mode), image,
+                                        text, logo_bytes, options, output)
+                return index, upload.filename, name, result, None
+            except HTTPException as e:
+                return index, upload.filename, name, None, e.detail
+            except Exception as e:
+                return index, upload.filename, name, None, str(e)
+            finally:
+                discard(image)
+
+    buffer = _ChunkBuffer()
+    archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED)
+    tasks = [asyncio.ensure_future(process(index, upload)) for index, upload in enumerate(files)]
+    manifest = []
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, filename, name, result, error = await next_done
+            if error is None:
+                image, timings = result
+                observe_timings(timings)
+                if mode == "invisible":
+                    PAYLOAD_BITS.observe(payload_bits(text, options["method"]), method=options["method"])
+                # L'immagine entra nell'archivio (e nella risposta) a pezzi, anche se è su file temporaneo
+                with archive.open(name, "w") as entry:
+                    async for chunk in stream_result(image):
+                        entry.write(chunk)
+                        yield buffer.take()
+                manifest.append({"index": index, "filename": filename, "output": name, "success": True,
+                                 **{stage: round(value, 1) for stage, value in timings.items()}})
+            else:
+                manifest.append({"index": index, "filename": filename, "success": False, "error": error})
+            yield buffer.take()
+
+        manifest.sort(key=lambda entry: entry["index"])
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2, ensure_ascii=False))
+        archive.close()
+        yield buffer.take()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,256 @@
+"""
+Benchmark offline dei percorsi di embed ed estrazione
+
+Ogni caso gira in un processo nuovo, così il picco di RSS è solo suo.
+Per ogni caso misura tempo (mediana e minimo su più ripetizioni), picco di
+RSS e picco di allocazioni tracciate da tracemalloc (Python e NumPy, non i
+buffer interni di Pillow), su immagini sintetiche generate al volo.
+Misura anche i MB/s di codifica e decodifica del codice di correzione.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --sizes 0.25 2 --compare baseline.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+DEFAULT_SIZES = [0.25, 2, 12, 48]
+DEFAULT_PAYLOADS = [8, 64, 120]
+
+# (nome, dipende dalla lunghezza del payload)
+CASES = [
+    ("visible_apply", False),
+    ("logo_apply", False),
+    ("lsb_apply", True),
+    ("lsb_extract", True),
+    ("dct_apply", True),
+    ("dct_extract", True),
+    ("dwt_apply", True),
+    ("dwt_extract", True),
+    ("dft_apply", True),
+    ("dft_extract", True),
+    ("robust_apply", True),
+    ("robust_extract", True),
+]
+
+# Casi DFT: capacità limitata (DFT_CAPACITY meno header, CRC e parità) e immagini di almeno un tile
+DFT_CASES = ("dft_apply", "dft_extract")
+
+
+def synthetic_size(megapixels: float) -> tuple:
+    """(larghezza, altezza) 4:3 dell'immagine sintetica di megapixels"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    return width, int(megapixels * 1e6 / width)
+
+
+def runnable(name: str, megapixels: float, payload: int) -> bool:
+    """False per i casi che il metodo rifiuta: sarebbero un errore, non una misura"""
+    if name not in DFT_CASES:
+        return True
+    from watermark.dft_engine import DFT_TILE
+    from watermark.invisible import dft_max_message_bytes
+
+    return min(synthetic_size(megapixels)) >= DFT_TILE and payload <= dft_max_message_bytes()
+
+
+def synthetic_png(megapixels: float, seed: int = 0) -> bytes:
+    """Immagine 4:3 con gradiente e rumore, codificata in PNG"""
+    width, height = synthetic_size(megapixels)
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise + 20, 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _prepare(case: str, image_bytes: bytes, text: str):
+    """Restituisce la funzione da misurare (senza argomenti)"""
+    from watermark.cache import image_cache
+    from watermark.visible import apply_visible_watermark
+    from watermark.logo import apply_logo_watermark
+    from watermark.invisible import apply_invisible_watermark_advanced, extract_invisible_watermark_advanced
+
+    # Le ripetizioni non devono beneficiare della cache
+    image_cache.max_bytes = 0
+
+    if case == "visible_apply":
+        return lambda: apply_visible_watermark(image_bytes, "Watermark benchmark", size=40)
+    if case == "logo_apply":
+        logo_bytes = synthetic_png(0.05, seed=1)
+        return lambda: apply_logo_watermark(image_bytes, logo_bytes)
+
+    method, action = case.split("_")
+    if action == "apply":
+        return lambda: apply_invisible_watermark_advanced(image_bytes, text, method)
+    watermarked = apply_invisible_watermark_advanced(image_bytes, text, method)
+    return lambda: extract_invisible_watermark_advanced(watermarked, method)
+
+
+def run_case(case: str, megapixels: float, payload: int, repeat: int) -> dict:
+    """Eseguito in un processo dedicato: misura un singolo caso"""
+    text = ("Benchmark payload " * 10)[:payload] if payload else ""
+    image_bytes = synthetic_png(megapixels)
+
+    # Le stampe di debug dei watermark non finiscono nell'output del benchmark
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        func = _prepare(case, image_bytes, text)
+        rss_before = _peak_rss_mb()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        rss_peak = _peak_rss_mb()
+
+        tracemalloc.start()
+        func()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "case": case,
+        "megapixels": megapixels,
+        "payload": payload,
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "peak_rss_mb": rss_peak,
+        "rss_increase_mb": rss_peak - rss_before,
+        "alloc_peak_mb": alloc_peak / (1024 * 1024),
+    }
+
+
+def case_key(result: dict) -> str:
+    if "megabytes" in result:
+        return f"{result['case']}@{result['megabytes']}MB"
+    return f"{result['case']}@{result['megapixels']}MP/{result['payload']}"
+
+
+def ecc_throughput(megabytes: float, repeat: int, error_rate: float = 0.0025) -> list:
+    """
+    MB/s del codice di correzione configurato (WATERMARK_ECC_*) su dati casuali
+
+    La decodifica riceve il flusso codificato con error_rate byte alterati,
+    così misura anche la correzione e non solo le sindromi.
+    """
+    from watermark.invisible import AdvancedWatermarking
+
+    code = AdvancedWatermarking().ecc
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, int(megabytes * 1024 * 1024), dtype=np.uint8).tobytes()
+    encoded = code.encode(data)
+    damaged = np.frombuffer(encoded, dtype=np.uint8).copy()
+    positions = rng.choice(len(damaged), int(len(damaged) * error_rate), replace=False)
+    damaged[positions] ^= rng.integers(1, 256, len(positions), dtype=np.uint8)
+    damaged = damaged.tobytes()
+
+    results = []
+    for case, func in (("ecc_encode", lambda: code.encode(data)),
+                       ("ecc_decode", lambda: code.decode(damaged, len(data)))):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        median_ms = statistics.median(timings)
+        results.append({
+            "case": case,
+            "megabytes": megabytes,
+            "median_ms": median_ms,
+            "min_ms": min(timings),
+            "mb_per_s": megabytes / (median_ms / 1000),
+        })
+        print(f"{case_key(results[-1]):32} {median_ms:10.1f} ms  {results[-1]['mb_per_s']:8.2f} MB/s")
+    return results
+
+
+def run_benchmarks(sizes: list, payloads: list, repeat: int, cases: list = None) -> list:
+    results = []
+    selected = [(name, uses_payload) for name, uses_payload in CASES if not cases or name in cases]
+    for megapixels in sizes:
+        for name, uses_payload in selected:
+            for payload in (payloads if uses_payload else [0]):
+                if not runnable(name, megapixels, payload):
+                    continue
+                # Un processo nuovo per ogni caso: RSS e cache non si sommano tra i casi
+                with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+                    result = executor.submit(run_case, name, megapixels, payload, repeat).result()
+                print(f"{case_key(result):32} {result['median_ms']:10.1f} ms  "
+                      f"RSS {result['peak_rss_mb']:8.1f} MB  alloc {result['alloc_peak_mb']:8.1f} MB")
+                results.append(result)
+    return results
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Casi più lenti della baseline oltre la tolleranza (es. 0.25 = +25%)"""
+    reference = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = reference.get(case_key(result))
+        if previous is None:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"] if previous["median_ms"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append({"case": case_key(result), "baseline_ms": previous["median_ms"],
+                                "current_ms": result["median_ms"], "ratio": ratio})
+    return regressions
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Benchmark di watermark visibili, logo, LSB, DCT, DWT, DFT e robust")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="Megapixel delle immagini")
+    parser.add_argument("--payloads", type=int, nargs="+", default=DEFAULT_PAYLOADS, help="Lunghezze del testo nascosto")
+    parser.add_argument("--cases", nargs="+", choices=[name for name, _ in CASES], help="Sottoinsieme di casi")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per caso")
+    parser.add_argument("--ecc-mb", type=float, default=1.0,
+                        help="MB di dati per il throughput del codice di correzione (0 per saltarlo)")
+    parser.add_argument("--output", help="Salva i risultati come baseline JSON")
+    parser.add_argument("--compare", help="Baseline JSON con cui confrontare i risultati")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Rallentamento massimo ammesso")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.payloads, args.repeat, args.cases)
+    if args.ecc_mb > 0:
+        results += ecc_throughput(args.ecc_mb, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "results": results,
+            }, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSIONE {regression['case']}: {regression['baseline_ms']:.1f} -> "
+                  f"{regression['current_ms']:.1f} ms ({regression['ratio']:.2f}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,47 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from watermark.visible import apply_visible_watermark
-from watermark.invisible import apply_invisible_watermark_advanced, extract_invisible_watermark_advanced
+from watermark.invisible import (DEFAULT_INVISIBLE_METHOD, INVISIBLE_METHODS, apply_invisible_watermark_advanced,
+                                 extract_invisible_watermark_details, payload_bits, dft_max_message_bytes)
 from watermark.logo import apply_logo_watermark
-from io import BytesIO
+from watermark.logo_store import logo_store
+from watermark.encoder import OutputFormat
+from watermark.timing import timed, server_timing
+from workers import WorkerPool
+from batch import BATCH_MODES, stream_batch_zip
+from uploads import RequestSizeLimit, read_image, run_upload, discard, stream_result, result_size
+from metrics import MetricsMiddleware, Gauge, register, render, label_request, observe_timings, PAYLOAD_BITS
+from typing import List, Optional
+import importlib
+import logging
+import os
 import uvicorn
 
-app = FastAPI(title="Watermark API", description="API per applicare watermark visibili e invisibili alle immagini")
+# I messaggi di debug dei watermark costano solo il controllo del livello finché restano disattivati
+logging.basicConfig(level=os.environ.get("WATERMARK_LOG_LEVEL", "WARNING").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+pool = WorkerPool.from_env()
+
+register(Gauge("watermark_queue_depth", "Richieste in coda o in esecuzione sul pool", lambda: pool.stats()["pending"]))
+register(Gauge("watermark_queue_capacity", "Richieste oltre cui il pool risponde 503", lambda: pool.max_pending))
+register(Gauge("watermark_workers", "Worker del pool", lambda: pool.size))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    pool.shutdown()
+
+app = FastAPI(title="Watermark API",
+              description="API per applicare watermark visibili e invisibili alle immagini. Le immagini "
+                          "restituite sono codificate per intero prima dell'invio e poi trasmesse a pezzi.",
+              lifespan=lifespan)
+
+# Prima di CORS, così anche le risposte 413 hanno gli header CORS
+app.add_middleware(RequestSizeLimit)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,8 +49,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per ultimo, così conta anche le risposte di CORS e RequestSizeLimit
+app.add_middleware(MetricsMiddleware)
+
+def output_options(
+    output_format: str = Form("png"),
+    compress_level: Optional[int] = Form(None),
+    optimize: Optional[bool] = Form(None),
+    quality: Optional[int] = Form(None)
+) -> OutputFormat:
+    """
+    Formato dell'immagine restituita, comune a tutti gli endpoint:
+    - output_format: png (default), webp (lossless) o jpeg
+    - compress_level/optimize: livello zlib del PNG (0-9)
+    - quality: qualità del JPEG (1-100)
+    """
+    try:
+        return OutputFormat.from_params(output_format, compress_level, optimize, quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_on_upload(file: UploadFile, func, *args) -> tuple:
+    """
+    Valida l'immagine caricata (byte e pixel, vedi uploads.py) ed esegue
+    func(immagine, *args) su un worker
+
+    Returns:
+        (risultato, tempi) come timed; l'eventuale file temporaneo
+        dell'upload viene rimosso alla fine
+    """
+    image = await read_image(file)
+    try:
+        result = await pool.run(timed, run_upload, func, image, *args)
+    finally:
+        discard(image)
+    observe_timings(result[1])
+    return result
+
+def label_method(method: str):
+    """
+    Valida il metodo invisibile prima di usarlo come etichetta delle metriche
+
+    Un valore arbitrario del client creerebbe nuove serie a ogni richiesta:
+    i metodi sconosciuti sono contati come "invalid" e ricevono 400.
+    """
+    if method not in INVISIBLE_METHODS:
+        label_request(method="invalid")
+        raise HTTPException(status_code=400, detail=f"Metodo non supportato: {method}")
+    label_request(method=method)
+
+def image_response(result: tuple, output: OutputFormat) -> StreamingResponse:
+    """
+    Risposta con l'immagine e i tempi di watermark e codifica nell'header Server-Timing
+
+    L'immagine arriva già codificata dal worker e viene inviata a pezzi (stream_result):
+    il primo byte parte solo a codifica finita.
+    """
+    output_image, timings = result
+    return StreamingResponse(stream_result(output_image), media_type=output.media_type,
+                             headers={"Server-Timing": server_timing(timings),
+                                      "Content-Length": str(result_size(output_image))})
+
 @app.get("/")
 async def root():
     return {"message": "Watermark API - Server attivo"}
@@ -27,17 +123,19 @@ async def visible_watermark(
     text: str = Form(...),
     position: str = Form("bottom-right"), 
     opacity: float = Form(0.5), 
-    size: int = Form(20)  
+    size: int = Form(20),
+    output: OutputFormat = Depends(output_options)
 ):
-    image = await file.read()
-    output_image = apply_visible_watermark(image, text, position, opacity, size)
-    return StreamingResponse(BytesIO(output_image), media_type="image/png")
+    result = await run_on_upload(file, apply_visible_watermark, text, position, opacity, size, output)
+    return image_response(result, output)
 
 @app.post("/apply-invisible-watermark")
 async def invisible_watermark(
     file: UploadFile = File(...),
     hidden_text: str = Form(...),
-    method: str = Form("lsb") 
+    method: str = Form("lsb"),
+    key: Optional[str] = Form(None),
+    output: OutputFormat = Depends(output_options)
 ):
     """
     Applica watermark invisibile con diversi metodi:
@@ -45,32 +143,53 @@ async def invisible_watermark(
     - dct: Discrete Cosine Transform (robusto contro compressione JPEG)
     - dft: Discrete Fourier Transform (robusto contro rotazioni)
     - dwt: Discrete Wavelet Transform (molto robusto, richiede PyWavelets)
-    - robust: Combinazione di tutti i metodi (massima sicurezza)
+    - robust: DCT e DWT insieme, con una sola decodifica e codifica
+    L'output jpeg è ammesso solo con dct, dft e robust.
+    key (solo dct e dwt): chiave segreta che sparge i bit su blocchi/coefficienti
+    pseudocasuali, in più copie; serve la stessa chiave per estrarre.
+    Le posizioni dipendono dalle dimensioni dell'immagine: dopo un ritaglio o
+    un ridimensionamento il watermark con chiave non si rilegge. Il numero di
+    copie non è scritto nell'header: estrarre con una versione che ne usa un
+    numero diverso non funziona.
     """
-    image = await file.read()
-    
-    
-    output_image = apply_invisible_watermark_advanced(image, hidden_text, method)
+    label_method(method)
+    try:
+        result = await run_on_upload(file, apply_invisible_watermark_advanced, hidden_text, method, output, key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return StreamingResponse(BytesIO(output_image), media_type="image/png")
+    PAYLOAD_BITS.observe(payload_bits(hidden_text, method), method=method)
+    return image_response(result, output)
 
 @app.post("/extract-invisible-watermark")
 async def extract_invisible_watermark(
     file: UploadFile = File(...),
-    method: str = Form("lsb")  
+    method: str = Form("lsb"),
+    key: Optional[str] = Form(None)
 ):
     """
     Estrae watermark invisibile dall'immagine
-    """
-    image = await file.read()
     
+    timings riporta il tempo di estrazione e delle fasi di decodifica
+    (decode_open, decode_pixels, decode_convert, decode_array) in millisecondi.
+    decoded_with è il metodo che ha letto il testo: con robust "dct" o "dwt".
+    key è la chiave usata in inserimento (solo dct e dwt).
+    """
+    label_method(method)
     try:
-        extracted_text = extract_invisible_watermark_advanced(image, method)
+        (extracted_text, decoded_with), timings = await run_on_upload(file, extract_invisible_watermark_details,
+                                                                      method, key)
+        if extracted_text:
+            PAYLOAD_BITS.observe(payload_bits(extracted_text, method), method=method)
         return {
             "success": True,
             "extracted_text": extracted_text,
-            "method_used": method
+            "method_used": method,
+            "decoded_with": decoded_with,
+            "timings": {stage: round(value, 2) for stage, value in timings.items()}
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -78,18 +197,110 @@ async def extract_invisible_watermark(
             "method_used": method
         }
 
+async def resolve_logo(logo: Optional[UploadFile], logo_id: Optional[str]):
+    """
+    Il logo da passare ai worker: i byte caricati oppure il logo registrato
+
+    Con la directory condivisa (WATERMARK_LOGO_DIR) basta l'ID, i worker lo
+    leggono da disco; altrimenti si passano i pixel già decodificati.
+    """
+    if (logo is None) == (logo_id is None):
+        raise HTTPException(status_code=400, detail="Indicare il file logo oppure logo_id")
+    if logo is not None:
+        return await read_image(logo, spool_large=False)
+    try:
+        registered = logo_store.get(logo_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Logo non registrato o rimosso: {logo_id}")
+    return logo_id if logo_store.directory else registered
+
+@app.post("/logos")
+async def register_logo(logo: UploadFile = File(...)):
+    """
+    Registra un logo e restituisce il suo ID, da usare come logo_id negli
+    endpoint logo al posto del file. Lo stesso file produce sempre lo stesso ID.
+    """
+    logo_bytes = await read_image(logo, spool_large=False)
+    try:
+        registered = await run_in_threadpool(logo_store.register, logo_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"logo_id": registered.logo_id, "width": registered.width, "height": registered.height}
+
+@app.get("/logos/{logo_id}")
+def get_logo(logo_id: str):
+    try:
+        registered = logo_store.get(logo_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Logo non registrato o rimosso: {logo_id}")
+    return {"logo_id": registered.logo_id, "width": registered.width, "height": registered.height}
+
+@app.delete("/logos/{logo_id}")
+def delete_logo(logo_id: str):
+    if not logo_store.delete(logo_id):
+        raise HTTPException(status_code=404, detail=f"Logo non registrato o rimosso: {logo_id}")
+    return {"deleted": logo_id}
+
 @app.post("/apply-logo-watermark")
 async def logo_watermark(
     file: UploadFile = File(...),
-    logo: UploadFile = File(...),
+    logo: Optional[UploadFile] = File(None),
+    logo_id: Optional[str] = Form(None),
     position: str = Form("bottom-right"),
     opacity: float = Form(0.7),
-    size: float = Form(0.1) 
+    size: float = Form(0.1),
+    output: OutputFormat = Depends(output_options)
 ):
-    image = await file.read()
-    logo_image = await logo.read()
-    output_image = apply_logo_watermark(image, logo_image, position, opacity, size)
-    return StreamingResponse(BytesIO(output_image), media_type="image/png")
+    """
+    Applica un logo: il file logo oppure logo_id di un logo registrato con POST /logos
+    """
+    logo_image = await resolve_logo(logo, logo_id)
+    result = await run_on_upload(file, apply_logo_watermark, logo_image, position, opacity, size, output)
+    return image_response(result, output)
+
+@app.post("/batch-watermark")
+async def batch_watermark(
+    files: List[UploadFile] = File(...),
+    mode: str = Form("invisible"),
+    text: str = Form(""),
+    method: Optional[str] = Form(None),
+    position: Optional[str] = Form(None),
+    opacity: Optional[float] = Form(None),
+    size: Optional[float] = Form(None),
+    logo: Optional[UploadFile] = File(None),
+    logo_id: Optional[str] = Form(None),
+    key: Optional[str] = Form(None),
+    output: OutputFormat = Depends(output_options)
+):
+    """
+    Applica lo stesso watermark a più immagini e restituisce uno ZIP in streaming.
+    - mode: visible, invisible o logo
+    - text: testo visibile o nascosto (ignorato in modalità logo)
+    - method/position/opacity/size/key: come negli endpoint singoli
+    - logo o logo_id: il logo in modalità logo
+    - output_format/compress_level/optimize/quality: formato delle immagini nello ZIP
+    Gli errori sui singoli file e i tempi di watermark e codifica sono riportati
+    in manifest.json dentro lo ZIP.
+    """
+    if mode not in BATCH_MODES:
+        label_request(method="invalid")
+        raise HTTPException(status_code=400, detail=f"Modalità non supportata: {mode}")
+    if mode == "invisible":
+        # Risolto qui una volta: lo stesso valore va al watermark e alle metriche
+        method = method or DEFAULT_INVISIBLE_METHOD
+        label_method(method)
+        options = {"method": method, "key": key}
+    else:
+        label_request(method=mode)
+        options = {"position": position, "opacity": opacity, "size": int(size) if mode == "visible" and size is not None else size}
+    options = {key: value for key, value in options.items() if value is not None}
+    logo_image = await resolve_logo(logo, logo_id) if mode == "logo" else None
+
+    return StreamingResponse(
+        stream_batch_zip(pool, files, mode, text, logo_image, options, output),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=watermarked.zip"}
+    )
 
 @app.get("/watermark-methods")
 async def get_watermark_methods():
@@ -113,10 +324,12 @@ async def get_watermark_methods():
                 "recommended_for": "Immagini che potrebbero essere compresse"
             },
             "dft": {
-                "name": "Discrete Fourier Transform", 
-                "description": "Robusto contro rotazioni e trasformazioni geometriche",
+                "name": "Discrete Fourier Transform",
+                "description": "Robusto contro rotazioni, ridimensionamenti, ritagli moderati e JPEG; "
+                               f"al massimo {dft_max_message_bytes()} byte in UTF-8 con la parità configurata, "
+                               "immagini di almeno 512x512",
                 "strength": "Alta",
-                "speed": "Media",
+                "speed": "Veloce",
                 "recommended_for": "Immagini che potrebbero essere ruotate/trasformate"
             },
             "dwt": {
@@ -129,14 +342,35 @@ async def get_watermark_methods():
             },
             "robust": {
                 "name": "Metodo Combinato",
-                "description": "Usa DCT + DFT + DWT insieme per massima robustezza",
+                "description": "Usa DCT + DWT insieme con una sola decodifica e codifica; in estrazione vale "
+                               "il primo dei due con lunghezza e checksum corretti",
                 "strength": "Massima",
-                "speed": "Lenta",
+                "speed": "Media",
                 "recommended_for": "Contenuti altamente sensibili"
             }
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Metriche in formato testo Prometheus: richieste, durate per fase, payload, megapixel e coda"""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+def check_dependencies() -> dict:
+    """Disponibilità delle librerie opzionali, verificata una volta all'avvio"""
+    dependencies = {}
+    for name, module in {"numpy": "numpy", "opencv": "cv2", "scipy": "scipy", "PyWavelets": "pywt"}.items():
+        try:
+            importlib.import_module(module)
+            dependencies[name] = "OK"
+        except ImportError:
+            dependencies[name] = "MISSING"
+    if dependencies["PyWavelets"] == "MISSING":
+        dependencies["PyWavelets"] = "MISSING - DWT method not available"
+    return dependencies
+
+DEPENDENCIES = check_dependencies()
+
 @app.get("/health")
 async def health_check():
     """
@@ -144,40 +378,13 @@ async def health_check():
     """
     status = {
         "server": "OK",
-        "dependencies": {}
+        "workers": pool.stats(),
+        # Con executor "process" la somma delle cache dei worker
+        "cache": pool.cache_stats(),
+        "logos": logo_store.stats(),
+        "dependencies": DEPENDENCIES
     }
     
-    
-    try:
-        import numpy
-        status["dependencies"]["numpy"] = "OK"
-    except ImportError:
-        status["dependencies"]["numpy"] = "MISSING"
-    
-    try:
-        import cv2
-        status["dependencies"]["opencv"] = "OK"
-    except ImportError:
-        status["dependencies"]["opencv"] = "MISSING"
-    
-    try:
-        import scipy
-        status["dependencies"]["scipy"] = "OK"
-    except ImportError:
-        status["dependencies"]["scipy"] = "MISSING"
-    
-    try:
-        import pywt
-        status["dependencies"]["PyWavelets"] = "OK"
-    except ImportError:
-        status["dependencies"]["PyWavelets"] = "MISSING - DWT method not available"
-    
-    try:
-        from stegano import lsb
-        status["dependencies"]["stegano"] = "OK"
-    except ImportError:
-        status["dependencies"]["stegano"] = "MISSING - LSB method not available"
-    
     return status
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+"""
+Metriche del server in formato testo Prometheus (GET /metrics)
+
+Contatori e istogrammi sono tenuti nel processo del server: i worker del
+process pool restituiscono i tempi delle fasi insieme al risultato (timed) e
+vengono registrati qui. Con più processi uvicorn ognuno espone i propri valori.
+"""
+import bisect
+import math
+import threading
+import time
+from contextvars import ContextVar
+
+
+# Limiti dei bucket (secondi) per durate di richieste e fasi
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_labels: ContextVar = ContextVar('watermark_request_labels', default=None)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def header(self) -> list:
+        # Nel formato testo 0.0.4 HELP e TYPE usano il nome del campione, con _total
+        return [f'# HELP {self.name}_total {self.documentation}', f'# TYPE {self.name}_total {self.kind}']
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in values]
+
+
+class Gauge(_Metric):
+    """Valore letto al momento dello scrape da una funzione senza argomenti"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def collect(self) -> list:
+        return [f'{self.name} {_format_value(self.read())}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def collect(self) -> list:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        names = self.labelnames + ('le',)
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric: _Metric) -> _Metric:
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUESTS = register(Counter(
+    'watermark_requests', 'Richieste HTTP completate', ('endpoint', 'method', 'status')))
+REQUEST_DURATION = register(Histogram(
+    'watermark_request_duration_seconds', 'Durata delle richieste, invio della risposta compreso',
+    ('endpoint', 'method')))
+STAGE_DURATION = register(Histogram(
+    'watermark_stage_duration_seconds',
+    'Durata delle fasi misurate nei worker (decode_*, transform, embed, inverse_transform, encode, ...)',
+    ('endpoint', 'method', 'stage')))
+PAYLOAD_BITS = register(Histogram(
+    'watermark_payload_bits', 'Bit scritti nell\'immagine dai watermark invisibili, header compreso',
+    ('method',), buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)))
+IMAGE_MEGAPIXELS = register(Histogram(
+    'watermark_upload_megapixels', 'Dimensione delle immagini caricate, letta dall\'header',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 12, 16, 24, 40, 64, 100)))
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.header())
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def label_request(**labels):
+    """Etichette della richiesta in corso (es. method), lette da MetricsMiddleware alla fine"""
+    current = _request_labels.get()
+    if current is not None:
+        current.update({name: value for name, value in labels.items() if value is not None})
+
+
+def observe_timings(timings: dict):
+    """Registra i tempi restituiti da timed sotto endpoint e metodo della richiesta in corso"""
+    labels = _request_labels.get() or {}
+    endpoint, method = labels.get('endpoint', ''), labels.get('method', '')
+    for name, value in timings.items():
+        STAGE_DURATION.observe(value / 1000, endpoint=endpoint, method=method, stage=name.removesuffix('_ms'))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: conteggio e durata di ogni richiesta per endpoint, metodo e stato
+
+    endpoint è il percorso della route (es. /logos/{logo_id}), così le
+    etichette restano poche; le richieste senza route sono "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = {'endpoint': _known_path(scope), 'method': ''}
+        token = _request_labels.set(labels)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_labels.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or labels['endpoint']
+            REQUESTS.inc(endpoint=endpoint, method=labels['method'], status=status)
+            REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, method=labels['method'])
+
+
+def _known_path(scope) -> str:
+    # Le risposte date prima del routing (es. 413 di RequestSizeLimit) tengono il percorso se è una route fissa
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        if getattr(route, "path", None) == scope["path"]:
+            return scope["path"]
+    return "unmatched"
@@ -0,0 +1,39 @@
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# I test importano i moduli del backend come fa main.py (watermark.*, workers, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def gradient_pixels(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Gradiente orizzontale con rumore, riproducibile: ha dettaglio a tutte le frequenze come una foto"""
+    rng = np.random.default_rng(seed)
+    pixels = np.linspace(40, 200, width)[None, :, None] + rng.normal(0, 20, (height, width, 3))
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def make_png():
+    """make_png(height, width, **params): PNG in bytes di gradient_pixels; params vanno a Image.save"""
+    def make(height: int, width: int, seed: int = 0, **params) -> bytes:
+        buffer = BytesIO()
+        Image.fromarray(gradient_pixels(height, width, seed)).save(buffer, format='PNG', **params)
+        return buffer.getvalue()
+    return make
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """TestClient dell'API con un pool di thread: i test non avviano processi"""
+    import main
+    from fastapi.testclient import TestClient
+    from workers import WorkerPool
+
+    monkeypatch.setattr(main, 'pool', WorkerPool(kind='thread', size=2))
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,37 @@
+import json
+import zipfile
+from io import BytesIO
+
+from watermark.invisible import extract_invisible_watermark_advanced
+
+
+def test_batch_zip_with_a_bad_file(client, make_png):
+    files = [
+        ('files', ('primo.png', make_png(160, 192), 'image/png')),
+        ('files', ('rotto.png', b'non un\'immagine', 'image/png')),
+        ('files', ('terzo.png', make_png(160, 192, seed=1), 'image/png')),
+    ]
+    # Senza method si usa il default di apply_invisible_watermark_advanced
+    response = client.post('/batch-watermark', files=files, data={'mode': 'invisible', 'text': 'Lotto 7'})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/zip'
+    archive = zipfile.ZipFile(BytesIO(response.content))
+    manifest = json.loads(archive.read('manifest.json'))
+
+    assert [entry['index'] for entry in manifest] == [0, 1, 2]
+    assert [entry['success'] for entry in manifest] == [True, False, True]
+    assert manifest[1]['filename'] == 'rotto.png' and manifest[1]['error']
+    assert sorted(archive.namelist()) == ['00000_primo.png', '00002_terzo.png', 'manifest.json']
+    for entry in (manifest[0], manifest[2]):
+        assert extract_invisible_watermark_advanced(archive.read(entry['output']), 'dct') == 'Lotto 7'
+
+    metrics = client.get('/metrics').text
+    assert 'watermark_payload_bits_count{method="dct"}' in metrics
+    assert 'watermark_payload_bits_count{method=""}' not in metrics
+
+
+def test_batch_rejects_unknown_mode(client, make_png):
+    response = client.post('/batch-watermark', files=[('files', ('a.png', make_png(32, 32), 'image/png'))],
+                           data={'mode': 'sfocato'})
+    assert response.status_code == 400
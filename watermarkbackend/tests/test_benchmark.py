@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import benchmark
+
+
+def test_small_run_writes_a_comparable_baseline(tmp_path):
+    output = tmp_path / "baseline.json"
+    benchmark.main(["--sizes", "0.05", "--payloads", "8", "--cases", "dct_apply", "dct_extract", "dft_apply",
+                    "--repeat", "1", "--ecc-mb", "0.01", "--output", str(output)])
+
+    baseline = json.loads(output.read_text())
+    keys = [benchmark.case_key(result) for result in baseline["results"]]
+    # dft_apply salta: 0.05 MP è sotto il tile DFT
+    assert keys == ["dct_apply@0.05MP/8", "dct_extract@0.05MP/8", "ecc_encode@0.01MB", "ecc_decode@0.01MB"]
+    assert all(result["median_ms"] > 0 for result in baseline["results"])
+    assert benchmark.compare(baseline["results"], baseline, tolerance=0.0) == []
+
+
+def test_compare_reports_only_slowdowns_beyond_tolerance():
+    baseline = {"results": [
+        {"case": "dct_apply", "megapixels": 2, "payload": 8, "median_ms": 100.0},
+        {"case": "dwt_apply", "megapixels": 2, "payload": 8, "median_ms": 100.0},
+    ]}
+    current = [
+        {"case": "dct_apply", "megapixels": 2, "payload": 8, "median_ms": 124.0},
+        {"case": "dwt_apply", "megapixels": 2, "payload": 8, "median_ms": 130.0},
+        {"case": "lsb_apply", "megapixels": 2, "payload": 8, "median_ms": 999.0},
+    ]
+
+    [regression] = benchmark.compare(current, baseline, tolerance=0.25)
+    assert regression["case"] == "dwt_apply@2MP/8"
+    assert regression["ratio"] == pytest.approx(1.3)
+
+
+def test_dft_cases_follow_the_method_limits():
+    assert not benchmark.runnable("dft_apply", 0.25, 8)
+    assert benchmark.runnable("dft_apply", 2, 8)
+    assert not benchmark.runnable("dft_extract", 2, 64)
+    assert benchmark.runnable("dct_apply", 0.25, 120)
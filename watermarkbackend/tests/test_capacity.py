@@ -0,0 +1,33 @@
+import pytest
+
+from watermark.invisible import AdvancedWatermarking, apply_invisible_watermark_advanced
+
+LONG_TEXT = "Messaggio decisamente troppo lungo per un'immagine così piccola " * 3
+
+
+@pytest.mark.parametrize('method', ['dct', 'dwt', 'robust'])
+def test_message_that_does_not_fit_raises(method, make_png):
+    with pytest.raises(ValueError, match='troppo lungo'):
+        apply_invisible_watermark_advanced(make_png(96, 128), LONG_TEXT, method)
+
+
+@pytest.mark.parametrize('method', ['dct', 'dwt', 'robust'])
+def test_tiled_path_raises_too(method, make_png):
+    watermarker = AdvancedWatermarking()
+    with pytest.raises(ValueError, match='troppo lungo'):
+        getattr(watermarker, f'apply_{method}_watermark_tiled')(make_png(96, 128), LONG_TEXT, 32)
+
+
+@pytest.mark.parametrize('method', ['dct', 'dwt'])
+def test_keyed_message_that_does_not_fit_raises(method, make_png):
+    with pytest.raises(ValueError, match='troppo lungo'):
+        apply_invisible_watermark_advanced(make_png(96, 128), LONG_TEXT, method, key='segreto')
+
+
+def test_endpoint_answers_400_instead_of_the_original_image(client, make_png):
+    response = client.post('/apply-invisible-watermark',
+                           files={'file': ('piccola.png', make_png(96, 128), 'image/png')},
+                           data={'hidden_text': LONG_TEXT, 'method': 'dct', 'output_format': 'webp'})
+
+    assert response.status_code == 400
+    assert 'troppo lungo' in response.json()['detail']
@@ -0,0 +1,29 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from watermark.decoding import _truncate_rows, load_rows, open_image
+
+
+def _png(height=120, width=90, **params):
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG', **params)
+    return pixels, buffer.getvalue()
+
+
+def test_png_decode_stops_at_requested_rows():
+    # Se cambiano image.tile o image._size di Pillow questo test deve fallire, non solo rallentare
+    pixels, image_bytes = _png()
+    image = open_image(image_bytes)
+    assert _truncate_rows(image, 40)
+    image.load()
+    assert image.size == (90, 40)
+    np.testing.assert_array_equal(np.asarray(image), pixels[:40])
+
+
+def test_load_rows_matches_full_decode():
+    pixels, image_bytes = _png()
+    np.testing.assert_array_equal(load_rows(image_bytes, open_image(image_bytes), 33), pixels[:33])
+    np.testing.assert_array_equal(load_rows(image_bytes, open_image(image_bytes)), pixels)
@@ -0,0 +1,14 @@
+import pytest
+
+from watermark.invisible import apply_invisible_watermark_advanced, extract_invisible_watermark_advanced
+
+
+@pytest.mark.parametrize('height, width', [(300, 400), (511, 700), (700, 511)])
+def test_rejects_images_smaller_than_a_tile(height, width, make_png):
+    with pytest.raises(ValueError, match='troppo piccola'):
+        apply_invisible_watermark_advanced(make_png(height, width), 'Short text', 'dft')
+
+
+def test_round_trip_at_minimum_size(make_png):
+    watermarked = apply_invisible_watermark_advanced(make_png(512, 512), 'Short text', 'dft')
+    assert extract_invisible_watermark_advanced(watermarked, 'dft') == 'Short text'
@@ -0,0 +1,90 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import gradient_pixels
+from watermark.encoder import OutputFormat, encode_image
+from watermark.invisible import apply_invisible_watermark_advanced, extract_invisible_watermark_advanced
+
+MAGIC = {'png': b'\x89PNG', 'webp': b'RIFF', 'jpeg': b'\xff\xd8\xff'}
+
+
+@pytest.mark.parametrize('params', [
+    {'format': 'gif'},
+    {'compress_level': 10},
+    {'compress_level': -1},
+    {'format': 'jpeg', 'quality': 0},
+    {'format': 'jpeg', 'quality': 101},
+])
+def test_invalid_params_are_rejected(params):
+    with pytest.raises(ValueError):
+        OutputFormat.from_params(**params)
+
+
+@pytest.mark.parametrize('name, media_type, extension', [
+    ('png', 'image/png', 'png'),
+    ('WEBP', 'image/webp', 'webp'),
+    ('jpg', 'image/jpeg', 'jpg'),
+    ('jpeg', 'image/jpeg', 'jpg'),
+])
+def test_media_type_and_extension(name, media_type, extension):
+    output = OutputFormat.from_params(name)
+    assert (output.media_type, output.extension) == (media_type, extension)
+    assert output.lossy == (media_type == 'image/jpeg')
+
+
+def test_png_and_webp_are_lossless():
+    pixels = gradient_pixels(60, 80)
+    for output in (OutputFormat.from_params('png', compress_level=0), OutputFormat.from_params('webp')):
+        encoded = encode_image(Image.fromarray(pixels), output)
+        assert encoded.startswith(MAGIC[output.format])
+        np.testing.assert_array_equal(np.asarray(Image.open(BytesIO(encoded))), pixels)
+
+
+def test_compress_level_and_quality_change_the_size():
+    image = Image.fromarray(gradient_pixels(120, 160))
+    assert len(encode_image(image, OutputFormat.from_params('png', compress_level=0))) > \
+        len(encode_image(image, OutputFormat.from_params('png', compress_level=9)))
+    assert len(encode_image(image, OutputFormat.from_params('jpeg', quality=95))) > \
+        len(encode_image(image, OutputFormat.from_params('jpeg', quality=30)))
+
+
+def test_jpeg_drops_alpha():
+    image = Image.fromarray(gradient_pixels(40, 40)).convert('RGBA')
+    encoded = encode_image(image, OutputFormat.from_params('jpeg'))
+    assert Image.open(BytesIO(encoded)).mode == 'RGB'
+
+
+@pytest.mark.parametrize('method, output_format', [
+    ('dct', 'jpeg'), ('dct', 'webp'), ('dwt', 'webp'), ('robust', 'jpeg'), ('lsb', 'webp'),
+])
+def test_extraction_after_output_format(method, output_format, make_png):
+    output = OutputFormat.from_params(output_format)
+    watermarked = apply_invisible_watermark_advanced(make_png(320, 256), 'Formato', method, output)
+
+    assert watermarked.startswith(MAGIC[output.format])
+    assert extract_invisible_watermark_advanced(watermarked, method) == 'Formato'
+
+
+@pytest.mark.parametrize('output_format', sorted(MAGIC))
+def test_endpoint_media_type_matches_body(output_format, client, make_png):
+    response = client.post('/apply-visible-watermark',
+                           files={'file': ('foto.png', make_png(64, 96), 'image/png')},
+                           data={'text': 'Prova', 'output_format': output_format})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == OutputFormat.from_params(output_format).media_type
+    assert response.content.startswith(MAGIC[output_format])
+
+
+@pytest.mark.parametrize('data', [
+    {'output_format': 'gif', 'method': 'dct'},
+    {'output_format': 'jpeg', 'method': 'lsb'},
+])
+def test_endpoint_rejects_unusable_formats(data, client, make_png):
+    response = client.post('/apply-invisible-watermark',
+                           files={'file': ('foto.png', make_png(160, 192), 'image/png')},
+                           data={'hidden_text': 'Prova', **data})
+    assert response.status_code == 400
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from watermark.invisible import apply_invisible_watermark_advanced, extract_invisible_watermark_advanced
+from watermark.keyed import key_positions
+
+
+def test_positions_are_pinned():
+    # Se cambiano, le immagini già marcate con questa chiave diventano illeggibili
+    assert key_positions('segreto', (40, 50), 8).tolist() == [938, 106, 1131, 783, 195, 1022, 371, 1663]
+
+
+def test_positions_are_distinct_and_in_range():
+    positions = key_positions('segreto', (3, 200, 300), 2000)
+    assert len(np.unique(positions)) == 2000
+    assert positions.min() >= 0 and positions.max() < 3 * 200 * 300
+    assert sorted(key_positions('segreto', (7,), 100).tolist()) == list(range(7))
+
+
+@pytest.mark.parametrize('method', ['dct', 'dwt'])
+def test_keyed_round_trip(method, make_png):
+    watermarked = apply_invisible_watermark_advanced(make_png(256, 320), 'Chiave ok', method, key='segreto')
+    assert extract_invisible_watermark_advanced(watermarked, method, key='segreto') == 'Chiave ok'
+    assert extract_invisible_watermark_advanced(watermarked, method, key='altra') != 'Chiave ok'
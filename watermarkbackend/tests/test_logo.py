@@ -0,0 +1,81 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import gradient_pixels
+from watermark import logo as logo_module
+from watermark.logo import apply_logo_watermark
+from watermark.logo_store import LogoStore
+
+
+def reference_logo_watermark(image_bytes, logo_bytes, position, opacity, size):
+    """apply_logo_watermark prima della cache: logo decodificato e scalato a ogni chiamata, base RGBA"""
+    img = Image.open(BytesIO(image_bytes)).convert("RGBA")
+    logo = Image.open(BytesIO(logo_bytes)).convert("RGBA")
+    logo_width = int(img.width * size)
+    logo_height = int(logo.height * (logo_width / logo.width))
+    logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
+    if opacity < 1.0:
+        logo.putalpha(logo.split()[-1].point(lambda p: int(p * opacity)))
+
+    margin = 20
+    positions = {
+        "top-left": (margin, margin),
+        "top-right": (img.width - logo_width - margin, margin),
+        "bottom-left": (margin, img.height - logo_height - margin),
+        "bottom-right": (img.width - logo_width - margin, img.height - logo_height - margin),
+        "center": ((img.width - logo_width) // 2, (img.height - logo_height) // 2),
+    }
+    img.paste(logo, positions.get(position, positions["bottom-right"]), logo)
+    return np.asarray(img.convert("RGB"))
+
+
+def _png(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _logo(kind):
+    pixels = gradient_pixels(48, 64, seed=3)
+    if kind == "rgba":
+        logo = Image.fromarray(pixels).convert("RGBA")
+        logo.putalpha(Image.linear_gradient("L").resize(logo.size))
+        return _png(logo)
+    if kind == "palette":
+        return _png(Image.fromarray(pixels).convert("P", palette=Image.Palette.ADAPTIVE))
+    return _png(Image.fromarray(pixels))
+
+
+def _base(mode):
+    image = Image.fromarray(gradient_pixels(150, 200))
+    if mode == "RGBA":
+        image = image.convert("RGBA")
+        image.putalpha(128)
+    return _png(image)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    # Gli ID si risolvono sullo store del modulo logo
+    store = LogoStore(16 * 1024 * 1024)
+    monkeypatch.setattr(logo_module, "logo_store", store)
+    return store
+
+
+@pytest.mark.parametrize("base_mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("kind", ["rgba", "rgb", "palette"])
+@pytest.mark.parametrize("position", ["top-left", "top-right", "bottom-left", "bottom-right", "center", "altrove"])
+@pytest.mark.parametrize("opacity", [0.3, 1.0])
+@pytest.mark.parametrize("size", [0.1, 0.37])
+def test_cached_logo_matches_reference(base_mode, kind, position, opacity, size, store):
+    image_bytes, logo_bytes = _base(base_mode), _logo(kind)
+    expected = reference_logo_watermark(image_bytes, logo_bytes, position, opacity, size)
+    registered = store.register(logo_bytes)
+
+    # File, RegisteredLogo e ID condividono la versione scalata in cache
+    for logo in (logo_bytes, logo_bytes, registered, registered.logo_id):
+        result = apply_logo_watermark(image_bytes, logo, position, opacity, size)
+        np.testing.assert_array_equal(np.asarray(Image.open(BytesIO(result))), expected)
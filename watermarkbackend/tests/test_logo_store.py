@@ -0,0 +1,95 @@
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from conftest import gradient_pixels
+from watermark.logo_store import LogoStore
+
+
+def _logo(seed, size=(32, 32)):
+    buffer = BytesIO()
+    Image.fromarray(gradient_pixels(size[1], size[0], seed)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+LOGO_BYTES = 32 * 32 * 4
+
+
+def test_same_file_same_id():
+    store = LogoStore(1024 * 1024)
+    first, second = store.register(_logo(0)), store.register(_logo(0))
+    assert first.logo_id == second.logo_id
+    assert (first.width, first.height) == (32, 32)
+    assert store.get(first.logo_id).pixels.shape == (32, 32, 4)
+
+
+def test_least_recently_used_logo_is_evicted():
+    store = LogoStore(2 * LOGO_BYTES)
+    first, second = store.register(_logo(0)), store.register(_logo(1))
+    store.get(first.logo_id)
+    third = store.register(_logo(2))
+
+    store.get(first.logo_id)
+    store.get(third.logo_id)
+    with pytest.raises(KeyError):
+        store.get(second.logo_id)
+    assert store.stats()["memory"]["evictions"] == 1
+
+
+def test_logo_over_the_limit_is_rejected():
+    store = LogoStore(LOGO_BYTES - 1)
+    with pytest.raises(ValueError, match="troppo grande"):
+        store.register(_logo(0))
+
+
+def test_unreadable_logo_is_rejected():
+    with pytest.raises(ValueError, match="non valido"):
+        LogoStore(LOGO_BYTES).register(b"non un logo")
+
+
+@pytest.mark.parametrize("logo_id", ["", "abc", "../" + "0" * 61, "A" * 64, "0" * 63 + "g"])
+def test_invalid_ids_are_refused(logo_id, tmp_path):
+    store = LogoStore(LOGO_BYTES, str(tmp_path))
+    with pytest.raises(KeyError):
+        store.get(logo_id)
+    assert store.delete(logo_id) is False
+
+
+def test_directory_survives_a_new_store_and_is_bounded(tmp_path):
+    writer = LogoStore(10 * LOGO_BYTES, str(tmp_path))
+    registered = writer.register(_logo(0))
+
+    # Un altro processo (o un riavvio) legge il PNG salvato
+    reader = LogoStore(10 * LOGO_BYTES, str(tmp_path))
+    assert (reader.get(registered.logo_id).pixels == registered.pixels).all()
+
+    for seed in range(1, 40):
+        writer.register(_logo(seed))
+        assert writer.stats()["file_bytes"] <= writer.max_bytes
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    # Il primo logo è il meno usato: file e copia in memoria sono stati rimossi
+    with pytest.raises(KeyError):
+        LogoStore(10 * LOGO_BYTES, str(tmp_path)).get(registered.logo_id)
+
+
+def test_endpoints(client, monkeypatch, make_png):
+    import main
+
+    monkeypatch.setattr(main, "logo_store", LogoStore(1024 * 1024))
+    response = client.post("/logos", files={"logo": ("logo.png", _logo(0), "image/png")})
+    assert response.status_code == 200
+    logo_id = response.json()["logo_id"]
+
+    assert client.get(f"/logos/{logo_id}").json()["width"] == 32
+    assert client.get("/logos/non-esiste").status_code == 404
+    applied = client.post("/apply-logo-watermark", files={"file": ("foto.png", make_png(120, 160), "image/png")},
+                          data={"logo_id": logo_id})
+    assert applied.status_code == 200
+    assert client.post("/apply-logo-watermark", files={"file": ("foto.png", make_png(120, 160), "image/png")},
+                       data={"logo_id": "0" * 64}).status_code == 404
+
+    assert client.delete(f"/logos/{logo_id}").status_code == 200
+    assert client.delete(f"/logos/{logo_id}").status_code == 404
@@ -0,0 +1,45 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from watermark.lsb_engine import hide_lsb, reveal_lsb
+
+
+def _image(height=40, width=50, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def legacy_stegano_hide(img_array, message):
+    """Come stegano.lsb.hide prima della 1.0: numero di caratteri e ord(c) in 8 bit per carattere"""
+    payload = str(len(message)) + ":" + message
+    bits = "".join(bin(ord(char))[2:].rjust(8, "0") for char in payload)
+    bits += "0" * ((3 - len(bits) % 3) % 3)
+    encoded = img_array.copy()
+    flat = encoded.reshape(-1, 3)
+    for index, bit in enumerate(bits):
+        pixel, channel = divmod(index, 3)
+        flat[pixel, channel] = (flat[pixel, channel] & 0xFE) | int(bit)
+    return encoded
+
+
+def test_round_trip_utf8():
+    assert reveal_lsb(hide_lsb(_image(), "Niccolò è qui ✓")) == "Niccolò è qui ✓"
+
+
+def test_reads_legacy_stegano_non_ascii():
+    assert reveal_lsb(legacy_stegano_hide(_image(), "Caffè Università")) == "Caffè Università"
+    assert reveal_lsb(legacy_stegano_hide(_image(), "plain ascii")) == "plain ascii"
+
+
+def test_reads_current_stegano():
+    lsb = pytest.importorskip("stegano.lsb")
+    buffer = BytesIO()
+    Image.fromarray(_image()).save(buffer, format="PNG")
+    secret = lsb.hide(BytesIO(buffer.getvalue()), "Niccolò")
+    assert reveal_lsb(np.asarray(secret)) == "Niccolò"
+
+
+def test_empty_image_has_no_message():
+    assert reveal_lsb(np.zeros((20, 20, 3), dtype=np.uint8)) == ""
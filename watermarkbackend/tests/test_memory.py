@@ -0,0 +1,37 @@
+import tracemalloc
+
+import pytest
+
+from watermark.cache import image_cache
+from watermark.invisible import apply_invisible_watermark_advanced
+
+
+# Picco tracemalloc ammesso per megapixel sul percorso bytes -> bytes (buffer float32 + output uint8 +
+# trasformate). Prima dei buffer riusati era circa 26 MB/MP per DCT e 49 MB/MP per DWT
+PEAK_MB_PER_MEGAPIXEL = {'dct': 18.0, 'dwt': 42.0}
+
+
+@pytest.fixture
+def no_cache():
+    max_bytes = image_cache.max_bytes
+    image_cache.max_bytes = 0
+    yield
+    image_cache.max_bytes = max_bytes
+
+
+@pytest.mark.parametrize('method', sorted(PEAK_MB_PER_MEGAPIXEL))
+def test_peak_allocation_per_megapixel(method, no_cache, make_png):
+    height, width = 1224, 1632
+    image_bytes = make_png(height, width, compress_level=1)
+
+    # La prima richiesta alloca il buffer di output riusato dal thread
+    apply_invisible_watermark_advanced(image_bytes, 'memoria', method)
+    tracemalloc.start()
+    try:
+        apply_invisible_watermark_advanced(image_bytes, 'memoria', method)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    peak_per_megapixel = peak / (1024 * 1024) / (height * width / 1e6)
+    assert peak_per_megapixel <= PEAK_MB_PER_MEGAPIXEL[method]
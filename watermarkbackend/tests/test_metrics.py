@@ -0,0 +1,54 @@
+import pytest
+
+from metrics import Counter, Histogram
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram('prova_seconds', 'Prova', ('method',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, method='dct')
+
+    assert histogram.collect() == [
+        'prova_seconds_bucket{method="dct",le="0.1"} 2',
+        'prova_seconds_bucket{method="dct",le="1"} 3',
+        'prova_seconds_bucket{method="dct",le="+Inf"} 4',
+        'prova_seconds_sum{method="dct"} 3.65',
+        'prova_seconds_count{method="dct"} 4',
+    ]
+
+
+def test_counter_header_and_label_escaping():
+    counter = Counter('prova', 'Prova', ('endpoint',))
+    counter.inc(endpoint='a"b\\c\nd')
+    assert counter.header() == ['# HELP prova_total Prova', '# TYPE prova_total counter']
+    assert counter.collect() == ['prova_total{endpoint="a\\"b\\\\c\\nd"} 1']
+
+
+def test_requests_and_stages_are_labelled(client, make_png):
+    response = client.post('/apply-invisible-watermark',
+                           files={'file': ('foto.png', make_png(160, 192), 'image/png')},
+                           data={'hidden_text': 'Metriche', 'method': 'dwt'})
+    assert response.status_code == 200
+    assert 'embed;dur=' in response.headers['server-timing']
+
+    metrics = client.get('/metrics').text
+    assert 'watermark_requests_total{endpoint="/apply-invisible-watermark",method="dwt",status="200"}' in metrics
+    assert 'watermark_stage_duration_seconds_count{endpoint="/apply-invisible-watermark",method="dwt",' \
+           'stage="embed"}' in metrics
+    assert metrics.startswith('# HELP watermark_requests_total')
+
+
+@pytest.mark.parametrize('path, data', [
+    ('/apply-invisible-watermark', {'hidden_text': 'x', 'method': 'bogus-1'}),
+    ('/extract-invisible-watermark', {'method': 'bogus-2'}),
+    ('/batch-watermark', {'mode': 'invisible', 'method': 'bogus-3'}),
+    ('/batch-watermark', {'mode': 'bogus-4'}),
+])
+def test_unknown_methods_do_not_create_series(path, data, client, make_png):
+    field = 'files' if path == '/batch-watermark' else 'file'
+    response = client.post(path, files={field: ('foto.png', make_png(32, 32), 'image/png')}, data=data)
+    assert response.status_code == 400
+
+    metrics = client.get('/metrics').text
+    assert 'bogus' not in metrics
+    assert f'watermark_requests_total{{endpoint="{path}",method="invalid",status="400"}}' in metrics
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from watermark.invisible import extract_invisible_watermark_details
+from watermark.ecc import ReedSolomon
+from watermark.payload import (HEADER_BITS, decode_payload, encode_payload, legacy_text, read_header,
+                               read_legacy_length, text_bits)
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture:
+        return fixture.read()
+
+
+# Immagini prodotte dal codice originale (header di 32 bit con la lunghezza, ASCII) con il testo 'Archivio 2023'
+@pytest.mark.parametrize('fixture, method, decoded_with', [
+    ('baseline_dct.png', 'dct', 'dct'),
+    ('baseline_dwt.png', 'dwt', 'dwt'),
+    ('baseline_dct.png', 'robust', 'dct'),
+])
+def test_extracts_images_from_the_original_format(fixture, method, decoded_with):
+    assert extract_invisible_watermark_details(_fixture(fixture), method) == ('Archivio 2023', decoded_with)
+
+
+def test_payload_round_trip_with_errors():
+    code = ReedSolomon(parity=8, block=32)
+    bits = encode_payload('Caffè ✓', code)
+    damaged = bits.copy()
+    damaged[HEADER_BITS + 3] ^= 1
+    damaged[HEADER_BITS + 40] ^= 1
+    header = read_header(damaged, len(damaged))
+    assert header is not None and header.message_bytes == len('Caffè ✓'.encode('utf-8'))
+    assert decode_payload(damaged[HEADER_BITS:], header) == 'Caffè ✓'
+
+
+def test_legacy_helpers():
+    message = text_bits('Ciao')
+    length = np.unpackbits(np.frombuffer(len(message).to_bytes(4, 'big'), dtype=np.uint8))
+    bits = np.concatenate([length, message])
+    assert read_legacy_length(bits) == 32
+    assert legacy_text(bits[32:64]) == 'Ciao'
+    assert read_legacy_length(np.ones(32, dtype=np.uint8)) is None
+    assert legacy_text(np.zeros(16, dtype=np.uint8)) is None
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from watermark import invisible
+from watermark.invisible import DEFAULT_ROBUSTNESS_TEXT, AdvancedWatermarking, dft_max_message_bytes, payload_bits
+from watermark.report import cases_from_results
+
+
+def test_default_text_fits_every_method():
+    assert len(DEFAULT_ROBUSTNESS_TEXT.encode('utf-8')) <= dft_max_message_bytes()
+    for method in invisible.ROBUSTNESS_METHODS:
+        assert payload_bits(DEFAULT_ROBUSTNESS_TEXT, method) > 0
+
+
+def test_failed_method_is_reported(monkeypatch, make_png):
+    # Sotto i 512x512 il dft fallisce: deve restare nel report con l'errore
+    monkeypatch.setattr(invisible, 'ROBUSTNESS_METHODS', ['dft'])
+    results = AdvancedWatermarking().run_parallel_robustness_test(make_png(64, 64), max_workers=1, verbose=False)
+
+    assert 'troppo piccola' in results['dft'][DEFAULT_ROBUSTNESS_TEXT]['error']
+    [case] = cases_from_results(results, 'small.png')
+    assert case.method == 'dft' and not case.success
+    assert 'troppo piccola' in case.error
+
+
+def test_cropped_size_is_the_png_size(make_png):
+    # Come prima degli array: byte del ritaglio codificato in PNG, non dei pixel
+    watermarker = AdvancedWatermarking()
+    pixels = np.asarray(Image.open(BytesIO(make_png(120, 160))))
+    result = watermarker.run_attack_case(pixels, 'crop', 'lsb', 'crop', 0.5)
+
+    cropped = Image.fromarray(watermarker.crop_array(pixels, 0.5))
+    buffer = BytesIO()
+    cropped.save(buffer, format='PNG')
+    assert result['cropped_size'] == len(buffer.getvalue()) != cropped.width * cropped.height * 3
@@ -0,0 +1,40 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from watermark.invisible import (AdvancedWatermarking, apply_invisible_watermark_advanced,
+                                 extract_invisible_watermark_details)
+
+TEXT = 'Lotto 7'
+
+
+def test_round_trip_reads_the_dct_copy(make_png):
+    watermarked = apply_invisible_watermark_advanced(make_png(320, 256), TEXT, 'robust')
+
+    assert extract_invisible_watermark_details(watermarked, 'robust') == (TEXT, 'dct')
+
+
+def test_blank_dct_rows_fall_back_to_dwt(make_png):
+    watermarked = apply_invisible_watermark_advanced(make_png(320, 256), TEXT, 'robust')
+    watermarker = AdvancedWatermarking()
+    payload_rows = watermarker._robust_dct_rows(256, 320, watermarker._message_bits(TEXT))
+
+    pixels = np.array(Image.open(BytesIO(watermarked)))
+    pixels[:payload_rows] = 128
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+
+    assert extract_invisible_watermark_details(buffer.getvalue(), 'dct') == ('', None)
+    assert extract_invisible_watermark_details(buffer.getvalue(), 'robust') == (TEXT, 'dwt')
+
+
+def test_dct_rows_overlapping_the_dwt_band_raise(make_png):
+    # Colonne strette: i blocchi DCT scendono fino al terzo centrale, anche se DCT e DWT da soli ci stanno
+    image = make_png(600, 64)
+    for method in ('dct', 'dwt'):
+        apply_invisible_watermark_advanced(image, TEXT, method)
+
+    with pytest.raises(ValueError, match='metodo robust'):
+        apply_invisible_watermark_advanced(image, TEXT, 'robust')
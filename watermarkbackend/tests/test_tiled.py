@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from watermark.encoder import OutputFormat
+from watermark.invisible import AdvancedWatermarking
+from watermark.tiled import DWT_HALO
+
+SIZES = {
+    'dct': [(203, 301), (160, 192)],
+    'dwt': [(203, 301), (160, 192)],
+    'robust': [(403, 301), (320, 256)],
+    'dft': [(531, 517), (512, 640)],
+}
+TILE_ROWS = [DWT_HALO // 2, DWT_HALO + 1, 64, 4096]
+
+
+def _pixels(image_bytes):
+    return np.asarray(Image.open(BytesIO(image_bytes)).convert('RGB'))
+
+
+def _cases():
+    for method, sizes in SIZES.items():
+        for height, width in sizes:
+            for tile_rows in TILE_ROWS:
+                yield method, height, width, tile_rows
+
+
+@pytest.mark.parametrize('method, height, width, tile_rows', list(_cases()))
+def test_tiled_matches_whole_image(method, height, width, tile_rows, make_png):
+    watermarker = AdvancedWatermarking()
+    image_bytes = make_png(height, width)
+
+    whole = getattr(watermarker, f'apply_{method}_watermark')(image_bytes, 'Strisce')
+    tiled = getattr(watermarker, f'apply_{method}_watermark_tiled')(image_bytes, 'Strisce', tile_rows)
+
+    np.testing.assert_array_equal(_pixels(tiled), _pixels(whole))
+
+
+@pytest.mark.parametrize('method', sorted(SIZES))
+def test_tiled_webp_matches_whole_image(method, make_png):
+    watermarker = AdvancedWatermarking()
+    height, width = SIZES[method][0]
+    image_bytes = make_png(height, width)
+    webp = OutputFormat.from_params('webp')
+
+    whole = getattr(watermarker, f'apply_{method}_watermark')(image_bytes, 'Strisce', webp)
+    tiled = getattr(watermarker, f'apply_{method}_watermark_tiled')(image_bytes, 'Strisce', 24, webp)
+
+    np.testing.assert_array_equal(_pixels(tiled), _pixels(whole))
@@ -0,0 +1,92 @@
+import tempfile
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+import uploads
+from uploads import RequestSizeLimit
+
+
+def _post(client, image_bytes, filename="foto.png"):
+    return client.post("/apply-visible-watermark", files={"file": (filename, image_bytes, "image/png")},
+                       data={"text": "Spool"})
+
+
+def test_file_over_the_byte_limit_is_413(client, monkeypatch, make_png):
+    image_bytes = make_png(64, 64)
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", len(image_bytes) - 1)
+    response = _post(client, image_bytes)
+    assert response.status_code == 413
+    assert "File troppo grande" in response.json()["detail"]
+
+
+def test_image_over_the_pixel_limit_is_413(client, monkeypatch, make_png):
+    monkeypatch.setattr(uploads, "MAX_PIXELS", 64 * 64 - 1)
+    response = _post(client, make_png(64, 64))
+    assert response.status_code == 413
+    assert "64x64" in response.json()["detail"]
+
+
+def test_unreadable_file_is_400(client):
+    assert _post(client, b"%PDF-1.4 non un'immagine").status_code == 400
+
+
+def test_spooled_round_trip_leaves_no_temp_files(client, monkeypatch, tmp_path, make_png):
+    image_bytes = make_png(120, 160)
+    expected = _post(client, image_bytes).content
+
+    spooled = []
+    spool = uploads.spool
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(uploads, "SPOOL_BYTES", 1024)
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 4096)
+    monkeypatch.setattr(uploads, "spool", lambda data: spooled.append(1) or spool(data))
+
+    response = _post(client, image_bytes)
+
+    assert response.status_code == 200
+    assert response.content == expected
+    # Upload e risultato sono passati entrambi da file temporanei, poi rimossi
+    assert len(spooled) == 2
+    assert not list(tmp_path.glob("watermark-*.spool"))
+
+
+def test_spooled_upload_is_removed_when_the_watermark_fails(client, monkeypatch, tmp_path, make_png):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(uploads, "SPOOL_BYTES", 1024)
+    response = client.post("/apply-invisible-watermark",
+                           files={"file": ("foto.png", make_png(96, 128), "image/png")},
+                           data={"hidden_text": "x" * 200, "method": "dct"})
+    assert response.status_code == 400
+    assert not list(tmp_path.glob("watermark-*.spool"))
+
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimit, max_bytes=1000)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_request_size_limit(limited_client):
+    assert limited_client.post("/upload", files={"file": ("a.bin", b"x" * 500)}).status_code == 200
+    response = limited_client.post("/upload", files={"file": ("a.bin", b"x" * 2000)})
+    assert response.status_code == 413
+
+
+def test_request_size_limit_without_content_length(limited_client):
+    # Corpo a pezzi senza Content-Length: il limite vale sui byte ricevuti
+    boundary = "confine"
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n'.encode(),
+             *[b"x" * 500] * 4, f"\r\n--{boundary}--\r\n".encode()]
+
+    response = limited_client.post("/upload", content=iter(parts),
+                                   headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
@@ -0,0 +1,120 @@
+import numpy as np
+import pywt
+from scipy.fft import dct, idct
+
+from watermark.dct_engine import DCT_POSITIONS, apply_dct_blocks, read_dct_bits
+from watermark.dwt_engine import embed_dwt_bits, read_dwt_bits
+
+
+# Cicli per-blocco e per-coefficiente della versione originale, usati come riferimento
+
+def reference_dct_embed(img_array, bits, block_size=8, strength=80.0):
+    height, width, _ = img_array.shape
+    for channel in range(3):
+        channel_data = img_array[:, :, channel].copy()
+        bit_index = 0
+        for i in range(0, height, block_size):
+            for j in range(0, width, block_size):
+                if bit_index >= len(bits):
+                    break
+                block = channel_data[i:i + block_size, j:j + block_size]
+                dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
+                for row, col in DCT_POSITIONS:
+                    if bits[bit_index] == 1:
+                        dct_block[row, col] = abs(dct_block[row, col]) + strength
+                    else:
+                        dct_block[row, col] = -(abs(dct_block[row, col]) + strength)
+                channel_data[i:i + block_size, j:j + block_size] = idct(idct(dct_block.T, norm='ortho').T,
+                                                                        norm='ortho')
+                bit_index += 1
+            if bit_index >= len(bits):
+                break
+        img_array[:, :, channel] = np.clip(channel_data, 0, 255)
+
+
+def reference_dct_read(img_array, count, block_size=8):
+    height, width, _ = img_array.shape
+    channel_results = []
+    for channel in range(3):
+        extracted = []
+        for i in range(0, height, block_size):
+            for j in range(0, width, block_size):
+                block = img_array[i:i + block_size, j:j + block_size, channel]
+                dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
+                votes = [1 if dct_block[row, col] > 0 else 0 for row, col in DCT_POSITIONS]
+                extracted.append(1 if sum(votes) > len(votes) // 2 else 0)
+        channel_results.append(extracted[:count])
+    return [1 if sum(votes) >= 2 else 0 for votes in zip(*channel_results)]
+
+
+def reference_dwt_embed(bands, bits, strength=50.0):
+    h, w = bands[0].shape
+    bit_index = 0
+    for coeff_matrix in bands:
+        for i in range(h // 3, 2 * h // 3):
+            for j in range(w // 3, 2 * w // 3):
+                if bit_index >= len(bits):
+                    return bit_index
+                if bits[bit_index] == 1:
+                    coeff_matrix[i, j] = abs(coeff_matrix[i, j]) + strength
+                else:
+                    coeff_matrix[i, j] = -(abs(coeff_matrix[i, j]) + strength)
+                bit_index += 1
+    return bit_index
+
+
+def reference_dwt_read(bands, limit):
+    h, w = bands[0].shape
+    extracted = []
+    for coeff_matrix in bands:
+        for i in range(h // 3, 2 * h // 3):
+            for j in range(w // 3, 2 * w // 3):
+                if len(extracted) >= limit:
+                    return extracted
+                extracted.append(1 if coeff_matrix[i, j] > 0 else 0)
+    return extracted
+
+
+def _image(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (height, width, 3)).astype(np.float32)
+
+
+def _bits(count, seed=1):
+    return np.random.default_rng(seed).integers(0, 2, count).astype(np.uint8)
+
+
+def test_dct_embed_matches_reference_loop():
+    bits = _bits(170)
+    expected = _image(96, 120)
+    actual = expected.copy()
+    reference_dct_embed(expected, bits)
+    apply_dct_blocks(actual, bits, 8, 80.0)
+
+    np.testing.assert_allclose(actual, expected, atol=1e-3)
+    np.testing.assert_array_equal(actual.astype(np.uint8), expected.astype(np.uint8))
+
+
+def test_dct_read_matches_reference_loop():
+    img_array = _image(96, 120)
+    apply_dct_blocks(img_array, _bits(150), 8, 80.0)
+    np.testing.assert_array_equal(read_dct_bits(img_array, 0, 150, 8), reference_dct_read(img_array, 150))
+
+
+def test_dwt_embed_matches_reference_loop():
+    _, bands = pywt.dwt2(_image(150, 200)[:, :, 0], 'db4')
+    bits = _bits(1500)
+    expected = [band.copy() for band in bands]
+    actual = [band.copy() for band in bands]
+
+    assert embed_dwt_bits(actual, bits, 50.0) == reference_dwt_embed(expected, bits)
+    for actual_band, expected_band in zip(actual, expected):
+        np.testing.assert_array_equal(actual_band, expected_band)
+
+
+def test_dwt_read_matches_reference_loop():
+    _, bands = pywt.dwt2(_image(150, 200)[:, :, 0], 'db4')
+    bands = [band.copy() for band in bands]
+    embed_dwt_bits(bands, _bits(1500), 50.0)
+    for limit in (64, 900, 2000):
+        np.testing.assert_array_equal(read_dwt_bits(bands, limit), reference_dwt_read(bands, limit))
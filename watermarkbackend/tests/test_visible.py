@@ -0,0 +1,55 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from conftest import gradient_pixels
+from watermark.visible import FONT_PATH, apply_visible_watermark
+
+
+def reference_visible_watermark(image_bytes, text, position, opacity, size):
+    """apply_visible_watermark prima delle cache: font caricato e testo disegnato a ogni chiamata"""
+    img = Image.open(BytesIO(image_bytes)).convert("RGBA")
+    watermark = Image.new("RGBA", img.size)
+    draw = ImageDraw.Draw(watermark)
+    font = ImageFont.truetype(FONT_PATH, size) if FONT_PATH else ImageFont.load_default()
+
+    bbox = draw.textbbox((0, 0), text, font=font)
+    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    margin = 10
+    positions = {
+        "top-left": (margin, margin),
+        "top-right": (img.width - text_width - margin, margin),
+        "bottom-left": (margin, img.height - text_height - margin),
+        "bottom-right": (img.width - text_width - margin, img.height - text_height - margin),
+        "center": ((img.width - text_width) // 2, (img.height - text_height) // 2),
+    }
+    alpha = max(0, min(255, int(opacity * 255)))
+    draw.text(positions.get(position, (margin, margin)), text, font=font, fill=(255, 255, 255, alpha))
+    return np.asarray(Image.alpha_composite(img, watermark).convert("RGB"))
+
+
+def _encoded(mode, height=90, width=140):
+    image = Image.fromarray(gradient_pixels(height, width))
+    if mode == "RGBA":
+        image = image.convert("RGBA")
+        image.putalpha(Image.linear_gradient("L").resize(image.size))
+    elif mode != "RGB":
+        image = image.convert(mode)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+@pytest.mark.parametrize("position", ["top-left", "top-right", "bottom-left", "bottom-right", "center", "altrove"])
+@pytest.mark.parametrize("opacity", [0.0, 0.5, 1.0])
+@pytest.mark.parametrize("text, size", [("Copyright", 12), ("Àccentì €", 40), ("Testo più largo dell'immagine", 30)])
+def test_cached_rendering_matches_reference(mode, position, opacity, text, size):
+    image_bytes = _encoded(mode)
+    expected = reference_visible_watermark(image_bytes, text, position, opacity, size)
+    # La seconda chiamata usa font e stamp dalla cache
+    for _ in range(2):
+        result = apply_visible_watermark(image_bytes, text, position, opacity, size)
+        np.testing.assert_array_equal(np.asarray(Image.open(BytesIO(result))), expected)
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from watermark.cache import image_cache
+from watermark.invisible import apply_invisible_watermark_advanced
+from workers import WorkerPool
+
+
+def test_timeout_frees_the_stuck_worker():
+    pool = WorkerPool("process", size=1, timeout=1.0)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            await pool.run(time.sleep, 30)
+        assert error.value.status_code == 504
+        # Con un solo worker la richiesta successiva passa solo se il worker bloccato è stato liberato
+        start = time.perf_counter()
+        assert await pool.run(abs, -3) == 3
+        return time.perf_counter() - start
+
+    try:
+        assert asyncio.run(scenario()) < 10
+        assert pool.stats()["pending"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_queue_limit_returns_503():
+    pool = WorkerPool("thread", size=1, max_pending=1, timeout=5.0)
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run(time.sleep, 0.5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as error:
+            await pool.run(abs, -1)
+        await first
+        return error.value.status_code
+
+    try:
+        assert asyncio.run(scenario()) == 503
+    finally:
+        pool.shutdown()
+
+
+def test_cache_stats_come_from_the_workers(monkeypatch, make_png):
+    monkeypatch.setattr(image_cache, "max_bytes", 64 * 1024 * 1024)
+    pool = WorkerPool("process", size=2, timeout=60.0)
+    image_bytes = make_png(160, 192)
+    server_stats = image_cache.stats()
+
+    async def scenario():
+        for _ in range(4):
+            await pool.run(apply_invisible_watermark_advanced, image_bytes, "cache", "dct")
+
+    try:
+        asyncio.run(scenario())
+        stats = pool.cache_stats()
+        # Il budget è diviso tra i worker invece di essere moltiplicato
+        assert stats["max_bytes"] == 64 * 1024 * 1024
+        assert all(worker["max_bytes"] == 32 * 1024 * 1024 for worker in pool._worker_caches.values())
+        assert stats["workers_reporting"] >= 1
+        assert stats["hits"] >= 1 and stats["entries"] >= 1
+        # Nel processo del server la cache non è stata toccata
+        assert image_cache.stats() == server_stats
+    finally:
+        pool.shutdown()
@@ -0,0 +1,219 @@
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+
+from watermark.timing import stage
+from metrics import IMAGE_MEGAPIXELS
+
+
+MB = 1024 * 1024
+
+
+def _env_mb(name: str, default: str) -> int:
+    return int(float(os.environ.get(name, default)) * MB)
+
+
+# Limiti configurabili tramite variabili d'ambiente:
+# - WATERMARK_MAX_UPLOAD_MB: dimensione massima di ogni file caricato (default 50)
+# - WATERMARK_MAX_REQUEST_MB: corpo massimo di una richiesta, batch compresi (default 1024)
+# - WATERMARK_MAX_MEGAPIXELS: pixel massimi dichiarati nell'header dell'immagine (default 100)
+# - WATERMARK_SPOOL_MB: upload e risultati più grandi passano da un file temporaneo (default 8)
+MAX_UPLOAD_BYTES = _env_mb('WATERMARK_MAX_UPLOAD_MB', '50')
+MAX_REQUEST_BYTES = _env_mb('WATERMARK_MAX_REQUEST_MB', '1024')
+MAX_PIXELS = int(float(os.environ.get('WATERMARK_MAX_MEGAPIXELS', '100')) * 1_000_000)
+SPOOL_BYTES = _env_mb('WATERMARK_SPOOL_MB', '8')
+CHUNK_SIZE = 256 * 1024
+
+# Il controllo anti decompression bomb di Pillow usa lo stesso limite, anche
+# nei worker del process pool (che importano questo modulo per run_upload)
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+
+@dataclass(frozen=True)
+class SpooledUpload:
+    """Dati su file temporaneo al posto dei bytes: tra server e worker passa solo il percorso"""
+    path: str
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, 'rb') as spool:
+            return spool.read()
+
+
+def spool(data) -> SpooledUpload:
+    """Scrive bytes o un file aperto in un file temporaneo, a pezzi di CHUNK_SIZE"""
+    handle, path = tempfile.mkstemp(prefix='watermark-', suffix='.spool')
+    try:
+        with os.fdopen(handle, 'wb') as spool_file:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                spool_file.write(data)
+            else:
+                shutil.copyfileobj(data, spool_file, CHUNK_SIZE)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path)
+
+
+def discard(source):
+    """Rimuove il file temporaneo di un SpooledUpload; i bytes non richiedono nulla"""
+    if isinstance(source, SpooledUpload):
+        try:
+            os.remove(source.path)
+        except FileNotFoundError:
+            pass
+
+
+def check_image_header(file) -> tuple:
+    """
+    Dimensioni dichiarate nell'header, senza decodificare i pixel
+
+    Raises:
+        HTTPException 400 se il file non è un'immagine, 413 se supera MAX_PIXELS
+    """
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail=f"Immagine troppo grande: limite {MAX_PIXELS} pixel")
+    except (OSError, SyntaxError, ValueError):
+        raise HTTPException(status_code=400, detail="Il file caricato non è un'immagine leggibile")
+    finally:
+        file.seek(0)
+
+    if width * height > MAX_PIXELS:
+        raise HTTPException(status_code=413,
+                            detail=f"Immagine troppo grande: {width}x{height} pixel, limite {MAX_PIXELS}")
+    return width, height
+
+
+def _upload_size(upload: UploadFile) -> int:
+    if upload.size is not None:
+        return upload.size
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    return size
+
+
+async def read_image(upload: UploadFile, spool_large: bool = True):
+    """
+    Valida un'immagine caricata e la prepara per i worker
+
+    Il parser multipart ha già scritto su disco i file grandi: qui si
+    controllano dimensione in byte e pixel dell'header prima di leggere o
+    decodificare qualsiasi cosa.
+
+    Returns:
+        bytes fino a SPOOL_BYTES (o sempre, con spool_large=False),
+        altrimenti SpooledUpload da rimuovere con discard
+    """
+    size = _upload_size(upload)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"File troppo grande: {size} byte, limite {MAX_UPLOAD_BYTES}")
+    width, height = await run_in_threadpool(check_image_header, upload.file)
+    IMAGE_MEGAPIXELS.observe(width * height / 1e6)
+
+    if size <= SPOOL_BYTES or not spool_large:
+        return await upload.read()
+    return await run_in_threadpool(spool, upload.file)
+
+
+def run_upload(func, source, *args):
+    """
+    Esegue func(bytes dell'immagine, *args) in un worker
+
+    Funzione a livello di modulo per il process pool: un upload su disco è
+    letto dal worker senza passare dalla pipe, e un risultato in bytes oltre
+    SPOOL_BYTES torna al server allo stesso modo.
+    """
+    if isinstance(source, SpooledUpload):
+        with stage('spool_read'):
+            source = source.read_bytes()
+    result = func(source, *args)
+    if isinstance(result, bytes) and len(result) > SPOOL_BYTES:
+        with stage('spool_write'):
+            return spool(result)
+    return result
+
+
+def result_size(result) -> int:
+    return result.size if isinstance(result, SpooledUpload) else len(result)
+
+
+async def stream_result(result):
+    """
+    Il risultato di run_upload a pezzi di CHUNK_SIZE
+
+    L'immagine è già stata codificata per intero dal worker: qui non si
+    trasmette mentre l'encoder lavora, si evita solo di copiare il risultato
+    in un'unica risposta. I bytes sono divisi in fette di memoryview, senza
+    copie; un file temporaneo è letto a pezzi e rimosso alla fine (anche se il
+    client si disconnette prima).
+    """
+    if not isinstance(result, SpooledUpload):
+        view = memoryview(result)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+        return
+
+    try:
+        spool_file = await run_in_threadpool(open, result.path, 'rb')
+        try:
+            while chunk := await run_in_threadpool(spool_file.read, CHUNK_SIZE):
+                yield chunk
+        finally:
+            spool_file.close()
+    finally:
+        discard(result)
+
+
+class RequestSizeLimit:
+    """
+    Middleware ASGI che rifiuta con 413 le richieste oltre max_bytes
+
+    Content-Length viene controllato prima di leggere il corpo; per gli
+    upload senza Content-Length si contano i byte ricevuti, così il parser
+    multipart non scrive mai su disco più del limite.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> str:
+        return f"Richiesta troppo grande: limite {self.max_bytes} byte"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                response = JSONResponse({"detail": self._too_large()}, status_code=413)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=self._too_large())
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+# Oltre questa dimensione i buffer float32 sono file temporanei mappati in memoria
+MEMMAP_THRESHOLD_BYTES = int(float(os.environ.get('WATERMARK_MEMMAP_MB', '512')) * 1024 * 1024)
+
+# Righe decodificate per volta quando si riempie un buffer float32
+DECODE_STRIP_ROWS = 256
+
+_local = threading.local()
+
+
+def scratch_float32(shape: tuple) -> np.ndarray:
+    """Buffer float32 non inizializzato; np.memmap su file temporaneo se supera la soglia"""
+    nbytes = int(np.prod(shape)) * 4
+    if MEMMAP_THRESHOLD_BYTES > 0 and nbytes >= MEMMAP_THRESHOLD_BYTES:
+        # Il file è già rimosso dal filesystem: sparisce quando la mappa viene chiusa
+        with tempfile.TemporaryFile() as backing:
+            return np.memmap(backing, dtype=np.float32, mode='w+', shape=shape)
+    return np.empty(shape, dtype=np.float32)
+
+
+def decode_into_float32(image: Image.Image) -> np.ndarray:
+    """Decodifica un'immagine RGB o RGBA in un buffer float32 RGB a strip, senza un array uint8 intero"""
+    width, height = image.size
+    buffer = scratch_float32((height, width, 3))
+    for top in range(0, height, DECODE_STRIP_ROWS):
+        bottom = min(height, top + DECODE_STRIP_ROWS)
+        buffer[top:bottom] = np.asarray(image.crop((0, top, width, bottom)))[:, :, :3]
+    return buffer
+
+
+def output_uint8(shape: tuple) -> np.ndarray:
+    """
+    Buffer uint8 riusato dalle richieste dello stesso thread
+
+    Valido solo fino alla richiesta successiva: va consumato (codificato)
+    subito e mai restituito al chiamante.
+    """
+    size = int(np.prod(shape))
+    storage = getattr(_local, 'output', None)
+    if storage is None or storage.size < size:
+        storage = np.empty(size, dtype=np.uint8)
+        _local.output = storage
+    return storage[:size].reshape(shape)
+
+
+def clip_to_uint8(values: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Limita a [0, 255] e tronca in out, come np.clip(...).astype(np.uint8)"""
+    if values.dtype != np.float32:
+        values = values.astype(np.float32)
+    np.copyto(out, np.clip(values, 0, 255, out=values if values.flags.writeable else None), casting='unsafe')
+    return out
+
+
+def image_from_uint8(pixels: np.ndarray) -> Image.Image:
+    """Immagine PIL RGB letta direttamente dal buffer, senza copie lato NumPy"""
+    height, width = pixels.shape[:2]
+    return Image.frombuffer('RGB', (width, height), np.ascontiguousarray(pixels), 'raw', 'RGB', 0, 1)
@@ -0,0 +1,156 @@
+import numpy as np
+from scipy.fft import dct, idct
+
+from .payload import majority_vote
+from .timing import stage
+
+
+# Posizioni dei coefficienti a media frequenza usate per ogni bit
+DCT_POSITIONS = [(2, 3), (3, 2), (2, 2), (3, 3), (1, 2), (2, 1)]
+_POS_ROWS = np.array([row for row, _ in DCT_POSITIONS])
+_POS_COLS = np.array([col for _, col in DCT_POSITIONS])
+
+
+def split_blocks(region: np.ndarray, block_size: int) -> np.ndarray:
+    """
+    Converte una regione (H, W, C) in un array di blocchi (C, nblocks, bs, bs)
+
+    I blocchi sono ordinati per righe (raster order), come nel ciclo per-blocco.
+    """
+    height, width, channels = region.shape
+    rows, cols = height // block_size, width // block_size
+    blocks = region.reshape(rows, block_size, cols, block_size, channels)
+    blocks = blocks.transpose(4, 0, 2, 1, 3)
+    return blocks.reshape(channels, rows * cols, block_size, block_size)
+
+
+def merge_blocks(blocks: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """Operazione inversa di split_blocks: (C, nblocks, bs, bs) -> (H, W, C)"""
+    channels, _, block_size, _ = blocks.shape
+    region = blocks.reshape(channels, rows, cols, block_size, block_size)
+    region = region.transpose(1, 3, 2, 4, 0)
+    return region.reshape(rows * block_size, cols * block_size, channels)
+
+
+def forward_dct(blocks: np.ndarray) -> np.ndarray:
+    """DCT 2D ortonormale su tutti i blocchi (prima le righe, poi le colonne)"""
+    return dct(dct(blocks, axis=-2, norm='ortho'), axis=-1, norm='ortho')
+
+
+def inverse_dct(coeffs: np.ndarray) -> np.ndarray:
+    """IDCT 2D ortonormale su tutti i blocchi, stesso ordine di forward_dct"""
+    return idct(idct(coeffs, axis=-2, norm='ortho'), axis=-1, norm='ortho')
+
+
+def embed_bits(coeffs: np.ndarray, bits: np.ndarray, strength: float) -> None:
+    """
+    Imposta segno e ampiezza delle sei posizioni per ogni blocco (in place)
+
+    Args:
+        coeffs: Coefficienti DCT (C, n, bs, bs)
+        bits: Array di n bit (0/1), uno per blocco
+        strength: Ampiezza aggiunta al valore assoluto del coefficiente
+    """
+    selected = coeffs[..., _POS_ROWS, _POS_COLS]
+    magnitude = np.abs(selected) + strength
+    sign = np.where(bits.astype(bool), 1, -1).astype(coeffs.dtype)
+    coeffs[..., _POS_ROWS, _POS_COLS] = magnitude * sign[None, :, None]
+
+
+def apply_dct_blocks(img_array: np.ndarray, bits: np.ndarray, block_size: int, strength: float) -> None:
+    """
+    Inserisce i bit nei primi len(bits) blocchi dell'immagine (in place)
+
+    Vengono trasformati solo i blocchi che portano un bit; le righe di blocchi
+    coinvolte sono riscritte e limitate a [0, 255].
+    """
+    height, width, _ = img_array.shape
+    cols = width // block_size
+    n_bits = len(bits)
+    rows = -(-n_bits // cols)
+
+    region = img_array[:rows * block_size, :cols * block_size, :]
+    blocks = split_blocks(region, block_size)
+
+    with stage('transform'):
+        coeffs = forward_dct(blocks[:, :n_bits])
+    with stage('embed'):
+        embed_bits(coeffs, bits, strength)
+    with stage('inverse_transform'):
+        blocks[:, :n_bits] = inverse_dct(coeffs)
+        region[...] = np.clip(merge_blocks(blocks, rows, cols), 0, 255)
+
+
+def read_dct_bits(img_array: np.ndarray, start: int, count: int, block_size: int) -> np.ndarray:
+    """
+    Legge i bit dai blocchi [start, start + count) in raster order
+
+    Trasforma solo le righe di blocchi che contengono i bit richiesti e applica
+    il voto di maggioranza sulle sei posizioni e poi sui canali.
+
+    Returns:
+        Array uint8 di count bit
+    """
+    cols = img_array.shape[1] // block_size
+    first_row = start // cols
+    last_row = (start + count - 1) // cols + 1
+
+    region = img_array[first_row * block_size:last_row * block_size, :cols * block_size, :]
+    offset = start - first_row * cols
+    blocks = split_blocks(region.astype(np.float32), block_size)[:, offset:offset + count]
+
+    with stage('transform'):
+        coeffs = forward_dct(blocks)
+    positive = coeffs[..., _POS_ROWS, _POS_COLS] > 0
+    return majority_vote(majority_vote(positive, axis=-1), axis=0)
+
+
+def block_grid(img_array: np.ndarray, block_size: int) -> np.ndarray:
+    """Vista (righe, bs, colonne, bs, C) sui blocchi interi dell'immagine, senza copie"""
+    height, width, channels = img_array.shape
+    rows, cols = height // block_size, width // block_size
+    region = img_array[:rows * block_size, :cols * block_size]
+    return region.reshape(rows, block_size, cols, block_size, channels)
+
+
+def gather_blocks(img_array: np.ndarray, positions: np.ndarray, block_size: int) -> np.ndarray:
+    """
+    Blocchi (C, n, bs, bs) nelle posizioni indicate (indici raster), con una sola indicizzazione
+
+    Le posizioni sono indici nella griglia dei blocchi interi dell'immagine.
+    """
+    grid = block_grid(img_array, block_size)
+    block_rows, block_cols = np.divmod(positions, grid.shape[2])
+    return grid[block_rows, :, block_cols].transpose(3, 0, 1, 2)
+
+
+def apply_dct_positions(source: np.ndarray, out: np.ndarray, bits: np.ndarray, positions: np.ndarray,
+                        block_size: int, strength: float) -> None:
+    """
+    Inserisce i bit nei blocchi positions[:len(bits)] di source e li scrive in out
+
+    Solo i blocchi che portano un bit sono raccolti e trasformati; out deve
+    già contenere il resto dell'immagine.
+    """
+    positions = positions[:len(bits)]
+    blocks = gather_blocks(source, positions, block_size).astype(np.float32)
+
+    with stage('transform'):
+        coeffs = forward_dct(blocks)
+    with stage('embed'):
+        embed_bits(coeffs, bits, strength)
+    with stage('inverse_transform'):
+        blocks = np.clip(inverse_dct(coeffs), 0, 255)
+        grid = block_grid(out, block_size)
+        block_rows, block_cols = np.divmod(positions, grid.shape[2])
+        grid[block_rows, :, block_cols] = blocks.transpose(1, 2, 3, 0)
+
+
+def read_dct_positions(img_array: np.ndarray, positions: np.ndarray, block_size: int) -> np.ndarray:
+    """Come read_dct_bits, ma dai blocchi nelle posizioni indicate"""
+    blocks = gather_blocks(img_array, positions, block_size).astype(np.float32)
+
+    with stage('transform'):
+        coeffs = forward_dct(blocks)
+    positive = coeffs[..., _POS_ROWS, _POS_COLS] > 0
+    return majority_vote(majority_vote(positive, axis=-1), axis=0)
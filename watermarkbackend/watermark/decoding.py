@@ -0,0 +1,96 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .timing import stage
+
+
+# Modi già RGB nei primi tre canali: non serve convert('RGB')
+RGB_MODES = ('RGB', 'RGBA')
+
+
+def open_image(image_bytes: bytes) -> Image.Image:
+    """Legge solo l'header: i pixel vengono decodificati da load_rows"""
+    with stage('decode_open'):
+        return Image.open(BytesIO(image_bytes))
+
+
+def reduce_jpeg(image: Image.Image, factor: int) -> bool:
+    """
+    Chiede a libjpeg di decodificare il JPEG a 1/factor della risoluzione
+
+    Con draft() libjpeg usa una IDCT ridotta sui coefficienti a bassa
+    frequenza di ogni blocco 8x8, senza decodificare l'immagine intera.
+
+    Returns:
+        True se la riduzione è stata applicata esattamente di factor
+    """
+    if image.format != 'JPEG' or image.width < factor or image.height < factor:
+        return False
+    width, height = image.size
+    with stage('decode_open'):
+        image.draft('RGB', (width // factor, height // factor))
+    return image.size == (-(-width // factor), -(-height // factor))
+
+
+def _truncate_rows(image: Image.Image, rows: int) -> bool:
+    """
+    Limita la decodifica alle prime rows righe, se il formato lo permette
+
+    Vale per i PNG non interlacciati: zlib decodifica le righe in ordine e il
+    decoder si ferma appena ha riempito l'area richiesta.
+
+    Pillow non ha un'API pubblica per fermare la decodifica: si riscrivono
+    image.tile e image._size, verificati per le versioni ammesse in
+    requirements.txt da tests/test_decoding.py. Se la loro forma cambia si
+    torna alla decodifica completa.
+    """
+    if image.format != 'PNG' or image.info.get('interlace') or len(getattr(image, 'tile', ())) != 1:
+        return False
+    if not isinstance(getattr(image, '_size', None), tuple) or len(image.tile[0]) != 4:
+        return False
+    decoder_name, extents, offset, args = image.tile[0]
+    if decoder_name != 'zip' or tuple(extents) != (0, 0) + image.size:
+        return False
+    image.tile = [(decoder_name, (0, 0, image.width, rows), offset, args)]
+    image._size = (image.width, rows)
+    return True
+
+
+def load_image(image_bytes: bytes, image: Image.Image, rows: int = None) -> Image.Image:
+    """
+    Decodifica i pixel (solo le prime rows righe per i PNG non interlacciati)
+
+    Converte in RGB solo i modi che non hanno già R, G, B nei primi tre canali.
+    """
+    truncated = False
+    with stage('decode_pixels'):
+        try:
+            truncated = rows is not None and rows < image.height and _truncate_rows(image, rows)
+            image.load()
+        except (OSError, SyntaxError):
+            if not truncated:
+                raise
+            # Fallback prudente: decodifica completa da capo
+            image = Image.open(BytesIO(image_bytes))
+            image.load()
+
+    if image.mode not in RGB_MODES:
+        with stage('decode_convert'):
+            image = image.convert('RGB')
+    return image
+
+
+def load_rows(image_bytes: bytes, image: Image.Image, rows: int = None) -> np.ndarray:
+    """
+    Le prime rows righe (tutte se None) come array uint8 (rows, W, 3)
+
+    I formati che non si possono fermare a metà sono decodificati per intero,
+    ma solo le righe richieste vengono copiate nell'array.
+    """
+    image = load_image(image_bytes, image, rows)
+    with stage('decode_array'):
+        if rows is not None and rows < image.height:
+            image = image.crop((0, 0, image.width, rows))
+        return np.asarray(image)[:, :, :3]
@@ -0,0 +1,349 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft, ndimage
+
+from .timing import stage
+
+
+# Periodo (pixel) del pattern ripetuto sull'immagine: lo spettro del pattern sta sulla griglia 1/DFT_TILE
+DFT_TILE = 512
+
+# Lato massimo dei blocchi analizzati in estrazione (altrimenti il lato corto dell'immagine) e numero di blocchi
+DFT_BLOCK = 2048
+DFT_MAX_BLOCKS = 4
+
+# Settori angolari per anello su 180° (lo spettro di un'immagine reale è simmetrico): due per bit
+DFT_CELLS = 64
+DFT_RING_BITS = DFT_CELLS // 2
+
+# Anello di sincronizzazione più DFT_DATA_RINGS anelli di dati, a raggi (cicli/pixel) in progressione geometrica.
+# Con le scale di DFT_SCALE_RANGE il raggio massimo resta sotto Nyquist e i settori del minimo restano distinti
+DFT_DATA_RINGS = 8
+DFT_RING_RADII = 0.1 * (0.22 / 0.1) ** (np.arange(DFT_DATA_RINGS + 1) / DFT_DATA_RINGS)
+
+# Rapporto minimo tra la potenza di una frequenza del pattern e quella dell'immagine allo stesso raggio,
+# più alto di DFT_SYNC_GAIN² per l'anello di sincronizzazione
+DFT_TARGET_SNR = 32
+DFT_SYNC_GAIN = 1.5
+
+# Ampiezza minima di ogni frequenza e valore RMS massimo del pattern, in livelli di grigio
+DFT_MIN_AMPLITUDE = 0.25
+DFT_MAX_STRENGTH = 6.0
+
+# Scale dell'immagine cercate in estrazione, passo della ricerca (in log) e passo della rotazione (in settori)
+DFT_SCALE_RANGE = (0.5, 2.0)
+DFT_SCALE_STEP = 0.01
+DFT_ROTATION_STEP = 0.25
+
+# Bit dell'anello di sincronizzazione: sequenza fissa, bilanciata
+SYNC_BITS = np.random.default_rng(0x5EED).permutation(np.repeat(np.array([0, 1], dtype=np.uint8), DFT_RING_BITS // 2))
+
+# Capacità massima in bit (header compreso)
+DFT_CAPACITY = DFT_DATA_RINGS * DFT_RING_BITS
+
+
+def _cell_bits(bits: np.ndarray) -> np.ndarray:
+    """Bit -> settori accesi: il bit 1 accende il primo settore della coppia, lo 0 il secondo"""
+    cells = np.zeros(DFT_CELLS, dtype=bool)
+    cells[0::2] = bits == 1
+    cells[1::2] = bits == 0
+    return cells
+
+
+def ring_layout(bits: np.ndarray) -> list:
+    """
+    Settori accesi per ogni anello: sincronizzazione e poi i dati
+
+    I bit sono completati con zeri fino a riempire l'ultimo anello usato.
+    """
+    rings = -(-len(bits) // DFT_RING_BITS)
+    padded = np.zeros(rings * DFT_RING_BITS, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    layout = [_cell_bits(SYNC_BITS)]
+    layout.extend(_cell_bits(padded[ring * DFT_RING_BITS:(ring + 1) * DFT_RING_BITS]) for ring in range(rings))
+    return layout
+
+
+def _spectrum_index(radius, theta, size: int) -> tuple:
+    """
+    Indici rfft2 (riga, colonna) della frequenza di raggio radius e angolo theta, per un blocco size x size
+
+    rfft2 tiene solo le frequenze orizzontali >= 0: per le altre si usa il
+    coefficiente opposto, che per un segnale reale ha lo stesso modulo.
+    """
+    rows = np.rint(radius * size * np.sin(theta)).astype(np.int64)
+    cols = np.rint(radius * size * np.cos(theta)).astype(np.int64)
+    flip = cols < 0
+    return np.mod(np.where(flip, -rows, rows), size), np.abs(cols)
+
+
+def _cell_angles(cells) -> np.ndarray:
+    return (np.asarray(cells) + 0.5) * (np.pi / DFT_CELLS)
+
+
+@lru_cache(maxsize=32)
+def _watermark_tile(bits_key: bytes, amplitudes: tuple) -> np.ndarray:
+    bits = np.frombuffer(bits_key, dtype=np.uint8)
+    spectrum = np.zeros((DFT_TILE, DFT_TILE // 2 + 1), dtype=np.complex64)
+    phases = np.exp(2j * np.pi * np.random.default_rng(0xD1F7).random(spectrum.shape)).astype(np.complex64)
+    for ring, cells in enumerate(ring_layout(bits)):
+        rows, cols = _spectrum_index(DFT_RING_RADII[ring], _cell_angles(np.flatnonzero(cells)), DFT_TILE)
+        # Con la normalizzazione di irfft2 un coefficiente A dà una sinusoide di ampiezza 2A/N²
+        spectrum[rows, cols] = phases[rows, cols] * (amplitudes[ring] * DFT_TILE ** 2 / 2)
+
+    tile = fft.irfft2(spectrum, s=(DFT_TILE, DFT_TILE)).astype(np.float32)
+    tile.flags.writeable = False
+    return tile
+
+
+def watermark_tile(bits: np.ndarray, amplitudes: tuple) -> np.ndarray:
+    """
+    Pattern DFT_TILE x DFT_TILE di luminanza da ripetere sull'immagine
+
+    Lo spettro del pattern è fatto di una sola frequenza al centro di ogni
+    settore acceso, con fase pseudo-casuale fissa e ampiezza (in livelli di
+    grigio) presa da amplitudes, un valore per anello. Viene calcolato con
+    una irfft2 e tenuto in cache: richieste con lo stesso testo e ampiezze
+    simili riusano lo stesso pattern.
+    """
+    return _watermark_tile(np.ascontiguousarray(bits, dtype=np.uint8).tobytes(), tuple(amplitudes))
+
+
+def add_pattern_rows(rows: np.ndarray, tile: np.ndarray, top: int) -> np.ndarray:
+    """Righe RGB (n, W, 3) + pattern ripetuto, a partire dalla riga top dell'immagine; float32"""
+    height, width = rows.shape[:2]
+    row_index = np.arange(top, top + height) % DFT_TILE
+    col_index = np.arange(width) % DFT_TILE
+    pattern = tile[row_index[:, None], col_index[None, :]]
+    return rows.astype(np.float32) + pattern[:, :, None]
+
+
+def _block_size(height: int, width: int) -> int:
+    # Multiplo di 64: lunghezze con fattori piccoli, veloci per la FFT
+    side = min(height, width, DFT_BLOCK)
+    return side // 64 * 64 or side
+
+
+def _block_origins(height: int, width: int, size: int) -> list:
+    """Angoli dei blocchi, distribuiti su tutta l'immagine (al massimo DFT_MAX_BLOCKS)"""
+    per_side = int(np.sqrt(DFT_MAX_BLOCKS))
+    # Blocchi sovrapposti se il lato non è un multiplo di size: tutta l'immagine contribuisce alla media
+    rows = min(-(-height // size), per_side)
+    cols = min(-(-width // size), per_side)
+    tops = np.linspace(0, max(height - size, 0), rows).astype(int)
+    lefts = np.linspace(0, max(width - size, 0), cols).astype(int)
+    return [(top, left) for top in tops for left in lefts]
+
+
+@lru_cache(maxsize=4)
+def _hann(size: int) -> np.ndarray:
+    window = np.outer(np.hanning(size), np.hanning(size)).astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=4)
+def _radius_bins(size: int) -> tuple:
+    """Raggio intero di ogni coefficiente rfft2 e numero di coefficienti per raggio"""
+    radius = np.rint(np.hypot(fft.fftfreq(size, 1 / size)[:, None], np.arange(size // 2 + 1)[None, :])).astype(np.int64)
+    counts = np.bincount(radius.ravel())
+    radius.flags.writeable = False
+    return radius, counts
+
+
+def central_box(width: int, height: int) -> tuple:
+    """Riquadro (left, top, right, bottom) del blocco quadrato centrale, quello che ring_amplitudes misura"""
+    size = _block_size(height, width)
+    left, top = (width - size) // 2, (height - size) // 2
+    return left, top, left + size, top + size
+
+
+def central_block(pixels: np.ndarray) -> np.ndarray:
+    left, top, right, bottom = central_box(pixels.shape[1], pixels.shape[0])
+    return pixels[top:bottom, left:right]
+
+
+def _block_power(pixels: np.ndarray) -> np.ndarray:
+    """
+    Spettro di potenza medio di blocchi quadrati della luminanza
+
+    I blocchi (con la finestra di Hann) sono scritti in un unico buffer e
+    trasformati insieme da una sola rfft2 reale, che può riusare il buffer.
+    """
+    height, width = pixels.shape[:2]
+    size = _block_size(height, width)
+    origins = _block_origins(height, width, size)
+    window = _hann(size)
+    luma = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    with stage('decode_array'):
+        blocks = np.empty((len(origins), size, size), dtype=np.float32)
+        for block, (top, left) in zip(blocks, origins):
+            np.matmul(pixels[top:top + size, left:left + size, :3], luma, out=block, casting='unsafe')
+            block -= block.mean()
+            block *= window
+
+    with stage('transform'):
+        spectra = fft.rfft2(blocks, workers=-1, overwrite_x=True)
+    return np.mean(spectra.real ** 2 + spectra.imag ** 2, axis=0)
+
+
+def _radial_power(power: np.ndarray) -> np.ndarray:
+    """Potenza tipica per raggio intero (in coefficienti), con i picchi isolati limitati"""
+    radius, counts = _radius_bins(power.shape[0])
+    flat_radius = radius.ravel()
+    mean_power = np.bincount(flat_radius, power.ravel()) / np.maximum(counts, 1)
+    # Seconda media con i picchi limitati, perché quelli del pattern non alzino la soglia del proprio anello
+    clipped = np.minimum(power, 4 * mean_power[radius])
+    return np.bincount(flat_radius, clipped.ravel()) / np.maximum(counts, 1)
+
+
+def ring_amplitudes(pixels: np.ndarray, bit_count: int) -> tuple:
+    """
+    Ampiezza delle frequenze di ogni anello, scelta in base all'immagine
+
+    Ogni frequenza del pattern deve superare di DFT_TARGET_SNR volte la
+    potenza dell'immagine allo stesso raggio, misurata sul blocco centrale
+    con il lato usato in estrazione (basta passare quel blocco, es. ritagliato
+    con central_box). Con un blocco di lato N e la finestra di Hann una
+    sinusoide di ampiezza a dà un picco di potenza a² N⁴ / 64. Il pattern
+    intero resta tra DFT_MIN_AMPLITUDE per frequenza e DFT_MAX_STRENGTH di
+    valore RMS.
+    """
+    rings = 1 + -(-bit_count // DFT_RING_BITS)
+    power = _block_power(central_block(pixels))
+    size = power.shape[0]
+    radial = _radial_power(power)
+    targets = np.full(rings, float(DFT_TARGET_SNR))
+    targets[0] *= DFT_SYNC_GAIN ** 2
+    image_power = radial[np.minimum(np.rint(DFT_RING_RADII[:rings] * size).astype(int), len(radial) - 1)]
+    amplitudes = np.maximum(8 * np.sqrt(targets * image_power) / size ** 2, DFT_MIN_AMPLITUDE)
+    strength = np.sqrt(np.sum(amplitudes ** 2) * DFT_RING_BITS / 2)
+    if strength > DFT_MAX_STRENGTH:
+        amplitudes *= DFT_MAX_STRENGTH / strength
+    # Arrotondate: immagini simili condividono il pattern in cache
+    return tuple(float(amplitude) for amplitude in np.round(amplitudes, 2))
+
+
+def analysis_spectrum(pixels: np.ndarray) -> np.ndarray:
+    """
+    Spettro di potenza medio dei blocchi dell'immagine, normalizzato per raggio
+
+    Il pattern è periodico, quindi le sue frequenze sono le stesse in ogni
+    blocco e la media ne conserva i picchi mentre le fluttuazioni
+    dell'immagine si compensano. Ogni coefficiente è diviso per la potenza
+    tipica al suo raggio e poi sostituito dal massimo dei vicini 3x3: le
+    frequenze del pattern non cadono esattamente sulla griglia dopo una
+    rotazione o un ridimensionamento.
+
+    Returns:
+        Matrice size x (size // 2 + 1) nello stesso formato di rfft2
+    """
+    power = _block_power(pixels)
+    radius, _ = _radius_bins(power.shape[0])
+    whitened = power / np.maximum(_radial_power(power)[radius], 1e-12)
+    return ndimage.maximum_filter(whitened, size=3, mode='wrap')
+
+
+def _sample(spectrum: np.ndarray, radius, theta) -> np.ndarray:
+    rows, cols = _spectrum_index(radius, theta, spectrum.shape[0])
+    cols = np.minimum(cols, spectrum.shape[1] - 1)
+    return np.log1p(spectrum[rows, cols])
+
+
+def _sync_template() -> np.ndarray:
+    signs = np.where(SYNC_BITS == 1, 1.0, -1.0)
+    template = np.empty(DFT_CELLS)
+    template[0::2] = signs
+    template[1::2] = -signs
+    return template / DFT_CELLS
+
+
+_SYNC_TEMPLATE = _sync_template()
+
+
+def _sync_scores(spectrum: np.ndarray, factors: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    """Correlazione (fattori x rotazioni) tra anello di sincronizzazione atteso e spettro"""
+    radius = (DFT_RING_RADII[0] * factors)[:, None, None]
+    theta = _cell_angles(np.arange(DFT_CELLS))[None, None, :] + rotations[None, :, None]
+    values = _sample(spectrum, radius, theta)
+    values -= values.mean(axis=2, keepdims=True)
+    return values @ _SYNC_TEMPLATE
+
+
+def _alignment_scores(spectrum: np.ndarray, factors: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    """Per ogni (fattore, rotazione) la media, su tutti gli anelli, del settore più forte di ogni coppia"""
+    radius = (DFT_RING_RADII[None, :] * factors[:, None])[:, None, :, None]
+    theta = _cell_angles(np.arange(DFT_CELLS))[None, None, None, :] + rotations[None, :, None, None]
+    values = _sample(spectrum, radius, theta)
+    return np.maximum(values[..., 0::2], values[..., 1::2]).mean(axis=(2, 3))
+
+
+def _refine(score, spectrum: np.ndarray, factor: float, rotation: float, factor_step: float, rotation_step: float,
+            steps: int) -> tuple:
+    factors = factor * np.exp(np.arange(-steps, steps + 1) * factor_step)
+    rotations = rotation + np.arange(-steps, steps + 1) * rotation_step
+    scores = score(spectrum, factors, rotations)
+    i, j = np.unravel_index(np.argmax(scores), scores.shape)
+    return float(factors[i]), float(rotations[j] % np.pi), float(scores[i, j])
+
+
+def sync_candidates(spectrum: np.ndarray, count: int = 3) -> list:
+    """
+    Coppie (scala, rotazione) che meglio allineano l'anello di sincronizzazione
+
+    Ricerca su una griglia di scale e rotazioni, raffinata attorno ai
+    migliori punti con passi quattro volte più fini. L'anello di
+    sincronizzazione è il più piccolo e da solo fissa la rotazione con poca
+    precisione: l'ultimo passo, ancora più fine, usa i settori più forti di
+    tutti gli anelli.
+
+    Returns:
+        Fino a count tuple (fattore sui raggi, rotazione in radianti, correlazione), dalla migliore
+    """
+    size = spectrum.shape[0]
+    low = np.log(1 / DFT_SCALE_RANGE[1])
+    high = min(np.log(1 / DFT_SCALE_RANGE[0]), np.log(0.5 / DFT_RING_RADII[0]))
+    factors = np.exp(np.arange(low, high + DFT_SCALE_STEP, DFT_SCALE_STEP))
+    rotation_step = DFT_ROTATION_STEP * np.pi / DFT_CELLS
+    rotations = np.arange(0, np.pi, rotation_step)
+    # Sotto questo raggio (in coefficienti) i settori non sono più distinguibili
+    factors = factors[DFT_RING_RADII[0] * factors * size * np.pi / DFT_CELLS >= 1.5]
+    if len(factors) == 0:
+        return []
+
+    # A gruppi di fattori: gli indici campionati restano piccoli in memoria
+    scores = np.concatenate([_sync_scores(spectrum, factors[first:first + 16], rotations)
+                             for first in range(0, len(factors), 16)])
+    best = np.argsort(scores, axis=None)[::-1]
+    candidates = []
+    for index in best:
+        factor_index, rotation_index = np.unravel_index(index, scores.shape)
+        if any(abs(factor_index - f) <= 2 and min(abs(rotation_index - r), len(rotations) - abs(rotation_index - r)) <= 2
+               for f, r in candidates):
+            continue
+        candidates.append((factor_index, rotation_index))
+        if len(candidates) == count:
+            break
+
+    results = []
+    for factor_index, rotation_index in candidates:
+        factor, rotation, correlation = _refine(_sync_scores, spectrum, factors[factor_index], rotations[rotation_index],
+                                                DFT_SCALE_STEP / 4, rotation_step / 4, 4)
+        factor, rotation, _ = _refine(_alignment_scores, spectrum, factor, rotation,
+                                      DFT_SCALE_STEP / 16, rotation_step / 16, 8)
+        results.append((factor, rotation, correlation))
+    results.sort(key=lambda result: -result[2])
+    return results
+
+
+def read_dft_bits(spectrum: np.ndarray, candidate: tuple, count: int) -> np.ndarray:
+    """I primi count bit, leggendo gli anelli di dati con la scala e la rotazione del candidato"""
+    factor, rotation = candidate[:2]
+    rings = min(-(-count // DFT_RING_BITS), DFT_DATA_RINGS)
+    radius = (DFT_RING_RADII[1:rings + 1] * factor)[:, None]
+    theta = _cell_angles(np.arange(DFT_CELLS))[None, :] + rotation
+    values = _sample(spectrum, radius, theta)
+    bits = (values[:, 0::2] > values[:, 1::2]).astype(np.uint8).ravel()
+    return bits[:count]
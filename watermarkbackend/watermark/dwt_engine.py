@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def middle_region(coeff_matrix: np.ndarray) -> np.ndarray:
+    """Vista sul terzo centrale di una sottobanda di dettaglio"""
+    h, w = coeff_matrix.shape
+    return coeff_matrix[h // 3:2 * h // 3, w // 3:2 * w // 3]
+
+
+def dwt_capacity(band_shape: tuple) -> int:
+    """Bit che embed_dwt_bits può scrivere nelle tre sottobande di forma band_shape"""
+    h, w = band_shape
+    return 3 * (2 * h // 3 - h // 3) * (2 * w // 3 - w // 3)
+
+
+# Coefficienti di bordo esclusi dalle posizioni della chiave: con db4 quelli
+# esterni dipendono dall'estensione simmetrica e non sopravvivono a idwt2 + dwt2
+KEYED_MARGIN = 4
+
+
+def keyed_region(coeff_matrix: np.ndarray) -> np.ndarray:
+    """Vista su una sottobanda senza i KEYED_MARGIN coefficienti di ogni bordo"""
+    h, w = coeff_matrix.shape
+    return coeff_matrix[KEYED_MARGIN:max(KEYED_MARGIN, h - KEYED_MARGIN), KEYED_MARGIN:max(KEYED_MARGIN, w - KEYED_MARGIN)]
+
+
+def embed_dwt_bits(bands: list, bits: np.ndarray, strength: float) -> int:
+    """
+    Scrive i bit nel segno dei coefficienti centrali delle sottobande (in place)
+
+    I bit sono distribuiti nell'ordine delle bande (cH, cV, cD) e, dentro ogni
+    banda, per righe. I bit in eccesso rispetto alla capacità sono ignorati.
+
+    Returns:
+        Numero di bit effettivamente inseriti
+    """
+    bit_index = 0
+    for coeff_matrix in bands:
+        if bit_index >= len(bits):
+            break
+        region = middle_region(coeff_matrix)
+        count = min(region.size, len(bits) - bit_index)
+        chunk = bits[bit_index:bit_index + count].astype(bool)
+
+        magnitude = np.abs(region.flat[:count]) + strength
+        region.flat[:count] = np.where(chunk, magnitude, -magnitude)
+        bit_index += count
+    return bit_index
+
+
+def read_dwt_bits(bands: list, limit: int) -> np.ndarray:
+    """Legge fino a limit bit dal segno dei coefficienti, nello stesso ordine di embed_dwt_bits"""
+    return read_dwt_window(bands, limit, bands[0].shape, 0)
+
+
+def window_rows(band_shape: tuple, limit: int) -> tuple:
+    """Righe [prima, ultima) delle sottobande che contengono i primi limit bit"""
+    h, w = band_shape
+    start_h, end_h = h // 3, 2 * h // 3
+    region_w = 2 * w // 3 - w // 3
+    if region_w <= 0 or limit > (end_h - start_h) * region_w:
+        return start_h, end_h
+    return start_h, start_h + -(-limit // region_w)
+
+
+def read_dwt_window(bands: list, limit: int, band_shape: tuple, row_offset: int) -> np.ndarray:
+    """
+    Come read_dwt_bits, ma su una finestra di righe delle sottobande
+
+    band_shape è la forma delle sottobande dell'immagine intera e row_offset
+    la riga globale della prima riga locale; la finestra deve contenere le
+    righe indicate da window_rows.
+    """
+    h, w = band_shape
+    start_h, end_h = h // 3, 2 * h // 3
+    start_w, end_w = w // 3, 2 * w // 3
+    region_size = (end_h - start_h) * (end_w - start_w)
+
+    chunks = []
+    remaining = limit
+    for coeff_matrix in bands:
+        if remaining <= 0:
+            break
+        region = coeff_matrix[start_h - row_offset:end_h - row_offset, start_w:end_w]
+        count = min(region_size, remaining)
+        chunks.append(region.flat[:count] > 0)
+        remaining -= count
+    if not chunks:
+        return np.zeros(0, dtype=np.uint8)
+    return np.concatenate(chunks).astype(np.uint8)
+
+
+def _band_indices(bands: list, positions: np.ndarray) -> tuple:
+    """(banda, riga, colonna) di ogni posizione piatta nelle sottobande (cH, cV, cD) impilate"""
+    return np.unravel_index(positions, (len(bands),) + bands[0].shape)
+
+
+def embed_dwt_positions(bands: list, bits: np.ndarray, positions: np.ndarray, strength: float) -> int:
+    """
+    Come embed_dwt_bits, ma il bit i va nel coefficiente positions[i] delle sottobande impilate
+
+    Returns:
+        Numero di bit effettivamente inseriti
+    """
+    count = min(len(bits), len(positions))
+    band, rows, cols = _band_indices(bands, positions[:count])
+    chunk = bits[:count].astype(bool)
+    for index, coeff_matrix in enumerate(bands):
+        selected = band == index
+        magnitude = np.abs(coeff_matrix[rows[selected], cols[selected]]) + strength
+        coeff_matrix[rows[selected], cols[selected]] = np.where(chunk[selected], magnitude, -magnitude)
+    return count
+
+
+def read_dwt_positions(bands: list, positions: np.ndarray) -> np.ndarray:
+    """Bit dal segno dei coefficienti nelle posizioni indicate, nello stesso ordine di embed_dwt_positions"""
+    band, rows, cols = _band_indices(bands, positions)
+    bits = np.zeros(len(positions), dtype=np.uint8)
+    for index, coeff_matrix in enumerate(bands):
+        selected = band == index
+        bits[selected] = coeff_matrix[rows[selected], cols[selected]] > 0
+    return bits
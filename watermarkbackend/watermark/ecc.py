@@ -0,0 +1,280 @@
+import numpy as np
+
+
+# GF(256) con il polinomio primitivo x^8 + x^4 + x^3 + x^2 + 1 e generatore 2
+_PRIMITIVE = 0x11d
+_EXP = np.zeros(512, dtype=np.int32)
+_LOG = np.zeros(256, dtype=np.int32)
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= _PRIMITIVE
+_EXP[255:510] = _EXP[:255]
+
+# Tabella completa dei prodotti: le operazioni vettoriali diventano un'indicizzazione (_MUL[a, b])
+_MUL = np.zeros((256, 256), dtype=np.uint8)
+_MUL[1:, 1:] = _EXP[_LOG[1:, None] + _LOG[None, 1:]]
+
+# Le stesse tabelle come liste: più veloci per i calcoli scalari della correzione
+_EXP_LIST = _EXP.tolist()
+_LOG_LIST = _LOG.tolist()
+
+
+def _mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP_LIST[_LOG_LIST[a] + _LOG_LIST[b]]
+
+
+def _pow(a: int, power: int) -> int:
+    return _EXP_LIST[(_LOG_LIST[a] * power) % 255]
+
+
+def _inverse(a: int) -> int:
+    return _EXP_LIST[255 - _LOG_LIST[a]]
+
+
+def _poly_scale(poly: list, factor: int) -> list:
+    return [_mul(coef, factor) for coef in poly]
+
+
+def _poly_add(p: list, q: list) -> list:
+    result = [0] * max(len(p), len(q))
+    for i, coef in enumerate(p):
+        result[i + len(result) - len(p)] = coef
+    for i, coef in enumerate(q):
+        result[i + len(result) - len(q)] ^= coef
+    return result
+
+
+def _poly_mul(p: list, q: list) -> list:
+    result = [0] * (len(p) + len(q) - 1)
+    for j, q_coef in enumerate(q):
+        for i, p_coef in enumerate(p):
+            result[i + j] ^= _mul(p_coef, q_coef)
+    return result
+
+
+def _poly_eval(poly: list, x: int) -> int:
+    value = poly[0]
+    for coef in poly[1:]:
+        value = _mul(value, x) ^ coef
+    return value
+
+
+def _poly_div(dividend: list, divisor: list) -> tuple:
+    """Divisione sintetica per un divisore monico: (quoziente, resto)"""
+    out = list(dividend)
+    for i in range(len(dividend) - len(divisor) + 1):
+        coef = out[i]
+        if coef != 0:
+            for j in range(1, len(divisor)):
+                out[i + j] ^= _mul(divisor[j], coef)
+    separator = len(out) - (len(divisor) - 1)
+    return out[:separator], out[separator:]
+
+
+def _generator(parity: int) -> list:
+    poly = [1]
+    for i in range(parity):
+        poly = _poly_mul(poly, [1, _pow(2, i)])
+    return poly
+
+
+def _syndromes(codewords: np.ndarray, parity: int) -> np.ndarray:
+    """
+    Sindromi (n_codeword, parity) di tutte le codeword in una volta
+
+    La sindrome i è la somma dei byte per le potenze (alpha^i)^grado: una
+    sola indicizzazione di _MUL e una riduzione XOR lungo la codeword.
+    """
+    degrees = np.arange(codewords.shape[1] - 1, -1, -1)
+    powers = _EXP[(np.arange(parity)[None, :] * degrees[:, None]) % 255].astype(np.uint8)
+    return np.bitwise_xor.reduce(_MUL[codewords[:, :, None], powers[None, :, :]], axis=1)
+
+
+def _error_locator(syndromes: list, parity: int):
+    """Berlekamp-Massey sulle sindromi precedute da uno zero; None se gli errori sono troppi"""
+    locator, old_locator = [1], [1]
+    for i in range(parity):
+        delta = syndromes[i + 1]
+        for j in range(1, len(locator)):
+            delta ^= _mul(locator[-(j + 1)], syndromes[i + 1 - j])
+        old_locator = old_locator + [0]
+        if delta != 0:
+            if len(old_locator) > len(locator):
+                new_locator = _poly_scale(old_locator, delta)
+                old_locator = _poly_scale(locator, _inverse(delta))
+                locator = new_locator
+            locator = _poly_add(locator, _poly_scale(old_locator, delta))
+    while locator and locator[0] == 0:
+        locator.pop(0)
+    if (len(locator) - 1) * 2 > parity:
+        return None
+    return locator
+
+
+def _error_positions(locator: list, length: int):
+    """Ricerca di Chien vettorizzata: posizioni (dall'inizio della codeword) degli errori"""
+    reversed_locator = locator[::-1]
+    x = _EXP[np.arange(length)]
+    value = np.full(length, reversed_locator[0], dtype=np.uint8)
+    for coef in reversed_locator[1:]:
+        value = _MUL[value, x] ^ coef
+    positions = length - 1 - np.flatnonzero(value == 0)
+    if len(positions) != len(locator) - 1:
+        return None
+    return [int(position) for position in positions]
+
+
+def _correct(codeword: list, syndromes: list, positions: list) -> list:
+    """Algoritmo di Forney: corregge in codeword gli errori nelle posizioni indicate"""
+    coef_positions = [len(codeword) - 1 - position for position in positions]
+    locator = [1]
+    for position in coef_positions:
+        locator = _poly_mul(locator, _poly_add([1], [_pow(2, position), 0]))
+
+    _, evaluator = _poly_div(_poly_mul(syndromes[::-1], locator), [1] + [0] * len(locator))
+    evaluator = evaluator[::-1]
+
+    roots = [_pow(2, position) for position in coef_positions]
+    corrected = list(codeword)
+    for i, root in enumerate(roots):
+        root_inverse = _inverse(root)
+        derivative = 1
+        for j, other in enumerate(roots):
+            if j != i:
+                derivative = _mul(derivative, 1 ^ _mul(root_inverse, other))
+        if derivative == 0:
+            return None
+        magnitude = _mul(root, _poly_eval(evaluator[::-1], root_inverse))
+        corrected[positions[i]] ^= _mul(magnitude, _inverse(derivative))
+    return corrected
+
+
+class NoCode:
+    """Nessuna correzione: i byte passano così come sono"""
+    parity = 0
+    block = 0
+    interleave = False
+
+    def encoded_size(self, length: int) -> int:
+        return length
+
+    def encode(self, data: bytes) -> bytes:
+        return data
+
+    def decode(self, data: bytes, length: int):
+        return data[:length]
+
+
+class ReedSolomon:
+    """
+    Codice Reed-Solomon su GF(256) a blocchi
+
+    Ogni blocco di al massimo block byte riceve parity byte di parità e
+    corregge fino a parity // 2 byte sbagliati. Con interleave i byte delle
+    codeword sono alternati (prima il primo byte di ogni codeword, poi il
+    secondo...), così una raffica di errori si divide tra più blocchi.
+    """
+
+    def __init__(self, parity: int = 8, block: int = 32, interleave: bool = True):
+        if not 0 < parity < 255 or not 0 < block <= 255 - parity:
+            raise ValueError(f"Parametri Reed-Solomon non validi: parity={parity}, block={block}")
+        self.parity = parity
+        self.block = block
+        self.interleave = interleave
+        # Contributo di ogni valore di feedback ai byte di parità nella divisione per il generatore
+        self._feedback = _MUL[:, _generator(parity)[1:]]
+
+    def _block_sizes(self, length: int) -> np.ndarray:
+        blocks = max(1, -(-length // self.block))
+        return np.minimum(self.block, length - np.arange(blocks) * self.block)
+
+    def encoded_size(self, length: int) -> int:
+        return length + len(self._block_sizes(length)) * self.parity
+
+    def _layout(self, sizes: np.ndarray) -> np.ndarray:
+        """
+        Maschera (blocchi, block + parity) dei byte presenti
+
+        I blocchi corti sono allineati a destra: gli zeri iniziali non cambiano
+        né la parità né le sindromi.
+        """
+        return np.arange(self.block + self.parity)[None, :] >= (self.block - sizes)[:, None]
+
+    def _order(self, layout: np.ndarray) -> np.ndarray:
+        """Posizione nel flusso interleaved di ogni byte delle codeword concatenate"""
+        codeword, offset = np.nonzero(layout)
+        offset = offset - (layout.shape[1] - layout.sum(axis=1))[codeword]
+        # np.nonzero procede per codeword: l'ordinamento stabile per offset basta
+        return np.argsort(offset, kind='stable')
+
+    def encode(self, data: bytes) -> bytes:
+        """Blocchi sistematici (dati seguiti dalla parità), tutti calcolati insieme"""
+        layout = self._layout(self._block_sizes(len(data)))
+        codewords = np.zeros(layout.shape, dtype=np.uint8)
+        codewords[:, :self.block][layout[:, :self.block]] = np.frombuffer(data, dtype=np.uint8)
+
+        remainder = np.zeros((len(codewords), self.parity), dtype=np.uint8)
+        for column in codewords[:, :self.block].T:
+            feedback = column ^ remainder[:, 0]
+            remainder[:, :-1] = remainder[:, 1:]
+            remainder[:, -1] = 0
+            remainder ^= self._feedback[feedback]
+        codewords[:, self.block:] = remainder
+
+        stream = codewords[layout]
+        if self.interleave:
+            stream = stream[self._order(layout)]
+        return stream.tobytes()
+
+    def decode(self, data: bytes, length: int):
+        """
+        I length byte di dati corretti, None se un blocco ha troppi errori
+
+        data deve contenere almeno encoded_size(length) byte.
+        """
+        sizes = self._block_sizes(length)
+        layout = self._layout(sizes)
+        stream = np.frombuffer(data[:self.encoded_size(length)], dtype=np.uint8)
+        if len(stream) < self.encoded_size(length):
+            return None
+        if self.interleave:
+            deinterleaved = np.empty_like(stream)
+            deinterleaved[self._order(layout)] = stream
+            stream = deinterleaved
+
+        codewords = np.zeros(layout.shape, dtype=np.uint8)
+        codewords[layout] = stream
+
+        syndromes = _syndromes(codewords, self.parity)
+        damaged = np.flatnonzero(syndromes.any(axis=1))
+        for i in damaged:
+            codeword_syndromes = [0] + [int(value) for value in syndromes[i]]
+            locator = _error_locator(codeword_syndromes, self.parity)
+            if locator is None:
+                return None
+            start = layout.shape[1] - int(sizes[i]) - self.parity
+            positions = _error_positions(locator, layout.shape[1] - start)
+            if positions is None:
+                return None
+            corrected = _correct([int(value) for value in codewords[i, start:]], codeword_syndromes, positions)
+            if corrected is None:
+                return None
+            codewords[i, start:] = corrected
+        # Una correzione sbagliata (troppi errori) lascia sindromi non nulle
+        if len(damaged) and _syndromes(codewords[damaged], self.parity).any():
+            return None
+
+        return codewords[:, :self.block][layout[:, :self.block]].tobytes()
+
+
+def make_code(parity: int, block: int, interleave: bool = True):
+    """ReedSolomon con i parametri indicati, NoCode se parity è 0"""
+    if parity == 0:
+        return NoCode()
+    return ReedSolomon(parity, block, interleave)
@@ -0,0 +1,87 @@
+import os
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image
+
+from .timing import stage
+
+
+# format -> (formato Pillow, media type, estensione)
+OUTPUT_FORMATS = {
+    'png': ('PNG', 'image/png', 'png'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+DEFAULT_PNG_COMPRESS_LEVEL = int(os.environ.get('WATERMARK_PNG_COMPRESS_LEVEL', '6'))
+DEFAULT_JPEG_QUALITY = int(os.environ.get('WATERMARK_JPEG_QUALITY', '90'))
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """
+    Formato dell'immagine restituita dagli endpoint
+
+    - png: lossless, compress_level 0-9 (optimize forza il livello massimo)
+    - webp: sempre lossless; method 0 (veloce) di default, 6 con optimize
+    - jpeg: con perdita, quality 1-100; solo per watermark che la sopportano
+    """
+    format: str = 'png'
+    compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL
+    optimize: bool = False
+    quality: int = DEFAULT_JPEG_QUALITY
+
+    def __post_init__(self):
+        if self.format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato di output non supportato: {self.format}")
+        if not 0 <= self.compress_level <= 9:
+            raise ValueError(f"compress_level deve essere tra 0 e 9: {self.compress_level}")
+        if not 1 <= self.quality <= 100:
+            raise ValueError(f"quality deve essere tra 1 e 100: {self.quality}")
+
+    @classmethod
+    def from_params(cls, format: str = None, compress_level: int = None, optimize: bool = None,
+                    quality: int = None) -> 'OutputFormat':
+        """Costruisce il formato dai parametri di una richiesta; i valori assenti usano i default"""
+        params = {'format': (format or 'png').lower(), 'compress_level': compress_level,
+                  'optimize': optimize, 'quality': quality}
+        if params['format'] == 'jpg':
+            params['format'] = 'jpeg'
+        return cls(**{key: value for key, value in params.items() if value is not None})
+
+    @property
+    def media_type(self) -> str:
+        return OUTPUT_FORMATS[self.format][1]
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.format][2]
+
+    @property
+    def lossy(self) -> bool:
+        return self.format == 'jpeg'
+
+    def save_options(self) -> dict:
+        if self.format == 'png':
+            return {'compress_level': self.compress_level, 'optimize': self.optimize}
+        if self.format == 'webp':
+            # exact conserva l'RGB dei pixel trasparenti (serve all'LSB su RGBA)
+            return {'lossless': True, 'exact': True, 'method': 6 if self.optimize else 0}
+        return {'quality': self.quality, 'optimize': self.optimize}
+
+
+PNG_OUTPUT = OutputFormat()
+
+
+def encode_image(image: Image.Image, output: OutputFormat = None) -> bytes:
+    """Codifica un'immagine PIL nel formato richiesto (PNG di default)"""
+    output = output or PNG_OUTPUT
+    if output.format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    buffer = BytesIO()
+    with stage('encode'):
+        image.save(buffer, format=OUTPUT_FORMATS[output.format][0], **output.save_options())
+    return buffer.getvalue()
+
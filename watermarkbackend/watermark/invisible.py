@@ -1,354 +1,782 @@
-from stegano import lsb
 from PIL import Image, ImageEnhance
 from io import BytesIO
 import numpy as np
-from scipy.fft import dct, idct
 import pywt
+from .dct_engine import apply_dct_blocks, apply_dct_positions, read_dct_bits, read_dct_positions
+from .dft_engine import (DFT_CAPACITY, DFT_TILE, add_pattern_rows, analysis_spectrum, central_box,
+                         read_dft_bits, ring_amplitudes, sync_candidates, watermark_tile)
+from .dwt_engine import (dwt_capacity, embed_dwt_bits, embed_dwt_positions, keyed_region, read_dwt_bits,
+                         read_dwt_positions, read_dwt_window, window_rows)
+from .lsb_engine import hide_lsb, reveal_lsb, _payload_bits as lsb_payload_bits
+from .tiled import (DWT_HALO, PngStreamWriter, ArrayRowsWriter, DctRowsWriter, apply_dct_tiled, apply_dft_tiled,
+                    apply_dwt_tiled)
+from .buffers import decode_into_float32, output_uint8, clip_to_uint8, image_from_uint8
+from .cache import image_cache, content_key
+from .encoder import OutputFormat, PNG_OUTPUT, encode_image
+from .decoding import open_image, reduce_jpeg, load_image, load_rows
+from .ecc import make_code
+from .keyed import key_positions, read_spread_payload, spread_payload
+from .payload import (HEADER_BITS, LEGACY_LENGTH_BITS, bits_text, decode_payload, encode_payload, legacy_text,
+                      majority_vote, max_message_bytes, read_header, read_legacy_length, repeat_bits, text_bits)
+from .timing import record_stage, stage, timed
 import hashlib
+import logging
 import struct
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+
+
+# Messaggi di debug disattivati di default: WATERMARK_LOG_LEVEL=DEBUG per vederli
+logger = logging.getLogger(__name__)
+
+ROBUSTNESS_METHODS = ['dct', 'dft', 'dwt', 'lsb']
+
+# Metodi accettati da apply/extract_invisible_watermark_advanced
+INVISIBLE_METHODS = ('lsb', 'dct', 'dft', 'dwt', 'robust')
+
+# Metodo usato da apply_invisible_watermark_advanced quando non è indicato
+DEFAULT_INVISIBLE_METHOD = 'dct'
+
+# Testo di default dei test di robustezza: deve entrare anche nella capacità del dft
+DEFAULT_ROBUSTNESS_TEXT = "Test watermarking"
+
+# Lunghezza massima (in bit) di header, messaggio, CRC e parità accettata dagli estrattori
+MAX_PAYLOAD_BITS = 2000
+
+# Bit letti dall'estrattore DWT: il payload più lungo
+DWT_READ_BITS = MAX_PAYLOAD_BITS
+
+# Metodi che possono restituire l'immagine in JPEG: i watermark DCT e DFT sono pensati per sopravvivere
+# (robust si legge anche solo dalla parte DCT)
+LOSSY_OUTPUT_METHODS = ('dct', 'dft', 'robust')
+
+# Metodi che accettano una chiave segreta: i bit vanno in blocchi/coefficienti scelti dalla chiave
+KEYED_METHODS = ('dct', 'dwt')
+
+# Parametri di ogni attacco, nell'ordine usato dal report
+ROBUSTNESS_ATTACKS = {
+    'jpeg': [95, 90, 85, 80],
+    'crop': [0.95, 0.9, 0.85, 0.8, 0.75, 0.7, 0.65, 0.6, 0.55, 0.5],
+    'brightness': [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 2.0],
+    'contrast': [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 2.0],
+    'rotation': [-10, -5, -3, -1, 0, 1, 3, 5, 10, 15, 20, 30, 45, 90],
+    'scaling': [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5],
+}
+
+
+def _string_bits(binary: str) -> np.ndarray:
+    """Stringa di '0'/'1' come array di bit uint8"""
+    return (np.frombuffer(binary.encode('ascii'), dtype=np.uint8) == ord('1')).astype(np.uint8)
+
+
+def _bit_string(bits: np.ndarray) -> str:
+    """Operazione inversa di _string_bits"""
+    return (np.asarray(bits, dtype=np.uint8) + ord('0')).tobytes().decode('ascii')
 
 
 class AdvancedWatermarking:
     
-    def __init__(self):
+    def __init__(self, key: str = None):
         self.block_size = 8  
+        # Chiave segreta: con la chiave DCT e DWT spargono i bit su blocchi e coefficienti
+        # scelti da una permutazione pseudocasuale invece che sulle prime righe
+        self.key = key or None
         self.alpha = 0.1
-        self.debug = True
+        # Oltre questa soglia (megapixel) DCT e DWT lavorano a strip di tile_rows righe
+        self.tile_megapixels = float(os.environ.get('WATERMARK_TILE_MP', '40'))
+        self.tile_rows = int(os.environ.get('WATERMARK_TILE_ROWS', '512'))
+        # Estrazione DCT dai JPEG a metà risoluzione (draft): le sei posizioni stanno nel 4x4 in basso a frequenza
+        self.reduced_jpeg_extract = os.environ.get('WATERMARK_REDUCED_JPEG_EXTRACT', '1') != '0'
+        # Reed-Solomon sul messaggio: byte di parità per blocco di WATERMARK_ECC_BLOCK byte (0 = nessuno).
+        # Più parità corregge più errori ma riduce la capacità; l'header registra i parametri usati
+        ecc_block = int(os.environ.get('WATERMARK_ECC_BLOCK', '32'))
+        ecc_interleave = os.environ.get('WATERMARK_ECC_INTERLEAVE', '1') != '0'
+        self.ecc = make_code(int(os.environ.get('WATERMARK_ECC_PARITY', '8')), ecc_block, ecc_interleave)
+        # Il DFT ha solo DFT_CAPACITY bit: meno parità
+        self.dft_ecc = make_code(int(os.environ.get('WATERMARK_DFT_ECC_PARITY', '4')), ecc_block, ecc_interleave)
         
     def add_error_correction(self, binary_message: str) -> str:
         """Aggiunge ridondanza per correzione errori"""
-        redundant_message = ""
-        for bit in binary_message:
-            redundant_message += bit * 3
-        return redundant_message
+        return _bit_string(repeat_bits(_string_bits(binary_message), 3))
     
     def correct_errors(self, binary_message: str) -> str:
         """Corregge errori usando voto di maggioranza"""
-        corrected_message = ""
-        for i in range(0, len(binary_message), 3):
-            if i + 2 < len(binary_message):
-                bits = binary_message[i:i+3]
-                if bits.count('1') >= 2:
-                    corrected_message += '1'
-                else:
-                    corrected_message += '0'
-        return corrected_message    
+        bits = _string_bits(binary_message)
+        return _bit_string(majority_vote(bits[:len(bits) - len(bits) % 3].reshape(-1, 3), axis=1))
     
     def text_to_binary(self, text: str) -> str:
-        return ''.join(format(ord(char), '08b') for char in text)
+        return _bit_string(text_bits(text))
     
     def binary_to_text(self, binary: str) -> str:
-        text = ''
-        for i in range(0, len(binary), 8):
-            byte = binary[i:i+8]
-            if len(byte) == 8:
-                try:
-                    char_code = int(byte, 2)
-                    if 32 <= char_code <= 126:
-                        text += chr(char_code)
-                except ValueError:
-                    continue
-        return text
+        bits = _string_bits(binary)
+        return bits_text(bits[:len(bits) - len(bits) % 8])
     
-    def apply_dct_watermark(self, image_bytes: bytes, hidden_text: str) -> bytes:
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+    def _cached(self, image_key, kind, compute):
+        if image_key is None:
+            return compute()
+        return image_cache.get_or_compute((image_key, kind), compute)
+    
+    def image_key(self, image_bytes: bytes):
+        """Chiave di cache dell'immagine, None se la cache è disattivata"""
+        return content_key(image_bytes) if image_cache.max_bytes > 0 else None
+    
+    def load_rgb_array(self, image_bytes: bytes, image_key=None) -> np.ndarray:
+        """Decodifica l'immagine in un array float32 RGB (in sola lettura se preso dalla cache)"""
+        def decode():
+            image = load_image(image_bytes, open_image(image_bytes))
+            with stage('decode_array'):
+                return decode_into_float32(image)
+        return self._cached(image_key, 'rgb', decode)
+    
+    def dwt_channel_coeffs(self, img_array: np.ndarray, image_key=None) -> list:
+        """Coefficienti pywt.dwt2 (db4) per ciascuno dei tre canali"""
+        def transform():
+            with stage('transform'):
+                return [pywt.dwt2(np.ascontiguousarray(img_array[:, :, channel]), 'db4') for channel in range(3)]
+        return self._cached(image_key, 'dwt-db4', transform)
+    
+    def _encode_output(self, out_array: np.ndarray, output: OutputFormat = None) -> bytes:
+        output = output or PNG_OUTPUT
+        output_bytes = encode_image(image_from_uint8(out_array), output)
+        
+        # L'immagine prodotta viene spesso riletta subito (estrazione, test di robustezza);
+        # con il JPEG i pixel riletti non sono quelli di out_array
+        output_key = None if output.lossy else self.image_key(output_bytes)
+        if output_key is not None:
+            image_cache.put((output_key, 'rgb'), out_array.astype(np.float32))
+        return output_bytes
+    
+    def _key_positions(self, shape: tuple) -> np.ndarray:
+        """Posizioni (indici piatti in shape) dei primi MAX_PAYLOAD_BITS bit scelte da self.key, in cache"""
+        return key_positions(self.key, shape, MAX_PAYLOAD_BITS)
+    
+    def _message_bits(self, hidden_text: str) -> np.ndarray:
+        """Header protetto, messaggio UTF-8 e CRC con la parità di self.ecc (encode_payload), come array di 0/1"""
+        return encode_payload(hidden_text, self.ecc)
+    
+    def _check_capacity(self, bits: np.ndarray, capacity: int, method: str, width: int, height: int):
+        """ValueError se i bit non entrano in capacity o superano MAX_PAYLOAD_BITS, oltre cui gli estrattori non leggono"""
+        if len(bits) > min(capacity, MAX_PAYLOAD_BITS):
+            logger.debug("%s_apply message_too_long bits=%d capacity=%d", method, len(bits), capacity)
+            raise ValueError(f"Messaggio troppo lungo per il metodo {method} su un'immagine {width}x{height}")
+    
+    def _check_dwt_capacity(self, bits: np.ndarray, width: int, height: int, method: str = 'dwt'):
+        band_shape, _, _ = self._dwt_strip(width, height)
+        self._check_capacity(bits, dwt_capacity(band_shape), method, width, height)
+    
+    def apply_dct_watermark_array(self, img_array: np.ndarray, hidden_text: str, out: np.ndarray = None):
+        """
+        Inserisce il watermark DCT in un array RGB (H, W, 3)
         
-        img_array = np.array(image, dtype=np.float32)
+        Solo le righe di blocchi con il payload passano per un buffer float32;
+        il resto viene convertito direttamente in out. Con la chiave si
+        trasformano solo i blocchi scelti dalla chiave, ovunque nell'immagine.
+        
+        Returns:
+            Array uint8 ritagliato a multipli di 8 (out, se indicato)
+        
+        Raises:
+            ValueError se il messaggio non entra nei blocchi dell'immagine
+        """
         height, width, channels = img_array.shape
+        source_width, source_height = width, height
         
         height = (height // self.block_size) * self.block_size
         width = (width // self.block_size) * self.block_size
-        img_array = img_array[:height, :width, :]
+        img_array = img_array[:height, :width, :3]
         
-        binary_message = self.text_to_binary(hidden_text)
-        message_length = len(binary_message)
+        bits = self._message_bits(hidden_text)
         
-        if self.debug:
-            print(f"DCT Apply - Messaggio: '{hidden_text}' -> {message_length} bit")
-        
-        length_header = format(message_length, '032b')
-        full_message = length_header + binary_message
+        logger.debug("dct_apply payload_bits=%d", len(bits))
         
         max_blocks = (height // self.block_size) * (width // self.block_size)
-        if len(full_message) > max_blocks:
-            if self.debug:
-                print(f"Messaggio troppo lungo: {len(full_message)} bit, massimo {max_blocks} blocchi")
-            return image_bytes
-        for channel in range(3):
-            channel_data = img_array[:, :, channel].copy()
-            bit_index = 0
-            watermark_strength = 80.0  
-            
-            for i in range(0, height, self.block_size):
-                for j in range(0, width, self.block_size):
-                    if bit_index >= len(full_message):
-                        break
-                    
-                    block = channel_data[i:i+self.block_size, j:j+self.block_size]
-                    dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
-                    
-                    bit_value = int(full_message[bit_index])
-                    
-                   
-                    positions = [(2, 3), (3, 2), (2, 2), (3, 3), (1, 2), (2, 1)]
-                    for pos_idx, (row, col) in enumerate(positions):
-                        if bit_value == 1:
-                            dct_block[row, col] = abs(dct_block[row, col]) + watermark_strength
-                        else:
-                            dct_block[row, col] = -(abs(dct_block[row, col]) + watermark_strength)
-                    
-                    watermarked_block = idct(idct(dct_block.T, norm='ortho').T, norm='ortho')
-                    channel_data[i:i+self.block_size, j:j+self.block_size] = watermarked_block
-                    
-                    bit_index += 1
-                
-                if bit_index >= len(full_message):
-                    break
-            
-            img_array[:, :, channel] = np.clip(channel_data, 0, 255)
+        self._check_capacity(bits, max_blocks, 'dct', source_width, source_height)
+        watermark_strength = 80.0
+        if out is None:
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        np.copyto(out, img_array, casting='unsafe')
+        
+        if self.key is not None:
+            positions = self._key_positions((height // self.block_size, width // self.block_size))
+            spread = spread_payload(bits, len(positions))
+            if spread is None:
+                raise ValueError("Messaggio troppo lungo per il metodo dct con chiave su un'immagine "
+                                 f"{source_width}x{source_height}")
+            apply_dct_positions(img_array, out, spread, positions, self.block_size, watermark_strength)
+            return out
+        
+        payload_rows = -(-len(bits) // (width // self.block_size)) * self.block_size
+        payload = np.array(img_array[:payload_rows], dtype=np.float32)
+        apply_dct_blocks(payload, bits, self.block_size, watermark_strength)
+        np.copyto(out[:payload_rows], payload, casting='unsafe')
+        
+        return out
+    
+    def extract_dct_watermark_array(self, img_array: np.ndarray) -> str:
+        height, width, channels = img_array.shape
+        total_blocks = (height // self.block_size) * (width // self.block_size)
+        return self._read_dct_message(img_array, self.block_size, total_blocks)
+    
+    def _read_dct_message(self, img_array: np.ndarray, block_size: int, total_blocks: int) -> str:
+        """
+        Legge header e messaggio DCT da blocchi di lato block_size
         
-        watermarked_image = Image.fromarray(img_array.astype(np.uint8))
+        total_blocks è il numero di blocchi dell'immagine intera: img_array può
+        contenere solo le prime righe di blocchi.
+        """
+        return self._read_dct_text(img_array, block_size, total_blocks) or ""
+    
+    def _read_dct_text(self, img_array: np.ndarray, block_size: int, total_blocks: int):
+        """
+        Testo DCT, None se header, correzione o CRC non sono validi
         
-        output_buffer = BytesIO()
-        watermarked_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        Prima si legge l'header, poi solo i blocchi che contengono il resto.
+        Se header o CRC non sono validi si prova il formato precedente. Con
+        la chiave img_array deve contenere tutte le righe di blocchi.
+        """
+        if total_blocks < HEADER_BITS:
+            return None
+        
+        img_array = img_array[:, :, :3]
+        if self.key is not None:
+            cols = img_array.shape[1] // block_size
+            positions = self._key_positions((total_blocks // cols, cols))
+            return read_spread_payload(
+                lambda start, count: read_dct_positions(img_array, positions[start:start + count], block_size),
+                len(positions))
+        
+        header = read_header(read_dct_bits(img_array, 0, HEADER_BITS, block_size),
+                             min(MAX_PAYLOAD_BITS, total_blocks))
+        text = None
+        if header is not None:
+            text = decode_payload(read_dct_bits(img_array, HEADER_BITS, header.body_bits, block_size), header)
+        if text is None:
+            text = self._read_legacy_dct_text(img_array, block_size, total_blocks)
+        return text
+    
+    def _read_legacy_dct_text(self, img_array: np.ndarray, block_size: int, total_blocks: int):
+        """Testo DCT nel formato precedente (lunghezza di 32 bit, ASCII), None se non c'è"""
+        length = read_legacy_length(read_dct_bits(img_array, 0, LEGACY_LENGTH_BITS, block_size))
+        if length is None or total_blocks < LEGACY_LENGTH_BITS + length:
+            return None
+        logger.debug("dct_extract legacy_bits=%d", length)
+        return legacy_text(read_dct_bits(img_array, LEGACY_LENGTH_BITS, length, block_size))
+    
+    def _use_tiles(self, image_bytes: bytes) -> bool:
+        width, height = Image.open(BytesIO(image_bytes)).size
+        return width * height >= self.tile_megapixels * 1e6
+    
+    def _open_rgb_image(self, image_bytes: bytes) -> Image.Image:
+        image = load_image(image_bytes, open_image(image_bytes))
+        return image if image.mode == 'RGB' else image.convert('RGB')
+    
+    def _write_tiled(self, apply_tiled, output: OutputFormat = None) -> bytes:
+        """
+        Esegue apply_tiled(writer_factory) e restituisce i byte codificati
+        
+        Il PNG è scritto in streaming una strip alla volta; WebP e JPEG
+        raccolgono prima le strip in un array uint8.
+        """
+        output = output or PNG_OUTPUT
+        if output.format == 'png':
+            output_buffer = BytesIO()
+            compress_level = 9 if output.optimize else output.compress_level
+            apply_tiled(lambda width, height: PngStreamWriter(output_buffer, width, height, compress_level))
+            return output_buffer.getvalue()
+        
+        writers = []
+        def collect(width, height):
+            writers.append(ArrayRowsWriter(width, height))
+            return writers[-1]
+        apply_tiled(collect)
+        return encode_image(image_from_uint8(writers[0].pixels), output)
+    
+    def apply_dct_watermark_tiled(self, image_bytes: bytes, hidden_text: str, tile_rows: int = None,
+                                  output: OutputFormat = None) -> bytes:
+        """
+        apply_dct_watermark a strip: niente array float32 dell'immagine intera
+        
+        I pixel prodotti coincidono con quelli del percorso normale.
+        """
+        image = self._open_rgb_image(image_bytes)
+        bits = self._message_bits(hidden_text)
+        max_blocks = (image.height // self.block_size) * (image.width // self.block_size)
+        self._check_capacity(bits, max_blocks, 'dct', image.width, image.height)
+        
+        return self._write_tiled(
+            lambda writer_factory: apply_dct_tiled(image, bits, self.block_size, 80.0,
+                                                   tile_rows or self.tile_rows, writer_factory),
+            output)
+    
+    def apply_dwt_watermark_tiled(self, image_bytes: bytes, hidden_text: str, tile_rows: int = None,
+                                  output: OutputFormat = None) -> bytes:
+        """apply_dwt_watermark a strip con bordo DWT_HALO; stessi pixel del percorso normale"""
+        image = self._open_rgb_image(image_bytes)
+        bits = self._message_bits(hidden_text)
+        self._check_dwt_capacity(bits, image.width, image.height)
+        return self._write_tiled(
+            lambda writer_factory: apply_dwt_tiled(image, bits, 50.0, tile_rows or self.tile_rows, writer_factory),
+            output)
+    
+    def apply_dct_watermark(self, image_bytes: bytes, hidden_text: str, output: OutputFormat = None) -> bytes:
+        # Con la chiave i blocchi sono sparsi su tutta l'immagine: niente strip
+        if self.key is None and self._use_tiles(image_bytes):
+            return self.apply_dct_watermark_tiled(image_bytes, hidden_text, output=output)
+        img_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        height, width = img_array.shape[:2]
+        out = output_uint8(((height // self.block_size) * self.block_size,
+                            (width // self.block_size) * self.block_size, 3))
+        return self._encode_output(self.apply_dct_watermark_array(img_array, hidden_text, out), output)
+    
+    def _cached_rgb(self, image_bytes: bytes):
+        """Array RGB già in cache (es. output appena prodotto), senza decodificare"""
+        image_key = self.image_key(image_bytes)
+        if image_key is None:
+            return None, None
+        return image_key, image_cache.get((image_key, 'rgb'))
     
     def extract_dct_watermark(self, image_bytes: bytes) -> str:
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        """
+        Estrae il watermark DCT decodificando solo le righe di blocchi con il payload
         
-        img_array = np.array(image, dtype=np.float32)
-        height, width, channels = img_array.shape
+        I JPEG sono decodificati a metà risoluzione con draft(): i blocchi 8x8
+        diventano 4x4 e le sei posizioni DCT (tutte con indici < 4) restano
+        leggibili dalla IDCT ridotta di libjpeg. I PNG si fermano alle righe
+        necessarie (tutte, con la chiave).
+        """
+        _, cached = self._cached_rgb(image_bytes)
+        if cached is not None:
+            return self.extract_dct_watermark_array(cached)
         
-        height = (height // self.block_size) * self.block_size
-        width = (width // self.block_size) * self.block_size
+        image = open_image(image_bytes)
+        width, height = image.size
+        cols, rows = width // self.block_size, height // self.block_size
+        if rows * cols < HEADER_BITS:
+            return ""
         
-       
-        channel_results = []
+        scale = 2 if self.reduced_jpeg_extract and reduce_jpeg(image, 2) else 1
+        block_size = self.block_size // scale
+        needed_rows = (rows if self.key is not None else min(rows, -(-MAX_PAYLOAD_BITS // cols))) * block_size
+        
+        pixels = load_rows(image_bytes, image, needed_rows)
+        return self._read_dct_message(pixels[:, :cols * block_size], block_size, rows * cols)
+    
+    def apply_dwt_watermark_array(self, img_array: np.ndarray, hidden_text: str, image_key=None,
+                                  out: np.ndarray = None) -> np.ndarray:
+        """
+        Inserisce il watermark DWT in un array RGB (H, W, 3)
+        
+        image_key (opzionale) permette di riusare i coefficienti dalla cache.
+        Ogni canale ricostruito è scritto direttamente in out (uint8), se indicato.
+        """
+        return self._embed_dwt(img_array, self._message_bits(hidden_text), image_key, out)
+    
+    def _embed_dwt(self, img_array: np.ndarray, bits: np.ndarray, image_key=None, out: np.ndarray = None) -> np.ndarray:
+        """Corpo di apply_dwt_watermark_array con i bit già pronti"""
+        source_array = np.asarray(img_array[:, :, :3], dtype=np.float32)
+        channel_coeffs = self.dwt_channel_coeffs(source_array, image_key)
+        channel_shape = source_array.shape[:2]
+        if out is None:
+            out = np.empty(source_array.shape, dtype=np.uint8)
+        
+        logger.debug("dwt_apply bits=%d", len(bits))
+        
+        if self.key is not None:
+            positions = self._dwt_key_positions(channel_coeffs[0][1][0])
+            spread = spread_payload(bits, len(positions))
+            if spread is None:
+                raise ValueError("Messaggio troppo lungo per il metodo dwt con chiave su un'immagine "
+                                 f"{channel_shape[1]}x{channel_shape[0]}")
+        else:
+            # embed_dwt_bits scarterebbe in silenzio i bit oltre la capacità
+            self._check_capacity(bits, dwt_capacity(channel_coeffs[0][1][0].shape), 'dwt',
+                                 channel_shape[1], channel_shape[0])
         
         for channel in range(3):
-            channel_data = img_array[:height, :width, channel]
-            extracted_bits = []
+            cA, (cH, cV, cD) = channel_coeffs[channel]
             
-            for i in range(0, height, self.block_size):
-                for j in range(0, width, self.block_size):
-                    block = channel_data[i:i+self.block_size, j:j+self.block_size]
-                    dct_block = dct(dct(block.T, norm='ortho').T, norm='ortho')
-                    
-                   
-                    votes = []
-                    positions = [(2, 3), (3, 2), (2, 2), (3, 3), (1, 2), (2, 1)]
-                    for row, col in positions:
-                        if dct_block[row, col] > 0:
-                            votes.append(1)
-                        else:
-                            votes.append(0)
-                    
-                    
-                    bit_value = 1 if sum(votes) > len(votes) // 2 else 0
-                    extracted_bits.append(str(bit_value))
+            embedding_strength = 50.0  
             
-            channel_results.append(extracted_bits)
-
-        final_bits = []
-        min_length = min(len(result) for result in channel_results)
+            with stage('embed'):
+                watermarked_cH = cH.copy()
+                watermarked_cV = cV.copy()
+                watermarked_cD = cD.copy()
+                
+                bands = [watermarked_cH, watermarked_cV, watermarked_cD]
+                if self.key is not None:
+                    bit_index = embed_dwt_positions([keyed_region(band) for band in bands], spread, positions,
+                                                    embedding_strength)
+                else:
+                    bit_index = embed_dwt_bits(bands, bits, embedding_strength)
+            
+            with stage('inverse_transform'):
+                watermarked_coeffs = (cA, (watermarked_cH, watermarked_cV, watermarked_cD))
+                watermarked_channel = pywt.idwt2(watermarked_coeffs, 'db4')
+                
+                # Con db4 la ricostruzione non è mai più piccola del canale originale
+                watermarked_channel = watermarked_channel[:channel_shape[0], :channel_shape[1]]
+                clip_to_uint8(watermarked_channel, out[:, :, channel])
         
-        for i in range(min_length):
-            votes = [int(channel_results[ch][i]) for ch in range(3)]
-            bit_value = 1 if sum(votes) >= 2 else 0
-            final_bits.append(str(bit_value))
+        logger.debug("dwt_apply embedded_bits=%d", bit_index)
         
-        if len(final_bits) < 32:
-            return ""
+        return out
+    
+    def extract_dwt_watermark_array(self, img_array: np.ndarray, image_key=None) -> str:
+        img_array = np.asarray(img_array[:, :, :3], dtype=np.float32)
         
-        length_bits = ''.join(final_bits[:32])
-        try:
-            message_length = int(length_bits, 2)
-        except ValueError:
-            return ""
+        channel_coeffs = self.dwt_channel_coeffs(img_array, image_key)
+        if self.key is not None:
+            return self._read_keyed_dwt_text(channel_coeffs) or ""
+        
+        channel_results = []
         
-        if message_length <= 0 or message_length > 1000 or len(final_bits) < 32 + message_length:
+        for cA, (cH, cV, cD) in channel_coeffs:
+            channel_results.append(read_dwt_bits([cH, cV, cD], DWT_READ_BITS))
+        
+        return self._read_dwt_message(channel_results)
+    
+    def _read_keyed_dwt_text(self, channel_coeffs: list):
+        """Testo DWT dalle posizioni della chiave: voto tra i canali e tra le copie"""
+        channel_bands = [[keyed_region(band) for band in bands] for cA, bands in channel_coeffs]
+        positions = self._dwt_key_positions(channel_coeffs[0][1][0])
+        return read_spread_payload(
+            lambda start, count: np.stack([read_dwt_positions(bands, positions[start:start + count])
+                                           for bands in channel_bands]),
+            len(positions))
+    
+    def _dwt_key_positions(self, band: np.ndarray) -> np.ndarray:
+        """Posizioni della chiave nelle tre sottobande di dettaglio impilate, senza i bordi"""
+        return self._key_positions((3,) + keyed_region(band).shape)
+    
+    def _read_dwt_message(self, channel_results: list) -> str:
+        """Voto di maggioranza tra i canali, poi header, messaggio con correzione e CRC"""
+        result = self._read_dwt_text(channel_results)
+        if result is None:
             return ""
         
-        message_bits = ''.join(final_bits[32:32 + message_length])
-        result = self.binary_to_text(message_bits)
+        logger.debug("dwt_extract chars=%d", len(result))
         
         return result
     
-    def apply_dwt_watermark(self, image_bytes: bytes, hidden_text: str) -> bytes:
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        img_array = np.array(image, dtype=np.float32)
+    def _read_dwt_text(self, channel_results: list):
+        """Testo DWT, None se header, correzione o CRC non sono validi (anche nel formato precedente)"""
+        min_length = min(len(result) for result in channel_results)
+        final_bits = majority_vote(np.stack([result[:min_length] for result in channel_results]))
         
-        binary_message = self.text_to_binary(hidden_text)
-        length_header = format(len(binary_message), '032b')
-        full_message = length_header + binary_message
+        logger.debug("dwt_extract bits=%d", len(final_bits))
         
-        if self.debug:
-            print(f"DWT Apply - Messaggio: '{hidden_text}' -> {len(full_message)} bit")
+        header = read_header(final_bits, min(MAX_PAYLOAD_BITS, len(final_bits)))
+        text = None
+        if header is not None:
+            text = decode_payload(final_bits[HEADER_BITS:], header)
+        if text is None:
+            logger.debug("dwt_extract invalid_payload header=%s", header is not None)
+            text = self._read_legacy_dwt_text(final_bits)
+        return text
+    
+    def _read_legacy_dwt_text(self, final_bits: np.ndarray):
+        """Testo DWT nel formato precedente (lunghezza di 32 bit, ASCII), None se non c'è"""
+        length = read_legacy_length(final_bits)
+        if length is None or len(final_bits) < LEGACY_LENGTH_BITS + length:
+            return None
+        logger.debug("dwt_extract legacy_bits=%d", length)
+        return legacy_text(final_bits[LEGACY_LENGTH_BITS:LEGACY_LENGTH_BITS + length])
+    
+    def apply_dwt_watermark(self, image_bytes: bytes, hidden_text: str, output: OutputFormat = None) -> bytes:
+        if self.key is None and self._use_tiles(image_bytes):
+            return self.apply_dwt_watermark_tiled(image_bytes, hidden_text, output=output)
+        image_key = self.image_key(image_bytes)
+        img_array = self.load_rgb_array(image_bytes, image_key)
+        out = output_uint8(img_array.shape[:2] + (3,))
+        return self._encode_output(self.apply_dwt_watermark_array(img_array, hidden_text, image_key, out), output)
+    
+    def extract_dwt_watermark(self, image_bytes: bytes) -> str:
+        """
+        Estrae il watermark DWT trasformando solo la strip con i coefficienti letti
         
+        La strip copre le righe delle sottobande con i primi DWT_READ_BITS bit,
+        più DWT_HALO righe per lato: i coefficienti coincidono con quelli
+        dell'immagine intera. I PNG si fermano alla fine della strip. Con la
+        chiave i coefficienti sono sparsi ovunque e si trasforma tutta l'immagine.
+        """
+        image_key, cached = self._cached_rgb(image_bytes)
+        if cached is not None:
+            return self.extract_dwt_watermark_array(cached, image_key)
+        if self.key is not None:
+            image_key = self.image_key(image_bytes)
+            return self.extract_dwt_watermark_array(self.load_rgb_array(image_bytes, image_key), image_key)
+        
+        image = open_image(image_bytes)
+        band_shape, top, bottom = self._dwt_strip(*image.size)
+        pixels = load_rows(image_bytes, image, bottom)
+        return self._read_dwt_message(self._read_dwt_strip(pixels, band_shape, top, bottom))
+    
+    def _dwt_strip(self, width: int, height: int) -> tuple:
+        """Sottobande dell'immagine intera e righe [top, bottom) della strip letta da extract_dwt_watermark"""
+        wavelet = pywt.Wavelet('db4')
+        band_shape = (pywt.dwt_coeff_len(height, wavelet, 'symmetric'),
+                      pywt.dwt_coeff_len(width, wavelet, 'symmetric'))
+        first_row, last_row = window_rows(band_shape, DWT_READ_BITS)
+        top = max(0, 2 * first_row - DWT_HALO)
+        bottom = min(height, 2 * last_row + DWT_HALO)
+        return band_shape, top, bottom
+    
+    def _read_dwt_strip(self, pixels: np.ndarray, band_shape: tuple, top: int, bottom: int) -> list:
+        """Bit letti da ogni canale delle righe [top, bottom) di pixels, che parte dalla prima riga dell'immagine"""
+        with stage('decode_array'):
+            strip = np.array(pixels[top:bottom, :, :3], dtype=np.float32)
         
+        channel_results = []
         for channel in range(3):
-            channel_data = img_array[:, :, channel].copy()
-            
-            coeffs = pywt.dwt2(channel_data, 'db4')
-            cA, (cH, cV, cD) = coeffs
-            
-            embedding_strength = 50.0  
-            
-            h, w = cH.shape
-            watermarked_cH = cH.copy()
-            watermarked_cV = cV.copy()
-            watermarked_cD = cD.copy()
-            
-            
-            start_h, start_w = h // 3, w // 3
-            end_h, end_w = 2 * h // 3, 2 * w // 3
-            
-            bit_index = 0
-            
-           
-            for coeff_matrix in [watermarked_cH, watermarked_cV, watermarked_cD]:
-                for i in range(start_h, end_h):
-                    for j in range(start_w, end_w):
-                        if bit_index >= len(full_message):
-                            break
-                        
-                        bit_value = int(full_message[bit_index])
-                        original_coeff = coeff_matrix[i, j]
-                        
-                        quantum = embedding_strength
-                        
-                        
-                        if bit_value == 1:
-                            coeff_matrix[i, j] = abs(original_coeff) + quantum
-                        else:
-                            coeff_matrix[i, j] = -(abs(original_coeff) + quantum)
-                        
-                        bit_index += 1
-                    
-                    if bit_index >= len(full_message):
-                        break
-                
-                if bit_index >= len(full_message):
-                    break
-            
-            watermarked_coeffs = (cA, (watermarked_cH, watermarked_cV, watermarked_cD))
-            watermarked_channel = pywt.idwt2(watermarked_coeffs, 'db4')
-            
-            if watermarked_channel.shape != channel_data.shape:
-                min_h = min(watermarked_channel.shape[0], channel_data.shape[0])
-                min_w = min(watermarked_channel.shape[1], channel_data.shape[1])
-                watermarked_channel = watermarked_channel[:min_h, :min_w]
-                img_array = img_array[:min_h, :min_w, :]
-            
-            watermarked_channel = np.clip(watermarked_channel, 0, 255)
-            img_array[:, :, channel] = watermarked_channel
+            with stage('transform'):
+                cA, (cH, cV, cD) = pywt.dwt2(np.ascontiguousarray(strip[:, :, channel]), 'db4')
+            channel_results.append(read_dwt_window([cH, cV, cD], DWT_READ_BITS, band_shape, top // 2))
+        
+        logger.debug("dwt_extract strip_top=%d strip_bottom=%d", top, bottom)
         
-        if self.debug:
-            print(f"DWT Apply - Embedded {bit_index} bit")
+        return channel_results
+    
+    def _dft_message_bits(self, hidden_text: str) -> np.ndarray:
+        bits = encode_payload(hidden_text, self.dft_ecc)
+        if len(bits) > DFT_CAPACITY:
+            raise ValueError("Messaggio troppo lungo per il metodo dft: al massimo "
+                             f"{max_message_bytes(DFT_CAPACITY, self.dft_ecc)} byte in UTF-8")
+        return bits
+    
+    def _check_dft_size(self, width: int, height: int):
+        """Sotto un tile DFT_TILE x DFT_TILE lo spettro analizzato non contiene il pattern: non si rilegge"""
+        if width < DFT_TILE or height < DFT_TILE:
+            raise ValueError(f"Immagine troppo piccola per il metodo dft: servono almeno {DFT_TILE}x{DFT_TILE} "
+                             f"pixel, non {width}x{height}")
+    
+    def apply_dft_watermark_array(self, img_array: np.ndarray, hidden_text: str, out: np.ndarray = None) -> np.ndarray:
+        """
+        Inserisce il watermark DFT in un array RGB (H, W, 3)
         
-        watermarked_image = Image.fromarray(img_array.astype(np.uint8))
+        Alla luminanza si somma un pattern periodico (DFT_TILE pixel) con le
+        frequenze disposte su anelli dello spettro: un anello di
+        sincronizzazione e i bit del messaggio. L'ampiezza di ogni anello
+        dipende dallo spettro dell'immagine (ring_amplitudes).
         
-        output_buffer = BytesIO()
-        watermarked_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        Raises:
+            ValueError se il messaggio supera DFT_CAPACITY bit o l'immagine è più piccola di un tile
+        """
+        self._check_dft_size(img_array.shape[1], img_array.shape[0])
+        bits = self._dft_message_bits(hidden_text)
+        img_array = img_array[:, :, :3]
+        tile = watermark_tile(bits, ring_amplitudes(img_array, len(bits)))
+        
+        logger.debug("dft_apply payload_bits=%d", len(bits))
+        
+        if out is None:
+            out = np.empty(img_array.shape, dtype=np.uint8)
+        for top in range(0, img_array.shape[0], DFT_TILE):
+            bottom = min(img_array.shape[0], top + DFT_TILE)
+            with stage('embed'):
+                clip_to_uint8(add_pattern_rows(img_array[top:bottom], tile, top), out[top:bottom])
+        return out
     
-    def extract_dwt_watermark(self, image_bytes: bytes) -> str:
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+    def apply_dft_watermark_tiled(self, image_bytes: bytes, hidden_text: str, tile_rows: int = None,
+                                  output: OutputFormat = None) -> bytes:
+        """apply_dft_watermark a strip; stessi pixel del percorso normale"""
+        image = self._open_rgb_image(image_bytes)
+        self._check_dft_size(image.width, image.height)
+        bits = self._dft_message_bits(hidden_text)
+        block = np.asarray(image.crop(central_box(image.width, image.height)))
+        tile = watermark_tile(bits, ring_amplitudes(block, len(bits)))
+        return self._write_tiled(
+            lambda writer_factory: apply_dft_tiled(image, tile, tile_rows or self.tile_rows, writer_factory),
+            output)
+    
+    def apply_dft_watermark(self, image_bytes: bytes, hidden_text: str, output: OutputFormat = None) -> bytes:
+        if self._use_tiles(image_bytes):
+            return self.apply_dft_watermark_tiled(image_bytes, hidden_text, output=output)
+        img_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        out = output_uint8(img_array.shape[:2] + (3,))
+        return self._encode_output(self.apply_dft_watermark_array(img_array, hidden_text, out), output)
+    
+    def extract_dft_watermark_array(self, img_array: np.ndarray) -> str:
+        """
+        Cerca scala e rotazione con l'anello di sincronizzazione, poi legge header e messaggio
         
-        img_array = np.array(image, dtype=np.float32)
+        Si provano i migliori candidati di sync_candidates: vale il primo con
+        un header valido e il messaggio corretto dal codice con il CRC giusto.
+        """
+        spectrum = analysis_spectrum(img_array)
+        for factor, rotation, score in sync_candidates(spectrum):
+            bits = read_dft_bits(spectrum, (factor, rotation), DFT_CAPACITY)
+            header = read_header(bits, DFT_CAPACITY)
+            result = None if header is None else decode_payload(bits[HEADER_BITS:], header)
+            logger.debug("dft_extract scale=%.3f rotation=%.1f score=%.2f header=%s valid=%s",
+                         1 / factor, np.degrees(rotation), score, header is not None, result is not None)
+            if result is not None:
+                return result
+        return ""
+    
+    def extract_dft_watermark(self, image_bytes: bytes) -> str:
+        _, cached = self._cached_rgb(image_bytes)
+        if cached is not None:
+            return self.extract_dft_watermark_array(cached)
+        return self.extract_dft_watermark_array(load_rows(image_bytes, open_image(image_bytes)))
+    
+    def _robust_dct_rows(self, width: int, height: int, bits: np.ndarray) -> int:
+        """
+        Righe occupate dai bit DCT del metodo robust
         
-        channel_results = []
+        Raises:
+            ValueError se i blocchi DCT arrivano al terzo centrale usato dal DWT o il DWT non ha spazio
+        """
+        self._check_dwt_capacity(bits, width, height, 'robust')
+        band_shape, _, _ = self._dwt_strip(width, height)
+        cols = width // self.block_size
+        payload_rows = -(-len(bits) // max(cols, 1)) * self.block_size
+        if cols == 0 or payload_rows + DWT_HALO > 2 * (band_shape[0] // 3):
+            raise ValueError(f"Messaggio troppo lungo per il metodo robust su un'immagine {width}x{height}")
+        return payload_rows
+    
+    def apply_robust_watermark_array(self, img_array: np.ndarray, hidden_text: str, image_key=None,
+                                     out: np.ndarray = None) -> np.ndarray:
+        """
+        Inserisce DCT e DWT nello stesso array RGB (H, W, 3), senza ritagliarlo
         
-        for channel in range(3):
-            channel_data = img_array[:, :, channel]
-            
-            coeffs = pywt.dwt2(channel_data, 'db4')
-            cA, (cH, cV, cD) = coeffs
-            
-            h, w = cH.shape
-            start_h, start_w = h // 3, w // 3
-            end_h, end_w = 2 * h // 3, 2 * w // 3
-            
-            extracted_bits = []
-            
-            for coeff_matrix in [cH, cV, cD]:
-                for i in range(start_h, end_h):
-                    for j in range(start_w, end_w):
-                        if len(extracted_bits) >= 2000:
-                            break
-                        
-                        coeff_value = coeff_matrix[i, j]
-                        
-                        if coeff_value > 0:
-                            extracted_bits.append('1')
-                        else:
-                            extracted_bits.append('0')
-                    
-                    if len(extracted_bits) >= 2000:
-                        break
-                
-                if len(extracted_bits) >= 2000:
-                    break
-            
-            channel_results.append(extracted_bits)
-        final_bits = []
-        min_length = min(len(result) for result in channel_results)
+        Prima il DWT su tutta l'immagine, poi il DCT sulle prime righe di
+        blocchi del risultato: i bit DWT stanno nel terzo centrale delle
+        sottobande, quindi le due parti non si toccano.
         
-        for i in range(min_length):
-            votes = [int(channel_results[ch][i]) for ch in range(3)]
-            bit_value = 1 if sum(votes) >= 2 else 0
-            final_bits.append(str(bit_value))
+        Raises:
+            ValueError se i blocchi DCT si sovrappongono alla parte DWT
+        """
+        height, width = img_array.shape[:2]
+        bits = self._message_bits(hidden_text)
+        payload_rows = self._robust_dct_rows(width, height, bits)
         
-        if self.debug:
-            print(f"DWT Extract - Estratti {len(final_bits)} bit")
-            print(f"DWT Extract - Prime 42 bit: {''.join(final_bits[:42])}")
+        out = self._embed_dwt(img_array, bits, image_key, out)
         
-        if len(final_bits) < 32:
-            return ""
+        cols = width // self.block_size
+        payload = out[:payload_rows, :cols * self.block_size].astype(np.float32)
+        apply_dct_blocks(payload, bits, self.block_size, 80.0)
+        np.copyto(out[:payload_rows, :cols * self.block_size], payload, casting='unsafe')
+        return out
+    
+    def apply_robust_watermark_tiled(self, image_bytes: bytes, hidden_text: str, tile_rows: int = None,
+                                     output: OutputFormat = None) -> bytes:
+        """apply_robust_watermark a strip: DWT con apply_dwt_tiled, DCT sulle prime strip; stessi pixel"""
+        image = self._open_rgb_image(image_bytes)
+        bits = self._message_bits(hidden_text)
+        payload_rows = self._robust_dct_rows(image.width, image.height, bits)
+        
+        def dct_writer_factory(writer_factory):
+            return lambda width, height: DctRowsWriter(writer_factory(width, height), width, payload_rows,
+                                                       bits, self.block_size, 80.0)
+        
+        return self._write_tiled(
+            lambda writer_factory: apply_dwt_tiled(image, bits, 50.0, tile_rows or self.tile_rows,
+                                                   dct_writer_factory(writer_factory)),
+            output)
+    
+    def apply_robust_watermark(self, image_bytes: bytes, hidden_text: str, output: OutputFormat = None) -> bytes:
+        """DCT e DWT con una sola decodifica e una sola codifica"""
+        if self._use_tiles(image_bytes):
+            return self.apply_robust_watermark_tiled(image_bytes, hidden_text, output=output)
+        image_key = self.image_key(image_bytes)
+        img_array = self.load_rgb_array(image_bytes, image_key)
+        out = output_uint8(img_array.shape[:2] + (3,))
+        return self._encode_output(self.apply_robust_watermark_array(img_array, hidden_text, image_key, out), output)
+    
+    def _first_valid_text(self, readers: dict) -> tuple:
+        """
+        Esegue i lettori {metodo: funzione} in thread paralleli
         
-        length_bits = ''.join(final_bits[:32])
+        Ogni lettore restituisce il testo, o None se header, correzione o
+        CRC non sono validi. Restituisce (testo, metodo) del primo lettore
+        riuscito, senza aspettare gli altri; ("", None) se nessuno riesce.
+        Le fasi misurate sono quelle del lettore scelto.
+        """
+        executor = ThreadPoolExecutor(max_workers=len(readers))
         try:
-            message_length = int(length_bits, 2)
-            if self.debug:
-                print(f"DWT Extract - Lunghezza messaggio: {message_length}")
-        except ValueError:
-            return ""
-        
-        if message_length <= 0 or message_length > 1000 or len(final_bits) < 32 + message_length:
-            if self.debug:
-                print(f"DWT Extract - Lunghezza non valida: {message_length}")
-            return ""
+            futures = {executor.submit(timed, reader): method for method, reader in readers.items()}
+            for future in as_completed(futures):
+                text, timings = future.result()
+                logger.debug("robust_extract method=%s valid=%s", futures[future], text is not None)
+                if text is not None:
+                    for name, value in timings.items():
+                        if name != 'watermark_ms':
+                            record_stage(name.removesuffix('_ms'), value / 1000)
+                    return text, futures[future]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return "", None
+    
+    def extract_robust_watermark_array(self, img_array: np.ndarray, image_key=None) -> tuple:
+        """Come extract_robust_watermark, su un array RGB già decodificato"""
+        height, width = img_array.shape[:2]
+        total_blocks = (height // self.block_size) * (width // self.block_size)
+        
+        def read_dwt():
+            channel_results = [read_dwt_bits([cH, cV, cD], DWT_READ_BITS)
+                               for cA, (cH, cV, cD) in self.dwt_channel_coeffs(img_array, image_key)]
+            return self._read_dwt_text(channel_results)
+        
+        return self._first_valid_text({
+            'dct': lambda: self._read_dct_text(img_array, self.block_size, total_blocks),
+            'dwt': read_dwt,
+        })
+    
+    def extract_robust_watermark(self, image_bytes: bytes) -> tuple:
+        """
+        Legge DCT e DWT in parallelo da una sola decodifica
         
-        message_bits = ''.join(final_bits[32:32 + message_length])
-        result = self.binary_to_text(message_bits)
+        Si decodificano le righe che servono a entrambi (le prime righe di
+        blocchi e la strip DWT); vale il primo payload con lunghezza e CRC
+        corretti.
         
-        if self.debug:
-            print(f"DWT Extract - Bit messaggio: {message_bits}")
-            print(f"DWT Extract - Risultato: '{result}'")
+        Returns:
+            (testo, metodo che l'ha letto), ("", None) se nessuno dei due
+        """
+        image_key, cached = self._cached_rgb(image_bytes)
+        if cached is not None:
+            return self.extract_robust_watermark_array(cached, image_key)
         
-        return result
+        image = open_image(image_bytes)
+        width, height = image.size
+        cols, rows = width // self.block_size, height // self.block_size
+        if rows * cols < HEADER_BITS:
+            return "", None
+        dct_rows = min(rows, -(-MAX_PAYLOAD_BITS // cols)) * self.block_size
+        band_shape, top, bottom = self._dwt_strip(width, height)
+        
+        pixels = load_rows(image_bytes, image, max(dct_rows, bottom))
+        return self._first_valid_text({
+            'dct': lambda: self._read_dct_text(pixels[:dct_rows, :cols * self.block_size], self.block_size,
+                                                  rows * cols),
+            'dwt': lambda: self._read_dwt_text(self._read_dwt_strip(pixels, band_shape, top, bottom)),
+        })
     
-    def apply_robust_watermark(self, image_bytes: bytes, hidden_text: str) -> bytes:
-        return self.apply_dct_watermark(image_bytes, hidden_text)
+    def _decode_array(self, image_bytes: bytes) -> np.ndarray:
+        image = Image.open(BytesIO(image_bytes))
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGB')
+        return np.asarray(image)
     
-    def extract_robust_watermark(self, image_bytes: bytes) -> str:
-        return self.extract_dct_watermark(image_bytes)
+    def _encode_array_png(self, img_array: np.ndarray) -> bytes:
+        output_buffer = BytesIO()
+        Image.fromarray(img_array).save(output_buffer, format='PNG')
+        return output_buffer.getvalue()
     
-    def apply_jpeg_compression(self, image_bytes: bytes, quality: int = 85) -> bytes:
-        """Applica compressione JPEG con la qualità specificata"""
-        image = Image.open(BytesIO(image_bytes))
+    def jpeg_compress_array(self, img_array: np.ndarray, quality: int = 85) -> tuple:
+        """
+        Comprime e decomprime l'immagine in JPEG (unico attacco che richiede un codec)
         
-        # Converte in RGB se necessario
+        Returns:
+            (array decompresso, dimensione in byte del JPEG)
+        """
+        jpeg_bytes = self.encode_jpeg_array(img_array, quality)
+        return np.asarray(Image.open(BytesIO(jpeg_bytes)).convert('RGB')), len(jpeg_bytes)
+    
+    def encode_jpeg_array(self, img_array: np.ndarray, quality: int = 85) -> bytes:
+        image = Image.fromarray(img_array)
         if image.mode != 'RGB':
             image = image.convert('RGB')
         
@@ -356,6 +784,49 @@ class AdvancedWatermarking:
         image.save(output_buffer, format='JPEG', quality=quality, optimize=True)
         return output_buffer.getvalue()
     
+    def png_size_array(self, img_array: np.ndarray) -> int:
+        """Byte del PNG (impostazioni di default di Pillow) dell'array: il 'cropped_size' dei test di crop"""
+        output_buffer = BytesIO()
+        Image.fromarray(img_array).save(output_buffer, format='PNG')
+        return output_buffer.tell()
+    
+    def crop_array(self, img_array: np.ndarray, crop_percentage: float = 0.8) -> np.ndarray:
+        """Croppa dal centro mantenendo crop_percentage della dimensione originale"""
+        height, width = img_array.shape[:2]
+        new_width = int(width * crop_percentage)
+        new_height = int(height * crop_percentage)
+        
+        left = (width - new_width) // 2
+        top = (height - new_height) // 2
+        return img_array[top:top + new_height, left:left + new_width]
+    
+    def adjust_brightness_array(self, img_array: np.ndarray, brightness_factor: float = 1.2) -> np.ndarray:
+        enhancer = ImageEnhance.Brightness(Image.fromarray(img_array))
+        return np.asarray(enhancer.enhance(brightness_factor))
+    
+    def adjust_contrast_array(self, img_array: np.ndarray, contrast_factor: float = 1.2) -> np.ndarray:
+        enhancer = ImageEnhance.Contrast(Image.fromarray(img_array))
+        return np.asarray(enhancer.enhance(contrast_factor))
+    
+    def rotate_array(self, img_array: np.ndarray, angle: float = 5.0) -> np.ndarray:
+        rotated_image = Image.fromarray(img_array).rotate(angle, expand=False, fillcolor='white')
+        return np.asarray(rotated_image)
+    
+    def scale_array(self, img_array: np.ndarray, scale_factor: float = 0.8) -> np.ndarray:
+        """Scala l'immagine e poi la riporta alla dimensione originale"""
+        image = Image.fromarray(img_array)
+        original_size = image.size
+        new_width = int(original_size[0] * scale_factor)
+        new_height = int(original_size[1] * scale_factor)
+        scaled_down = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        
+        scaled_back = scaled_down.resize(original_size, Image.Resampling.LANCZOS)
+        return np.asarray(scaled_back)
+    
+    def apply_jpeg_compression(self, image_bytes: bytes, quality: int = 85) -> bytes:
+        """Applica compressione JPEG con la qualità specificata"""
+        return self.encode_jpeg_array(self._decode_array(image_bytes), quality)
+    
     def apply_crop(self, image_bytes: bytes, crop_percentage: float = 0.8) -> bytes:
         """
         Croppa l'immagine dal centro mantenendo una percentuale della dimensione originale
@@ -364,21 +835,7 @@ class AdvancedWatermarking:
             image_bytes: Bytes dell'immagine
             crop_percentage: Percentuale dell'immagine da mantenere (0.8 = 80%)
         """
-        image = Image.open(BytesIO(image_bytes))
-        width, height = image.size
-        new_width = int(width * crop_percentage)
-        new_height = int(height * crop_percentage)
-        
-        left = (width - new_width) // 2
-        top = (height - new_height) // 2
-        right = left + new_width
-        bottom = top + new_height
-        
-        cropped_image = image.crop((left, top, right, bottom))
-        
-        output_buffer = BytesIO()
-        cropped_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        return self._encode_array_png(self.crop_array(self._decode_array(image_bytes), crop_percentage))
     
     def apply_brightness_adjustment(self, image_bytes: bytes, brightness_factor: float = 1.2) -> bytes:
         """
@@ -388,13 +845,7 @@ class AdvancedWatermarking:
             image_bytes: Bytes dell'immagine
             brightness_factor: Fattore di luminosità (1.0 = originale, >1.0 = più luminosa, <1.0 = più scura)
         """
-        image = Image.open(BytesIO(image_bytes))
-        enhancer = ImageEnhance.Brightness(image)
-        brightened_image = enhancer.enhance(brightness_factor)
-        
-        output_buffer = BytesIO()
-        brightened_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        return self._encode_array_png(self.adjust_brightness_array(self._decode_array(image_bytes), brightness_factor))
     
     def apply_contrast_adjustment(self, image_bytes: bytes, contrast_factor: float = 1.2) -> bytes:
         """
@@ -404,13 +855,7 @@ class AdvancedWatermarking:
             image_bytes: Bytes dell'immagine
             contrast_factor: Fattore di contrasto (1.0 = originale, >1.0 = più contrasto, <1.0 = meno contrasto)
         """
-        image = Image.open(BytesIO(image_bytes))
-        enhancer = ImageEnhance.Contrast(image)
-        contrast_image = enhancer.enhance(contrast_factor)
-        
-        output_buffer = BytesIO()
-        contrast_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        return self._encode_array_png(self.adjust_contrast_array(self._decode_array(image_bytes), contrast_factor))
     
     def apply_rotation(self, image_bytes: bytes, angle: float = 5.0) -> bytes:
         """
@@ -420,12 +865,7 @@ class AdvancedWatermarking:
             image_bytes: Bytes dell'immagine
             angle: Angolo di rotazione in gradi
         """
-        image = Image.open(BytesIO(image_bytes))
-        rotated_image = image.rotate(angle, expand=False, fillcolor='white')
-        
-        output_buffer = BytesIO()
-        rotated_image.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        return self._encode_array_png(self.rotate_array(self._decode_array(image_bytes), angle))
     
     def apply_scaling(self, image_bytes: bytes, scale_factor: float = 0.8) -> bytes:
         """
@@ -435,45 +875,49 @@ class AdvancedWatermarking:
             image_bytes: Bytes dell'immagine
             scale_factor: Fattore di scala (0.8 = riduce all'80%, poi riporta alla dimensione originale)
         """
-        image = Image.open(BytesIO(image_bytes))
-        original_size = image.size
-        new_width = int(original_size[0] * scale_factor)
-        new_height = int(original_size[1] * scale_factor)
-        scaled_down = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        scaled_back = scaled_down.resize(original_size, Image.Resampling.LANCZOS)
-        
-        output_buffer = BytesIO()
-        scaled_back.save(output_buffer, format='PNG')
-        return output_buffer.getvalue()
+        return self._encode_array_png(self.scale_array(self._decode_array(image_bytes), scale_factor))
     
-    def test_crop_robustness(self, image_bytes: bytes, hidden_text: str, method: str = 'dct') -> dict:
-        """
-        Testa la robustezza del watermark contro il cropping
-        """
-        results = {}
-        crop_percentages = [0.95, 0.9, 0.85, 0.8, 0.75, 0.7, 0.65, 0.6, 0.55, 0.5]
+    def apply_watermark_array(self, img_array: np.ndarray, hidden_text: str, method: str) -> np.ndarray:
+        """Inserisce il watermark con il metodo indicato, interamente in memoria"""
+        if method == 'dct':
+            return self.apply_dct_watermark_array(img_array, hidden_text)
+        elif method == 'dft':
+            return self.apply_dft_watermark_array(img_array, hidden_text)
+        elif method == 'dwt':
+            return self.apply_dwt_watermark_array(img_array, hidden_text)
+        elif method == 'lsb':
+            return apply_lsb_watermark_array(img_array, hidden_text)
+        else:
+            raise ValueError(f"Metodo non supportato: {method}")
+    
+    def extract_watermark_array(self, img_array: np.ndarray, method: str) -> str:
         if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
+            return self.extract_dct_watermark_array(img_array)
+        elif method == 'dft':
+            return self.extract_dft_watermark_array(img_array)
         elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
+            return self.extract_dwt_watermark_array(img_array)
         elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
+            return extract_lsb_watermark_array(img_array)
         else:
             raise ValueError(f"Metodo non supportato: {method}")
+    
+    def test_crop_robustness(self, image_bytes: bytes, hidden_text: str, method: str = 'dct') -> dict:
+        """
+        Testa la robustezza del watermark contro il cropping
+        """
+        results = {}
+        crop_percentages = ROBUSTNESS_ATTACKS['crop']
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA CROP - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
         print("-" * 60)
         
         for crop_perc in crop_percentages:
-            cropped_image = self.apply_crop(watermarked_image, crop_perc)
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(cropped_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(cropped_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(cropped_image, 'lsb')
+            cropped_image = self.crop_array(watermarked_image, crop_perc)
+            extracted_text = self.extract_watermark_array(cropped_image, method)
 
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
@@ -482,7 +926,7 @@ class AdvancedWatermarking:
                 'extracted_text': extracted_text,
                 'accuracy': accuracy,
                 'success': success,
-                'cropped_size': len(cropped_image)
+                'cropped_size': self.png_size_array(cropped_image)
             }
             
             status = "✓ PASS" if success else "✗ FAIL"
@@ -495,16 +939,10 @@ class AdvancedWatermarking:
         Testa la robustezza del watermark contro le modifiche di luminosità
         """
         results = {}
-        brightness_factors = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 2.0]
+        brightness_factors = ROBUSTNESS_ATTACKS['brightness']
         
-        if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
-        elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
-        elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
-        else:
-            raise ValueError(f"Metodo non supportato: {method}")
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA LUMINOSITÀ - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
@@ -512,14 +950,8 @@ class AdvancedWatermarking:
         
         for brightness in brightness_factors:
            
-            bright_image = self.apply_brightness_adjustment(watermarked_image, brightness)
-            
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(bright_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(bright_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(bright_image, 'lsb')
+            bright_image = self.adjust_brightness_array(watermarked_image, brightness)
+            extracted_text = self.extract_watermark_array(bright_image, method)
          
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
@@ -541,29 +973,18 @@ class AdvancedWatermarking:
         Testa la robustezza del watermark contro le modifiche di contrasto
         """
         results = {}
-        contrast_factors = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 2.0]
+        contrast_factors = ROBUSTNESS_ATTACKS['contrast']
         
-        if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
-        elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
-        elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
-        else:
-            raise ValueError(f"Metodo non supportato: {method}")
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA CONTRASTO - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
         print("-" * 60)
         
         for contrast in contrast_factors:
-            contrast_image = self.apply_contrast_adjustment(watermarked_image, contrast)
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(contrast_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(contrast_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(contrast_image, 'lsb')
+            contrast_image = self.adjust_contrast_array(watermarked_image, contrast)
+            extracted_text = self.extract_watermark_array(contrast_image, method)
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
             
@@ -584,29 +1005,18 @@ class AdvancedWatermarking:
         Testa la robustezza del watermark contro la rotazione
         """
         results = {}
-        rotation_angles = [-10, -5, -3, -1, 0, 1, 3, 5, 10, 15, 20, 30, 45, 90]
+        rotation_angles = ROBUSTNESS_ATTACKS['rotation']
 
-        if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
-        elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
-        elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
-        else:
-            raise ValueError(f"Metodo non supportato: {method}")
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA ROTAZIONE - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
         print("-" * 60)
         
         for angle in rotation_angles:
-            rotated_image = self.apply_rotation(watermarked_image, angle)
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(rotated_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(rotated_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(rotated_image, 'lsb')
+            rotated_image = self.rotate_array(watermarked_image, angle)
+            extracted_text = self.extract_watermark_array(rotated_image, method)
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
             
@@ -626,28 +1036,17 @@ class AdvancedWatermarking:
         Testa la robustezza del watermark contro il ridimensionamento
         """
         results = {}
-        scale_factors = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5]
-        if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
-        elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
-        elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
-        else:
-            raise ValueError(f"Metodo non supportato: {method}")
+        scale_factors = ROBUSTNESS_ATTACKS['scaling']
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA SCALING - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
         print("-" * 60)
         
         for scale in scale_factors:
-            scaled_image = self.apply_scaling(watermarked_image, scale)
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(scaled_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(scaled_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(scaled_image, 'lsb')
+            scaled_image = self.scale_array(watermarked_image, scale)
+            extracted_text = self.extract_watermark_array(scaled_image, method)
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
             
@@ -668,28 +1067,17 @@ class AdvancedWatermarking:
         con diversi livelli di qualità
         """
         results = {}
-        quality_levels = [95, 90, 85, 80]
-        if method == 'dct':
-            watermarked_image = self.apply_dct_watermark(image_bytes, hidden_text)
-        elif method == 'dwt':
-            watermarked_image = self.apply_dwt_watermark(image_bytes, hidden_text)
-        elif method == 'lsb':
-            watermarked_image = apply_invisible_watermark_advanced(image_bytes, hidden_text, 'lsb')
-        else:
-            raise ValueError(f"Metodo non supportato: {method}")
+        quality_levels = ROBUSTNESS_ATTACKS['jpeg']
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_image = self.apply_watermark_array(source_array, hidden_text, method)
         
         print(f"\n=== TEST ROBUSTEZZA JPEG - Metodo: {method.upper()} ===")
         print(f"Testo nascosto: '{hidden_text}'")
         print("-" * 60)
         
         for quality in quality_levels:
-            compressed_image = self.apply_jpeg_compression(watermarked_image, quality)
-            if method == 'dct':
-                extracted_text = self.extract_dct_watermark(compressed_image)
-            elif method == 'dwt':
-                extracted_text = self.extract_dwt_watermark(compressed_image)
-            elif method == 'lsb':
-                extracted_text = extract_invisible_watermark_advanced(compressed_image, 'lsb')
+            compressed_image, compressed_size = self.jpeg_compress_array(watermarked_image, quality)
+            extracted_text = self.extract_watermark_array(compressed_image, method)
             accuracy = self.calculate_text_accuracy(hidden_text, extracted_text)
             success = extracted_text == hidden_text
             
@@ -697,14 +1085,59 @@ class AdvancedWatermarking:
                 'extracted_text': extracted_text,
                 'accuracy': accuracy,
                 'success': success,
-                'compressed_size': len(compressed_image)
+                'compressed_size': compressed_size
             }
             
             status = "✓ PASS" if success else "✗ FAIL"
-            print(f"Qualità {quality:2d}%: {status} | Estratto: '{extracted_text}' | Accuracy: {accuracy:.1f}% | Size: {len(compressed_image):,} bytes")
+            print(f"Qualità {quality:2d}%: {status} | Estratto: '{extracted_text}' | Accuracy: {accuracy:.1f}% | Size: {compressed_size:,} bytes")
         
         return results
     
+    def attack_array(self, img_array: np.ndarray, attack: str, param) -> tuple:
+        """
+        Applica uno degli attacchi di ROBUSTNESS_ATTACKS
+        
+        Returns:
+            (array attaccato, dict con le informazioni aggiuntive del test)
+        """
+        if attack == 'jpeg':
+            attacked, compressed_size = self.jpeg_compress_array(img_array, param)
+            return attacked, {'compressed_size': compressed_size}
+        elif attack == 'crop':
+            attacked = self.crop_array(img_array, param)
+            return attacked, {'cropped_size': self.png_size_array(attacked)}
+        elif attack == 'brightness':
+            return self.adjust_brightness_array(img_array, param), {}
+        elif attack == 'contrast':
+            return self.adjust_contrast_array(img_array, param), {}
+        elif attack == 'rotation':
+            return self.rotate_array(img_array, param), {}
+        elif attack == 'scaling':
+            return self.scale_array(img_array, param), {}
+        else:
+            raise ValueError(f"Attacco non supportato: {attack}")
+    
+    def run_attack_case(self, watermarked_array: np.ndarray, hidden_text: str, method: str, attack: str, param) -> dict:
+        """Esegue un singolo caso (attacco + estrazione) e ne misura il tempo"""
+        start = time.perf_counter()
+        attacked, extra = self.attack_array(watermarked_array, attack, param)
+        attacked_at = time.perf_counter()
+        extracted_text = self.extract_watermark_array(attacked, method)
+        end = time.perf_counter()
+        
+        result = {
+            'extracted_text': extracted_text,
+            'accuracy': self.calculate_text_accuracy(hidden_text, extracted_text),
+            'success': extracted_text == hidden_text
+        }
+        result.update(extra)
+        # Dimensione codificata per gli attacchi codec (JPEG), altrimenti byte dei pixel
+        result['output_bytes'] = extra.get('compressed_size', attacked.nbytes)
+        result['attack_ms'] = (attacked_at - start) * 1000
+        result['extract_ms'] = (end - attacked_at) * 1000
+        result['wall_time_ms'] = (end - start) * 1000
+        return result
+    
     def calculate_text_accuracy(self, original: str, extracted: str) -> float:
         """Calcola l'accuratezza tra testo originale e estratto"""
         if not original or not extracted:
@@ -718,11 +1151,14 @@ class AdvancedWatermarking:
     def run_comprehensive_robustness_test(self, image_bytes: bytes, test_texts: list = None) -> dict:
         """
         Esegue un test completo di robustezza per tutti i metodi e tutti i tipi di attacco
+
+        Se un metodo fallisce con un testo (es. messaggio troppo lungo per il
+        dft) il suo risultato è {'error': messaggio} invece degli attacchi.
         """
         if test_texts is None:
-            test_texts = ["Test per il waterarking"]
+            test_texts = [DEFAULT_ROBUSTNESS_TEXT]
         
-        methods = ['dct', 'dwt', 'lsb']
+        methods = ROBUSTNESS_METHODS
         all_results = {}
         
         print("=" * 80)
@@ -751,7 +1187,7 @@ class AdvancedWatermarking:
                     
                 except Exception as e:
                     print(f"Errore con metodo {method} e testo '{text}': {e}")
-                    text_results = {}
+                    text_results = {'error': str(e)}
                 
                 method_results[text] = text_results
             
@@ -761,18 +1197,88 @@ class AdvancedWatermarking:
         
         return all_results
     
+    def run_parallel_robustness_test(self, image_bytes: bytes, test_texts: list = None, max_workers: int = None,
+                                     verbose: bool = True) -> dict:
+        """
+        Versione parallela di run_comprehensive_robustness_test
+        
+        Il watermark viene inserito una sola volta per (metodo, testo); i casi
+        (metodo, attacco, parametro) sono distribuiti su un process pool che
+        condivide le immagini marcate. Restituisce lo stesso dizionario annidato,
+        con in più tempi ('embed_ms', 'attack_ms', 'extract_ms', 'wall_time_ms')
+        e 'output_bytes' per ogni caso. I fallimenti sono registrati come
+        {'error': messaggio}. Con verbose=False non stampa nulla.
+        """
+        if test_texts is None:
+            test_texts = [DEFAULT_ROBUSTNESS_TEXT]
+        
+        if verbose:
+            print("=" * 80)
+            print("TEST COMPLETO DI ROBUSTEZZA WATERMARK (PARALLELO)")
+            print("=" * 80)
+        
+        source_array = self.load_rgb_array(image_bytes, self.image_key(image_bytes))
+        watermarked_images = {}
+        embed_times = {}
+        all_results = {}
+        for method in ROBUSTNESS_METHODS:
+            all_results[method] = {}
+            for text in test_texts:
+                try:
+                    start = time.perf_counter()
+                    watermarked_images[(method, text)] = self.apply_watermark_array(source_array, text, method)
+                    embed_times[(method, text)] = (time.perf_counter() - start) * 1000
+                    all_results[method][text] = {attack: {} for attack in ROBUSTNESS_ATTACKS}
+                except Exception as e:
+                    if verbose:
+                        print(f"Errore con metodo {method} e testo '{text}': {e}")
+                    all_results[method][text] = {'error': str(e)}
+        
+        # Con "fork" le immagini passate all'initializer sono condivise senza copie
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                 initializer=_init_robustness_worker, initargs=(watermarked_images,)) as executor:
+            futures = {}
+            for (method, text) in watermarked_images:
+                for attack, params in ROBUSTNESS_ATTACKS.items():
+                    for param in params:
+                        future = executor.submit(_run_robustness_case, method, text, attack, param)
+                        futures[future] = (method, text, attack, param)
+            
+            for future, (method, text, attack, param) in futures.items():
+                text_results = all_results[method][text]
+                if 'error' in text_results:
+                    continue
+                try:
+                    case_result = future.result()
+                    case_result['embed_ms'] = embed_times[(method, text)]
+                    text_results[attack][param] = case_result
+                except Exception as e:
+                    if verbose:
+                        print(f"Errore con metodo {method} e testo '{text}': {e}")
+                    all_results[method][text] = {'error': str(e)}
+        
+        if verbose:
+            self.generate_comprehensive_summary_report(all_results)
+        
+        return all_results
+    
     def generate_comprehensive_summary_report(self, results: dict):
         """Genera un report riassuntivo completo dei risultati"""
         print("\n" + "=" * 80)
         print("REPORT RIASSUNTIVO COMPLETO")
         print("=" * 80)
         
-        attack_types = ['jpeg', 'crop', 'brightness', 'contrast', 'rotation', 'scaling']
+        attack_types = list(ROBUSTNESS_ATTACKS)
         
         for method in results.keys():
             print(f"\n{method.upper()} - Robustezza per tipo di attacco:")
             print("-" * 50)
             
+            for text, text_results in results[method].items():
+                if 'error' in text_results:
+                    print(f"  Errore con il testo '{text}': {text_results['error']}")
+            
             for attack_type in attack_types:
                 attack_success = {}
                 total_tests = 0
@@ -819,44 +1325,120 @@ class AdvancedWatermarking:
             print(f"{i}. {method.upper()}: {score:.1f}% successi complessivi")
 
 
-def apply_invisible_watermark_advanced(image_bytes: bytes, hidden_text: str, method: str = 'dct') -> bytes:
+_robustness_images = {}
+
+
+def _init_robustness_worker(images: dict):
+    global _robustness_images
+    _robustness_images = images
+
+
+def _run_robustness_case(method: str, hidden_text: str, attack: str, param) -> dict:
+    watermarker = AdvancedWatermarking()
+    return watermarker.run_attack_case(_robustness_images[(method, hidden_text)], hidden_text, method, attack, param)
+
+
+def apply_lsb_watermark_image(input_image: Image.Image, hidden_text: str) -> Image.Image:
+    if input_image.mode not in ('RGB', 'RGBA'):
+        input_image = input_image.convert('RGB')
+    encoded = hide_lsb(np.asarray(input_image), hidden_text)
+    # Copia dell'immagine originale per conservarne modo e metadati
+    secret = input_image.copy()
+    secret.frombytes(encoded.tobytes())
+    return secret
+
+
+def extract_lsb_watermark_image(input_image: Image.Image) -> str:
+    if input_image.mode not in ('RGB', 'RGBA'):
+        return ""
+    return reveal_lsb(np.asarray(input_image))
+
+
+def apply_lsb_watermark_array(img_array: np.ndarray, hidden_text: str) -> np.ndarray:
+    return hide_lsb(img_array, hidden_text)
+
+
+def extract_lsb_watermark_array(img_array: np.ndarray) -> str:
+    if img_array.ndim != 3 or img_array.shape[2] < 3:
+        return ""
+    return reveal_lsb(img_array)
+
+
+def payload_bits(hidden_text: str, method: str = 'dct') -> int:
+    """Bit scritti nell'immagine per hidden_text con il metodo indicato, header compreso"""
+    if method == 'lsb':
+        return len(lsb_payload_bits(hidden_text)) if hidden_text else 0
+    if method == 'dft':
+        return len(AdvancedWatermarking()._dft_message_bits(hidden_text))
+    return len(AdvancedWatermarking()._message_bits(hidden_text))
+
+
+def dft_max_message_bytes() -> int:
+    """Byte UTF-8 massimi di un messaggio dft con la parità configurata (WATERMARK_DFT_ECC_PARITY)"""
+    return max_message_bytes(DFT_CAPACITY, AdvancedWatermarking().dft_ecc)
+
+
+def _check_key(method: str, key: str = None):
+    if key and method not in KEYED_METHODS:
+        raise ValueError(f"Il metodo {method} non accetta una chiave: usare {' o '.join(KEYED_METHODS)}")
+
+
+def apply_invisible_watermark_advanced(image_bytes: bytes, hidden_text: str, method: str = DEFAULT_INVISIBLE_METHOD,
+                                       output: OutputFormat = None, key: str = None) -> bytes:
+    """Con key (solo dct e dwt) i bit vanno in blocchi/coefficienti scelti dalla chiave"""
+    if output is not None and output.lossy and method not in LOSSY_OUTPUT_METHODS:
+        raise ValueError(f"Il metodo {method} non sopravvive all'output {output.format}: usare png o webp")
+    _check_key(method, key)
+    
     if method == 'lsb':
-        from stegano import lsb
         input_image = Image.open(BytesIO(image_bytes))
-        output_path = BytesIO()
-        secret = lsb.hide(input_image, hidden_text)
-        secret.save(output_path, format="PNG")
-        return output_path.getvalue()
+        with stage('decode_pixels'):
+            input_image.load()
+        with stage('embed'):
+            secret = apply_lsb_watermark_image(input_image, hidden_text)
+        return encode_image(secret, output)
     
-    watermarker = AdvancedWatermarking()
+    watermarker = AdvancedWatermarking(key)
     
     if method == 'dct':
-        return watermarker.apply_dct_watermark(image_bytes, hidden_text)
+        return watermarker.apply_dct_watermark(image_bytes, hidden_text, output)
+    elif method == 'dft':
+        return watermarker.apply_dft_watermark(image_bytes, hidden_text, output)
     elif method == 'dwt':
-        return watermarker.apply_dwt_watermark(image_bytes, hidden_text)
+        return watermarker.apply_dwt_watermark(image_bytes, hidden_text, output)
     elif method == 'robust':
-        return watermarker.apply_robust_watermark(image_bytes, hidden_text)
+        return watermarker.apply_robust_watermark(image_bytes, hidden_text, output)
     else:
         raise ValueError(f"Metodo non supportato: {method}")
 
 
-def extract_invisible_watermark_advanced(image_bytes: bytes, method: str = 'dct') -> str:
-    if method == 'lsb':
-        from stegano import lsb
-        input_image = Image.open(BytesIO(image_bytes))
-        try:
-            result = lsb.reveal(input_image)
-            return result if result else ""
-        except:
-            return ""
+def extract_invisible_watermark_advanced(image_bytes: bytes, method: str = 'dct', key: str = None) -> str:
+    return extract_invisible_watermark_details(image_bytes, method, key)[0]
+
+
+def extract_invisible_watermark_details(image_bytes: bytes, method: str = 'dct', key: str = None) -> tuple:
+    """
+    Testo estratto e metodo che l'ha letto
     
-    watermarker = AdvancedWatermarking()
+    Per robust il metodo è 'dct' o 'dwt' (quello con il payload valido),
+    per gli altri è method; None se non è stato trovato nulla. key deve
+    essere la chiave usata per inserire il watermark.
+    """
+    _check_key(method, key)
+    if method == 'robust':
+        return AdvancedWatermarking().extract_robust_watermark(image_bytes)
     
-    if method == 'dct':
-        return watermarker.extract_dct_watermark(image_bytes)
-    elif method == 'dwt':
-        return watermarker.extract_dwt_watermark(image_bytes)
-    elif method == 'robust':
-        return watermarker.extract_robust_watermark(image_bytes)
+    if method == 'lsb':
+        text = extract_lsb_watermark_image(Image.open(BytesIO(image_bytes)))
     else:
-        return ""
+        watermarker = AdvancedWatermarking(key)
+        
+        if method == 'dct':
+            text = watermarker.extract_dct_watermark(image_bytes)
+        elif method == 'dft':
+            text = watermarker.extract_dft_watermark(image_bytes)
+        elif method == 'dwt':
+            text = watermarker.extract_dwt_watermark(image_bytes)
+        else:
+            text = ""
+    return text, (method if text else None)
@@ -0,0 +1,109 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from .payload import HEADER_BITS, decode_payload, majority_vote, read_header
+
+
+# Copie del payload sparse sulle posizioni della chiave (voto di maggioranza in
+# lettura): più copie resistono a danni più estesi ma modificano più blocchi.
+# Non è nell'header, quindi cambiarlo rende illeggibili le immagini già marcate
+KEY_COPIES = 3
+
+
+def _key_stream(key: str):
+    """
+    Interi a 64 bit da SHA-256(chiave || contatore): non dipendono dalla versione di numpy
+
+    I generatori di numpy (e Generator.choice) possono cambiare sequenza tra
+    una versione e l'altra, rendendo illeggibili le immagini già marcate.
+    """
+    key_bytes = key.encode('utf-8')
+    counter = 0
+    while True:
+        digest = hashlib.sha256(key_bytes + counter.to_bytes(8, 'big')).digest()
+        for offset in range(0, len(digest), 8):
+            yield int.from_bytes(digest[offset:offset + 8], 'big')
+        counter += 1
+
+
+def _uniform_below(stream, bound: int) -> int:
+    """Intero uniforme in [0, bound), scartando i valori oltre l'ultimo multiplo di bound"""
+    limit = (1 << 64) - (1 << 64) % bound
+    while True:
+        value = next(stream)
+        if value < limit:
+            return value % bound
+
+
+@lru_cache(maxsize=64)
+def key_positions(key: str, shape: tuple, count: int) -> np.ndarray:
+    """
+    Prime count posizioni (indici piatti in shape) della permutazione pseudocasuale data dalla chiave
+
+    Fisher-Yates parziale sul flusso di _key_stream: si fanno solo count
+    scambi, tenendo in un dizionario le posizioni spostate, senza permutare
+    tutto. Lo stesso (key, shape, count) produce sempre le stesse posizioni;
+    il risultato è in cache ed è in sola lettura.
+
+    Le posizioni dipendono da shape (griglia dei blocchi o sottobanda), quindi
+    un ritaglio o un ridimensionamento le cambia e il watermark con chiave non
+    si rilegge più.
+    """
+    size = int(np.prod(shape))
+    count = min(count, size)
+    stream = _key_stream(key)
+    moved = {}
+    positions = np.empty(count, dtype=np.intp)
+    for i in range(count):
+        j = i + _uniform_below(stream, size - i)
+        positions[i] = moved.get(j, j)
+        moved[j] = moved.get(i, i)
+    positions.flags.writeable = False
+    return positions
+
+
+def spread_payload(bits: np.ndarray, capacity: int):
+    """
+    Bit da scrivere nelle prime posizioni della chiave: KEY_COPIES copie dell'header, poi
+    il resto del payload ripetuto fino a KEY_COPIES volte, finché entra in capacity
+
+    L'header sta in testa con un numero fisso di copie perché va letto prima
+    di sapere quanto è lungo il resto.
+
+    Returns:
+        Array di bit, None se nemmeno una copia del payload entra
+    """
+    header, body = bits[:HEADER_BITS], bits[HEADER_BITS:]
+    free = capacity - KEY_COPIES * HEADER_BITS
+    if len(body) == 0 or free < len(body):
+        return None
+    return np.concatenate([np.tile(header, KEY_COPIES), np.tile(body, _body_copies(free, len(body)))])
+
+
+def _body_copies(free: int, body_bits: int) -> int:
+    return min(KEY_COPIES, free // body_bits)
+
+
+def read_spread_payload(read, capacity: int):
+    """
+    Testo scritto da spread_payload, con voto di maggioranza tra le copie
+
+    read(start, count) restituisce i bit (o i voti (..., count), es. uno per
+    canale) delle posizioni [start, start + count).
+
+    Returns:
+        Il testo, None se header, correzione o CRC non sono validi
+    """
+    header_span = KEY_COPIES * HEADER_BITS
+    if capacity < header_span:
+        return None
+    header_votes = read(0, header_span).reshape(-1, HEADER_BITS)
+    header = read_header(majority_vote(header_votes), capacity - header_span + HEADER_BITS)
+    if header is None:
+        return None
+
+    copies = _body_copies(capacity - header_span, header.body_bits)
+    body_votes = read(header_span, copies * header.body_bits).reshape(-1, header.body_bits)
+    return decode_payload(majority_vote(body_votes), header)
@@ -1,23 +1,74 @@
 from PIL import Image, ImageDraw
 from io import BytesIO
+import numpy as np
+from .encoder import OutputFormat, encode_image
+from .cache import image_cache, content_key
+from .logo_store import RegisteredLogo, logo_store
+from .timing import stage
 
-def apply_logo_watermark(image_bytes: bytes, logo_bytes: bytes, position: str = "bottom-right", opacity: float = 0.7, size: float = 0.1) -> bytes:
-    img = Image.open(BytesIO(image_bytes)).convert("RGBA")
-    
-    logo = Image.open(BytesIO(logo_bytes)).convert("RGBA")
-    
-    logo_width = int(img.width * size)
+
+def _opacity_lut(opacity: float) -> np.ndarray:
+    """Tabella 0-255 -> int(p * opacity), la stessa funzione usata prima con alpha.point"""
+    return np.clip([int(p * opacity) for p in range(256)], 0, 255).astype(np.uint8)
+
+
+def prepare_logo(logo, logo_width: int, opacity: float) -> np.ndarray:
+    """Logo RGBA ridimensionato (LANCZOS) a logo_width e con l'opacità applicata all'alpha"""
+    if isinstance(logo, RegisteredLogo):
+        logo = Image.fromarray(logo.pixels, "RGBA")
+    else:
+        logo = Image.open(BytesIO(logo)).convert("RGBA")
     logo_height = int(logo.height * (logo_width / logo.width))
-    
     logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-  
+
+    pixels = np.array(logo)
     if opacity < 1.0:
-        alpha = logo.split()[-1]  
-        alpha = alpha.point(lambda p: int(p * opacity))
-        logo.putalpha(alpha)
+        pixels[:, :, 3] = _opacity_lut(opacity)[pixels[:, :, 3]]
+    return pixels
+
+
+def scaled_logo(logo, logo_width: int, opacity: float) -> Image.Image:
+    """
+    Logo pronto da incollare, in cache per (hash del logo, larghezza, opacità)
+
+    logo può essere un file (bytes), un RegisteredLogo o l'ID di un logo
+    registrato. L'ID è lo stesso hash dei byte, quindi le due forme
+    condividono la cache. Nei batch con lo stesso logo decodifica e resize
+    avvengono una volta sola.
+    """
+    if isinstance(logo, str):
+        logo_key = logo
+    elif isinstance(logo, RegisteredLogo):
+        logo_key = logo.logo_id
+    else:
+        logo_key = content_key(logo)
+
+    def compute():
+        # Con un ID il logo registrato viene letto solo se manca la versione scalata
+        return prepare_logo(logo_store.get(logo) if isinstance(logo, str) else logo, logo_width, opacity)
+
+    pixels = image_cache.get_or_compute((logo_key, 'logo', logo_width, opacity), compute)
+    return Image.fromarray(pixels, "RGBA")
+
+
+def apply_logo_watermark(image_bytes: bytes, logo_bytes, position: str = "bottom-right", opacity: float = 0.7, size: float = 0.1,
+                         output: OutputFormat = None) -> bytes:
+    # logo_bytes: file del logo, ID di un logo registrato o RegisteredLogo
+    img = Image.open(BytesIO(image_bytes))
+    # paste fonde solo i canali RGB nel rettangolo del logo: l'alpha della base non serve
+    with stage('decode_pixels'):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        else:
+            # Caricata prima di paste, che altrimenti ne farebbe una copia intera
+            img.load()
+
+    logo_width = int(img.width * size)
+    logo = scaled_logo(logo_bytes, logo_width, opacity)
+    logo_height = logo.height
 
     margin = 20
-    
+
     positions = {
         "top-left": (margin, margin),
         "top-right": (img.width - logo_width - margin, margin),
@@ -25,11 +76,10 @@ def apply_logo_watermark(image_bytes: bytes, logo_bytes: bytes, position: str =
         "bottom-right": (img.width - logo_width - margin, img.height - logo_height - margin),
         "center": ((img.width - logo_width) // 2, (img.height - logo_height) // 2)
     }
-    
+
     pos = positions.get(position, positions["bottom-right"])
 
-    img.paste(logo, pos, logo)
+    with stage('embed'):
+        img.paste(logo, pos, logo)
 
-    output = BytesIO()
-    img.convert("RGB").save(output, format="PNG")
-    return output.getvalue()
\ No newline at end of file
+    return encode_image(img, output)
@@ -0,0 +1,155 @@
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .cache import ArrayCache, content_key
+
+
+_LOGO_ID = re.compile(r'[0-9a-f]{64}')
+
+
+@dataclass(frozen=True)
+class RegisteredLogo:
+    """Logo registrato: ID (SHA-256 dei byte caricati) e pixel RGBA decodificati"""
+    logo_id: str
+    pixels: np.ndarray
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+
+def decode_logo(logo_bytes: bytes) -> np.ndarray:
+    try:
+        logo = Image.open(BytesIO(logo_bytes)).convert("RGBA")
+    except (OSError, SyntaxError):
+        raise ValueError("Logo non valido: il file non è un'immagine leggibile")
+    return np.asarray(logo)
+
+
+class LogoStore:
+    """
+    Loghi registrati una volta e poi richiamati per ID
+
+    L'ID è l'hash SHA-256 dei byte caricati, quindi registrare due volte lo
+    stesso file restituisce lo stesso ID. I loghi sono tenuti decodificati
+    (RGBA) in una LRU limitata in byte: quelli usati meno di recente vengono
+    dimenticati per primi.
+
+    Con directory impostata i loghi sono anche salvati come PNG: sopravvivono
+    ai riavvii e sono leggibili da tutti i processi del pool. La directory ha
+    lo stesso limite in byte e i file meno usati (per mtime) vengono cancellati.
+    """
+
+    def __init__(self, max_bytes: int, directory: str = None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._decoded = ArrayCache(max_bytes)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'LogoStore':
+        return cls(int(float(os.environ.get('WATERMARK_LOGO_STORE_MB', '64')) * 1024 * 1024),
+                   os.environ.get('WATERMARK_LOGO_DIR') or None)
+
+    def _path(self, logo_id: str) -> str:
+        return os.path.join(self.directory, f"{logo_id}.png")
+
+    def register(self, logo_bytes: bytes) -> RegisteredLogo:
+        """Decodifica e salva il logo; ValueError se non è un'immagine o supera il limite"""
+        logo_id = content_key(logo_bytes)
+        pixels = decode_logo(logo_bytes)
+        if pixels.nbytes > self.max_bytes:
+            raise ValueError(f"Logo troppo grande: {pixels.nbytes} byte decodificati, limite {self.max_bytes}")
+
+        if self.directory:
+            path = self._path(logo_id)
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                self._write_png(path, pixels)
+                self._evict_files()
+        return RegisteredLogo(logo_id, self._decoded.put(logo_id, pixels))
+
+    def get(self, logo_id: str) -> RegisteredLogo:
+        """Logo registrato; KeyError se l'ID non esiste o è stato rimosso"""
+        if not _LOGO_ID.fullmatch(logo_id or ''):
+            raise KeyError(logo_id)
+        pixels = self._decoded.get(logo_id)
+        if pixels is None and self.directory:
+            path = self._path(logo_id)
+            try:
+                with open(path, 'rb') as logo_file:
+                    pixels = np.asarray(Image.open(logo_file).convert("RGBA"))
+                os.utime(path)
+            except FileNotFoundError:
+                raise KeyError(logo_id)
+            pixels = self._decoded.put(logo_id, pixels)
+        if pixels is None:
+            raise KeyError(logo_id)
+        return RegisteredLogo(logo_id, pixels)
+
+    def delete(self, logo_id: str) -> bool:
+        if not _LOGO_ID.fullmatch(logo_id or ''):
+            return False
+        deleted = self._decoded.discard(logo_id)
+        if self.directory:
+            try:
+                os.remove(self._path(logo_id))
+                deleted = True
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def _write_png(self, path: str, pixels: np.ndarray):
+        # Scrittura atomica: gli altri processi vedono il file intero o nessun file
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                Image.fromarray(pixels, "RGBA").save(temp_file, format="PNG")
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _stored_files(self) -> list:
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png') and _LOGO_ID.fullmatch(entry.name[:-4]):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+        return files
+
+    def _evict_files(self):
+        files = sorted(self._stored_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, logo_id in files:
+            if total <= self.max_bytes:
+                break
+            self.delete(logo_id)
+            total -= size
+
+    def stats(self) -> dict:
+        stats = {"memory": self._decoded.stats(), "max_bytes": self.max_bytes, "directory": self.directory}
+        if self.directory:
+            files = self._stored_files()
+            stats["files"] = len(files)
+            stats["file_bytes"] = sum(size for _, size, _ in files)
+        return stats
+
+
+# Store del processo (WATERMARK_LOGO_DIR per renderlo persistente e condiviso tra i worker)
+logo_store = LogoStore.from_env()
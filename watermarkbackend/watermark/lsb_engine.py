@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Lunghezza massima del prefisso "<n>:" letto prima di rinunciare
+_MAX_PREFIX_BYTES = 24
+
+
+def _payload_bits(message: str) -> np.ndarray:
+    """Bit del payload nel formato di stegano: "<byte>:" + messaggio UTF-8, a gruppi di 3"""
+    message_bytes = message.encode('utf-8')
+    payload = str(len(message_bytes)).encode('ascii') + b':' + message_bytes
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    padding = (3 - len(bits) % 3) % 3
+    return np.concatenate([bits, np.zeros(padding, dtype=np.uint8)])
+
+
+def hide_lsb(img_array: np.ndarray, message: str) -> np.ndarray:
+    """
+    Nasconde il messaggio nei bit meno significativi di R, G, B
+
+    Compatibile con stegano.lsb.hide: stessi pixel in raster order, stesso
+    prefisso di lunghezza. Il canale alpha (se presente) non viene toccato.
+    """
+    if not message:
+        raise ValueError("Il messaggio da nascondere è vuoto")
+
+    bits = _payload_bits(message)
+    height, width, channels = img_array.shape
+    if len(bits) > height * width * 3:
+        raise ValueError(f"Messaggio troppo lungo: {len(message.encode('utf-8'))} byte")
+
+    encoded = np.array(img_array, dtype=np.uint8)
+    pixels = encoded.reshape(-1, channels)[:len(bits) // 3, :3]
+    pixels &= 0xFE
+    pixels |= bits.reshape(-1, 3)
+    return encoded
+
+
+def _lsb_bytes(img_array: np.ndarray, start: int, count: int) -> bytes:
+    """Legge count byte dal flusso dei bit meno significativi a partire dal byte start"""
+    channels = img_array.shape[2]
+    first_bit, last_bit = start * 8, (start + count) * 8
+    first_pixel, last_pixel = first_bit // 3, -(-last_bit // 3)
+
+    pixels = img_array.reshape(-1, channels)[first_pixel:last_pixel, :3]
+    bits = (pixels & 1).reshape(-1)[first_bit - first_pixel * 3:last_bit - first_pixel * 3]
+    return np.packbits(bits).tobytes()
+
+
+def reveal_lsb(img_array: np.ndarray) -> str:
+    """
+    Legge un messaggio scritto da hide_lsb o da stegano.lsb.hide
+
+    Legge solo il prefisso e poi i byte del messaggio; restituisce "" se
+    l'immagine non contiene un messaggio valido.
+
+    Le versioni di stegano precedenti alla 1.0 scrivevano il numero di
+    caratteri e ogni carattere come ord(c) in 8 bit: il prefisso conta
+    comunque i byte, ma un testo non ASCII non è UTF-8 valido e viene letto
+    un byte per carattere.
+    """
+    height, width, channels = img_array.shape
+    available = (height * width * 3) // 8
+
+    header = _lsb_bytes(img_array, 0, min(_MAX_PREFIX_BYTES, available))
+    separator = header.find(b':')
+    if separator <= 0 or not header[:separator].isdigit():
+        return ""
+
+    message_length = int(header[:separator])
+    if separator + 1 + message_length > available:
+        return ""
+
+    message_bytes = _lsb_bytes(img_array, separator + 1, message_length)
+    try:
+        return message_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return message_bytes.decode('latin-1')
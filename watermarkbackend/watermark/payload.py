@@ -0,0 +1,159 @@
+import binascii
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+from .ecc import NoCode, ReedSolomon, make_code
+
+
+# Header: lunghezza del messaggio in byte (2), parità per blocco con il flag
+# di interleaving nel bit alto (1) e byte di dati per blocco (1), protetto da
+# un suo Reed-Solomon che corregge fino a due byte sbagliati
+HEADER_BYTES = 4
+_HEADER_CODE = ReedSolomon(parity=4, block=HEADER_BYTES, interleave=False)
+HEADER_BITS = _HEADER_CODE.encoded_size(HEADER_BYTES) * 8
+# CRC-16 CCITT dei byte del messaggio, codificato insieme al messaggio
+CRC_BYTES = 2
+
+# Formato precedente, ancora letto per le immagini già marcate: 32 bit con la
+# lunghezza in bit del messaggio, poi 8 bit per carattere (solo ASCII stampabile)
+LEGACY_LENGTH_BITS = 32
+LEGACY_MAX_MESSAGE_BITS = 1000
+
+
+@dataclass(frozen=True)
+class PayloadHeader:
+    """Contenuto dell'header: quanti byte ha il messaggio e con quale codice è protetto"""
+    message_bytes: int
+    code: object
+
+    @property
+    def body_bits(self) -> int:
+        """Bit dopo l'header: messaggio e CRC codificati"""
+        return self.code.encoded_size(self.message_bytes + CRC_BYTES) * 8
+
+    @property
+    def payload_bits(self) -> int:
+        return HEADER_BITS + self.body_bits
+
+
+def text_bits(text: str) -> np.ndarray:
+    """Bit (0/1, uint8) del testo codificato in UTF-8"""
+    return np.unpackbits(np.frombuffer(text.encode('utf-8'), dtype=np.uint8))
+
+
+def bits_text(bits: np.ndarray) -> str:
+    """Testo UTF-8 dai bit; i byte non validi diventano U+FFFD"""
+    return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes().decode('utf-8', errors='replace')
+
+
+def _bits_bytes(bits: np.ndarray) -> bytes:
+    return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
+
+
+def encode_payload(text: str, code=None) -> np.ndarray:
+    """
+    Header protetto, poi messaggio UTF-8 e CRC codificati con code, come array di bit uint8
+
+    code è un codice di ecc (ReedSolomon, NoCode); senza code il messaggio
+    non ha ridondanza.
+    """
+    code = code or NoCode()
+    message = text.encode('utf-8')
+    if len(message) > 0xFFFF:
+        raise ValueError(f"Messaggio troppo lungo: {len(message)} byte")
+    if code.parity > 0x7F:
+        raise ValueError(f"Al massimo 127 byte di parità per blocco, non {code.parity}")
+    header = struct.pack('>HBB', len(message), code.parity | (0x80 if code.interleave else 0), code.block)
+    body = message + binascii.crc_hqx(message, 0).to_bytes(CRC_BYTES, 'big')
+    return np.unpackbits(np.frombuffer(_HEADER_CODE.encode(header) + code.encode(body), dtype=np.uint8))
+
+
+def read_header(bits: np.ndarray, max_bits: int):
+    """
+    Header dai primi HEADER_BITS bit
+
+    Returns:
+        PayloadHeader, oppure None se l'header non si corregge, descrive un
+        codice non valido o un payload vuoto o più lungo di max_bits
+    """
+    if len(bits) < HEADER_BITS:
+        return None
+    header = _HEADER_CODE.decode(_bits_bytes(bits[:HEADER_BITS]), HEADER_BYTES)
+    if header is None:
+        return None
+    message_bytes, parity, block = struct.unpack('>HBB', header)
+    if parity == 0 and block != 0:
+        return None
+    try:
+        code = make_code(parity & 0x7F, block, bool(parity & 0x80))
+    except ValueError:
+        return None
+    payload_header = PayloadHeader(message_bytes, code)
+    if message_bytes == 0 or payload_header.payload_bits > max_bits:
+        return None
+    return payload_header
+
+
+def decode_payload(bits: np.ndarray, header: PayloadHeader):
+    """
+    Testo dai bit che seguono l'header
+
+    Returns:
+        Il testo, oppure None se il codice non riesce a correggere i bit o
+        il CRC non corrisponde
+    """
+    if len(bits) < header.body_bits:
+        return None
+    body = header.code.decode(_bits_bytes(bits[:header.body_bits]), header.message_bytes + CRC_BYTES)
+    if body is None:
+        return None
+    message, checksum = body[:-CRC_BYTES], body[-CRC_BYTES:]
+    if binascii.crc_hqx(message, 0) != int.from_bytes(checksum, 'big'):
+        return None
+    return message.decode('utf-8', errors='replace')
+
+
+def read_legacy_length(bits: np.ndarray):
+    """Lunghezza in bit del messaggio nel formato precedente, None se non è valida"""
+    if len(bits) < LEGACY_LENGTH_BITS:
+        return None
+    length = int.from_bytes(_bits_bytes(bits[:LEGACY_LENGTH_BITS]), 'big')
+    if length <= 0 or length > LEGACY_MAX_MESSAGE_BITS:
+        return None
+    return length
+
+
+def legacy_text(bits: np.ndarray):
+    """
+    Testo nel formato precedente dai bit del messaggio
+
+    Come il vecchio binary_to_text tiene solo i caratteri ASCII stampabili.
+
+    Returns:
+        Il testo, None se non contiene caratteri stampabili
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    codes = np.packbits(bits[:len(bits) - len(bits) % 8])
+    text = codes[(codes >= 32) & (codes <= 126)].tobytes().decode('ascii')
+    return text or None
+
+
+def max_message_bytes(capacity_bits: int, code) -> int:
+    """Byte di messaggio più lungo che entra in capacity_bits con code (0 se non entra nulla)"""
+    length = max(0, (capacity_bits - HEADER_BITS) // 8 - CRC_BYTES)
+    while length > 0 and PayloadHeader(length, code).payload_bits > capacity_bits:
+        length -= 1
+    return length
+
+
+def repeat_bits(bits: np.ndarray, copies: int) -> np.ndarray:
+    """Ogni bit ripetuto copies volte di fila"""
+    return np.repeat(np.asarray(bits, dtype=np.uint8), copies)
+
+
+def majority_vote(votes: np.ndarray, axis: int = 0) -> np.ndarray:
+    """1 dove più della metà dei voti lungo axis vale 1 (a parità vince 0)"""
+    votes = np.asarray(votes)
+    return (np.count_nonzero(votes, axis=axis) * 2 > votes.shape[axis]).astype(np.uint8)
@@ -0,0 +1,136 @@
+"""
+Report strutturato dei test di robustezza
+
+Uso da riga di comando (dalla cartella watermarkbackend):
+
+    python -m watermark.report immagini/ --jsonl risultati.jsonl --csv risultati.csv
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass, asdict, fields
+
+from .invisible import DEFAULT_ROBUSTNESS_TEXT, AdvancedWatermarking
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+
+@dataclass
+class RobustnessCase:
+    """Risultato di un singolo caso (immagine, metodo, testo, attacco, parametro)"""
+    image: str
+    method: str
+    text: str
+    attack: str
+    parameter: float
+    success: bool
+    accuracy: float
+    extracted_text: str
+    output_bytes: int
+    embed_ms: float
+    attack_ms: float
+    extract_ms: float
+    error: str = ''
+
+
+def cases_from_results(results: dict, image_name: str) -> list:
+    """
+    Converte il dizionario annidato di run_parallel_robustness_test in una lista di casi
+
+    Un metodo fallito con un testo diventa un solo caso senza attacco, con success
+    False e il messaggio in error, così non sparisce dal report.
+    """
+    cases = []
+    for method, method_results in results.items():
+        for text, text_results in method_results.items():
+            if 'error' in text_results:
+                cases.append(RobustnessCase(
+                    image=image_name,
+                    method=method,
+                    text=text,
+                    attack='',
+                    parameter=None,
+                    success=False,
+                    accuracy=0.0,
+                    extracted_text='',
+                    output_bytes=0,
+                    embed_ms=0.0,
+                    attack_ms=0.0,
+                    extract_ms=0.0,
+                    error=text_results['error'],
+                ))
+                continue
+            for attack, attack_results in text_results.items():
+                for parameter, result in attack_results.items():
+                    cases.append(RobustnessCase(
+                        image=image_name,
+                        method=method,
+                        text=text,
+                        attack=attack,
+                        parameter=parameter,
+                        success=result['success'],
+                        accuracy=result['accuracy'],
+                        extracted_text=result['extracted_text'],
+                        output_bytes=result.get('output_bytes', 0),
+                        embed_ms=result.get('embed_ms', 0.0),
+                        attack_ms=result.get('attack_ms', 0.0),
+                        extract_ms=result.get('extract_ms', 0.0),
+                    ))
+    return cases
+
+
+def write_jsonl(cases: list, path: str):
+    with open(path, 'w', encoding='utf-8') as output:
+        for case in cases:
+            output.write(json.dumps(asdict(case), ensure_ascii=False) + '\n')
+
+
+def write_csv(cases: list, path: str):
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=[field.name for field in fields(RobustnessCase)])
+        writer.writeheader()
+        for case in cases:
+            writer.writerow(asdict(case))
+
+
+def run_directory(directory: str, test_texts: list, max_workers: int = None) -> list:
+    """Esegue la suite di robustezza su tutte le immagini della cartella"""
+    watermarker = AdvancedWatermarking()
+    cases = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(directory, name), 'rb') as image_file:
+            image_bytes = image_file.read()
+        results = watermarker.run_parallel_robustness_test(image_bytes, test_texts, max_workers, verbose=False)
+        cases.extend(cases_from_results(results, name))
+    return cases
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Test di robustezza dei watermark su una cartella di immagini")
+    parser.add_argument('directory', help="Cartella con le immagini da testare")
+    parser.add_argument('--text', action='append', dest='texts', help="Testo da nascondere (ripetibile)")
+    parser.add_argument('--workers', type=int, default=None, help="Numero di processi (default: numero di CPU)")
+    parser.add_argument('--jsonl', help="File JSON Lines di output")
+    parser.add_argument('--csv', help="File CSV di output")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cases = run_directory(args.directory, args.texts or [DEFAULT_ROBUSTNESS_TEXT], args.workers)
+    elapsed = time.perf_counter() - start
+
+    if args.jsonl:
+        write_jsonl(cases, args.jsonl)
+    if args.csv:
+        write_csv(cases, args.csv)
+
+    successes = sum(1 for case in cases if case.success)
+    print(f"{len(cases)} casi, {successes} successi, {elapsed:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import struct
+import zlib
+
+import numpy as np
+import pywt
+from PIL import Image
+
+from .dct_engine import apply_dct_blocks
+from .dft_engine import add_pattern_rows
+from .timing import stage
+
+
+# Righe di bordo per strip DWT: db4 (8 tap) contamina al massimo 7 righe per lato
+DWT_HALO = 16
+
+
+class PngStreamWriter:
+    """
+    Scrive un PNG RGB a 8 bit una strip alla volta
+
+    Ogni riga usa il filtro Sub e i dati compressi escono in chunk IDAT man
+    mano che zlib li produce, senza tenere in memoria l'immagine intera.
+    """
+
+    def __init__(self, output, width: int, height: int, compress_level: int = 6):
+        self.output = output
+        self.width = width
+        self.height = height
+        self._compressor = zlib.compressobj(compress_level)
+        self._rows_written = 0
+        self.output.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, chunk_type: bytes, data: bytes):
+        self.output.write(struct.pack('>I', len(data)))
+        self.output.write(chunk_type)
+        self.output.write(data)
+        self.output.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, rows: np.ndarray):
+        """Aggiunge righe uint8 (n, width, 3)"""
+        with stage('encode'):
+            raw = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), self.width * 3)
+            filtered = np.empty((len(rows), self.width * 3 + 1), dtype=np.uint8)
+            filtered[:, 0] = 1
+            filtered[:, 1:4] = raw[:, :3]
+            np.subtract(raw[:, 3:], raw[:, :-3], out=filtered[:, 4:])
+
+            compressed = self._compressor.compress(filtered.tobytes())
+            if compressed:
+                self._chunk(b'IDAT', compressed)
+        self._rows_written += len(rows)
+
+    def close(self):
+        if self._rows_written != self.height:
+            raise ValueError(f"Scritte {self._rows_written} righe su {self.height}")
+        with stage('encode'):
+            self._chunk(b'IDAT', self._compressor.flush())
+            self._chunk(b'IEND', b'')
+
+
+class ArrayRowsWriter:
+    """
+    Raccoglie le strip in un array uint8 (height, width, 3)
+
+    Per i formati che Pillow sa scrivere solo a immagine intera (WebP, JPEG):
+    il picco resta comunque quello dell'immagine uint8, non del float32.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)
+        self._rows_written = 0
+
+    def write_rows(self, rows: np.ndarray):
+        self.pixels[self._rows_written:self._rows_written + len(rows)] = rows
+        self._rows_written += len(rows)
+
+    def close(self):
+        if self._rows_written != self.pixels.shape[0]:
+            raise ValueError(f"Scritte {self._rows_written} righe su {self.pixels.shape[0]}")
+
+
+class DctRowsWriter:
+    """
+    Inoltra le strip a writer dopo aver scritto i bit DCT nelle prime payload_rows righe
+
+    Le strip in arrivo sono accumulate finché coprono payload_rows righe
+    (multiplo di block_size), così i blocchi non restano divisi tra due strip.
+    """
+
+    def __init__(self, writer, width: int, payload_rows: int, bits: np.ndarray, block_size: int, strength: float):
+        self.writer = writer
+        self.width = width
+        self.payload_rows = payload_rows
+        self.bits = bits
+        self.block_size = block_size
+        self.strength = strength
+        self._pending = []
+
+    def _flush(self):
+        rows = np.concatenate(self._pending)
+        self._pending = None
+        cols = self.width // self.block_size
+        region = rows[:self.payload_rows, :cols * self.block_size]
+        payload = region.astype(np.float32)
+        apply_dct_blocks(payload, self.bits, self.block_size, self.strength)
+        np.copyto(region, payload, casting='unsafe')
+        self.writer.write_rows(rows)
+
+    def write_rows(self, rows: np.ndarray):
+        if self._pending is None:
+            self.writer.write_rows(rows)
+            return
+        self._pending.append(rows)
+        if sum(len(pending) for pending in self._pending) >= self.payload_rows:
+            self._flush()
+
+    def close(self):
+        if self._pending:
+            self._flush()
+        self.writer.close()
+
+
+def _strip_array(image: Image.Image, top: int, bottom: int, width: int = None) -> np.ndarray:
+    width = width or image.width
+    return np.asarray(image.crop((0, top, width, bottom)))
+
+
+def apply_dct_tiled(image: Image.Image, bits: np.ndarray, block_size: int, strength: float,
+                    tile_rows: int, writer_factory):
+    """
+    Versione a strip di apply_dct_blocks su un'immagine PIL RGB
+
+    Le strip seguono i confini dei blocchi 8x8; solo le strip che contengono
+    bit del payload passano per float32, le altre sono copiate così come sono.
+    L'output coincide con quello del percorso non a strip.
+    """
+    height = (image.height // block_size) * block_size
+    width = (image.width // block_size) * block_size
+    cols = width // block_size
+    tile_rows = max(block_size, (tile_rows // block_size) * block_size)
+
+    writer = writer_factory(width, height)
+    for top in range(0, height, tile_rows):
+        bottom = min(height, top + tile_rows)
+        strip = _strip_array(image, top, bottom, width)
+
+        first_bit = (top // block_size) * cols
+        last_bit = min(len(bits), (bottom // block_size) * cols)
+        if last_bit > first_bit:
+            strip = strip.astype(np.float32)
+            apply_dct_blocks(strip, bits[first_bit:last_bit], block_size, strength)
+            strip = strip.astype(np.uint8)
+        writer.write_rows(strip)
+    writer.close()
+
+
+def _embed_dwt_window(bands: list, bits: np.ndarray, strength: float, band_shape: tuple, row_offset: int):
+    """
+    Come embed_dwt_bits, ma su una finestra di righe delle sottobande
+
+    row_offset è la riga globale della prima riga locale; gli indici dei bit
+    sono calcolati sulle dimensioni globali delle sottobande.
+    """
+    h, w = band_shape
+    start_h, end_h = h // 3, 2 * h // 3
+    start_w, end_w = w // 3, 2 * w // 3
+    region_w = end_w - start_w
+    region_size = (end_h - start_h) * region_w
+
+    for band_index, coeff_matrix in enumerate(bands):
+        first = max(start_h, row_offset)
+        last = min(end_h, row_offset + coeff_matrix.shape[0])
+        if last <= first:
+            continue
+        global_rows = np.arange(first, last)
+        indices = (band_index * region_size + (global_rows[:, None] - start_h) * region_w
+                   + np.arange(region_w)[None, :])
+        mask = indices < len(bits)
+        if not mask.any():
+            continue
+
+        window = coeff_matrix[first - row_offset:last - row_offset, start_w:end_w]
+        magnitude = np.abs(window[mask]) + strength
+        window[mask] = np.where(bits[indices[mask]].astype(bool), magnitude, -magnitude)
+
+
+def apply_dwt_tiled(image: Image.Image, bits: np.ndarray, strength: float, tile_rows: int, writer_factory):
+    """
+    Versione a strip del watermark DWT su un'immagine PIL RGB
+
+    Ogni strip è estesa di DWT_HALO righe per lato (allineate a 2), così i
+    coefficienti e la ricostruzione delle righe interne sono identici a quelli
+    calcolati sull'immagine intera.
+    """
+    height, width = image.height, image.width
+    wavelet = pywt.Wavelet('db4')
+    band_shape = (pywt.dwt_coeff_len(height, wavelet, 'symmetric'),
+                  pywt.dwt_coeff_len(width, wavelet, 'symmetric'))
+    tile_rows = max(2, tile_rows - tile_rows % 2)
+
+    writer = writer_factory(width, height)
+    for top in range(0, height, tile_rows):
+        bottom = min(height, top + tile_rows)
+        halo_top = max(0, top - DWT_HALO)
+        halo_bottom = min(height, bottom + DWT_HALO)
+        strip = _strip_array(image, halo_top, halo_bottom).astype(np.float32)
+
+        output = np.empty((bottom - top, width, 3), dtype=np.float32)
+        for channel in range(3):
+            with stage('transform'):
+                cA, (cH, cV, cD) = pywt.dwt2(np.ascontiguousarray(strip[:, :, channel]), 'db4')
+            with stage('embed'):
+                _embed_dwt_window([cH, cV, cD], bits, strength, band_shape, halo_top // 2)
+            with stage('inverse_transform'):
+                reconstructed = pywt.idwt2((cA, (cH, cV, cD)), 'db4')
+                reconstructed = reconstructed[top - halo_top:bottom - halo_top, :width]
+                output[:, :, channel] = np.clip(reconstructed, 0, 255)
+        writer.write_rows(output.astype(np.uint8))
+    writer.close()
+
+
+def apply_dft_tiled(image: Image.Image, tile: np.ndarray, tile_rows: int, writer_factory):
+    """
+    Versione a strip del watermark DFT su un'immagine PIL RGB
+
+    Il pattern dipende solo dalla riga globale, quindi ogni strip è
+    indipendente e l'output coincide con quello del percorso normale.
+    """
+    writer = writer_factory(image.width, image.height)
+    for top in range(0, image.height, tile_rows):
+        bottom = min(image.height, top + tile_rows)
+        strip = _strip_array(image, top, bottom)
+        with stage('embed'):
+            strip = np.clip(add_pattern_rows(strip, tile, top), 0, 255).astype(np.uint8)
+        writer.write_rows(strip)
+    writer.close()
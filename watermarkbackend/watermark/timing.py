@@ -0,0 +1,49 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+def record_stage(name: str, seconds: float):
+    """Somma la durata di una fase (decode_*, encode, ...) alla misura in corso nel thread corrente"""
+    stages = getattr(_local, 'stages', None)
+    if stages is None:
+        stages = _local.stages = {}
+    stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed(func, *args, **kwargs) -> tuple:
+    """
+    Esegue func e separa il tempo del watermark da quello delle singole fasi
+
+    Funzione a livello di modulo così può girare nei worker del process pool.
+
+    Returns:
+        (risultato, {"watermark_ms": ..., "<fase>_ms": ...}); watermark_ms è il
+        tempo totale meno quello delle fasi misurate
+    """
+    _local.stages = {}
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    total = time.perf_counter() - start
+    stages = _local.stages
+
+    timings = {'watermark_ms': (total - sum(stages.values())) * 1000}
+    timings.update({f'{name}_ms': seconds * 1000 for name, seconds in stages.items()})
+    return result, timings
+
+
+def server_timing(timings: dict) -> str:
+    """Valore dell'header Server-Timing per le misure restituite da timed"""
+    return ', '.join(f"{name.removesuffix('_ms')};dur={value:.1f}" for name, value in timings.items())
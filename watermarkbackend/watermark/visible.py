@@ -1,23 +1,87 @@
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-import os
-
-def apply_visible_watermark(image_bytes: bytes, text: str, position: str = "bottom-right", opacity: float = 0.5, size: int = 20) -> bytes:
-    img = Image.open(BytesIO(image_bytes)).convert("RGBA")
-    watermark = Image.new("RGBA", img.size)
-    draw = ImageDraw.Draw(watermark)
-    try:
-        font = ImageFont.truetype("arial.ttf", size)
-    except (OSError, IOError):
+from functools import lru_cache
+import threading
+from .encoder import OutputFormat, encode_image
+from .timing import stage
+
+# Catena di fallback dei font, risolta una volta all'import del modulo
+FONT_CANDIDATES = ["arial.ttf", "/System/Library/Fonts/Arial.ttf", "DejaVuSans.ttf"]
+
+# FreeType non è thread-safe sulla stessa faccia: il rendering degli stamp è serializzato
+_render_lock = threading.Lock()
+
+
+def _resolve_font_path():
+    """Primo font della catena caricabile da disco, None per il font di default di Pillow"""
+    for path in FONT_CANDIDATES:
         try:
-            font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", size)
+            ImageFont.truetype(path, 20)
+            return path
         except (OSError, IOError):
-            try:
-                font = ImageFont.truetype("DejaVuSans.ttf", size)
-            except (OSError, IOError):
-                font = ImageFont.load_default()
+            continue
+    return None
+
+
+FONT_PATH = _resolve_font_path()
+
+
+@lru_cache(maxsize=64)
+def get_font(path, size: int):
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=128)
+def render_stamp(text: str, size: int, alpha: int) -> tuple:
+    """
+    Testo bianco con trasparenza alpha, renderizzato una sola volta
+
+    Returns:
+        (stamp RGBA grande quanto il bbox del testo, bbox relativo all'origine)
+    """
+    font = get_font(FONT_PATH, size)
+    with _render_lock:
+        bbox = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), text, font=font)
+        stamp = Image.new("RGBA", (max(1, bbox[2] - bbox[0]), max(1, bbox[3] - bbox[1])))
+        ImageDraw.Draw(stamp).text((-bbox[0], -bbox[1]), text, font=font, fill=(255, 255, 255, alpha))
+    return stamp, bbox
 
-    bbox = draw.textbbox((0, 0), text, font=font)
+
+def _composite_stamp(img: Image.Image, stamp: Image.Image, x: int, y: int):
+    """alpha_composite dello stamp con l'angolo in (x, y), solo nell'area dello stamp e dentro l'immagine"""
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(img.width, x + stamp.width), min(img.height, y + stamp.height)
+    if right <= left or bottom <= top:
+        return
+    source = (left - x, top - y, right - x, bottom - y)
+
+    if img.mode == "RGBA":
+        img.alpha_composite(stamp, (left, top), source)
+        return
+
+    # Immagine opaca: solo il riquadro passa per RGBA
+    box = (left, top, right, bottom)
+    region = img.crop(box).convert("RGBA")
+    region.alpha_composite(stamp, (0, 0), source)
+    img.paste(region.convert("RGB"), box)
+
+
+def apply_visible_watermark(image_bytes: bytes, text: str, position: str = "bottom-right", opacity: float = 0.5, size: int = 20,
+                            output: OutputFormat = None) -> bytes:
+    img = Image.open(BytesIO(image_bytes))
+    # Con la trasparenza il colore finale dipende dall'alpha: si lavora in RGBA come prima
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    target_mode = "RGBA" if has_alpha else "RGB"
+    with stage('decode_pixels'):
+        img = img.convert(target_mode) if img.mode != target_mode else img
+        img.load()
+
+    alpha = int(opacity * 255)
+    alpha = max(0, min(255, alpha))
+
+    stamp, bbox = render_stamp(text, size, alpha)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     margin = 10
@@ -38,12 +102,6 @@ def apply_visible_watermark(image_bytes: bytes, text: str, position: str = "bott
     else:
         pos = (margin, margin)
 
-    alpha = int(opacity * 255)
-    alpha = max(0, min(255, alpha))  
-
-    draw.text(pos, text, font=font, fill=(255, 255, 255, alpha))  
-
-    combined = Image.alpha_composite(img, watermark)
-    output = BytesIO()
-    combined.convert("RGB").save(output, format="PNG")
-    return output.getvalue()
\ No newline at end of file
+    with stage('embed'):
+        _composite_stamp(img, stamp, pos[0] + bbox[0], pos[1] + bbox[1])
+    return encode_image(img if img.mode == "RGB" else img.convert("RGB"), output)
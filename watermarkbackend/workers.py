@@ -0,0 +1,158 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from watermark.cache import image_cache
+
+
+class WorkerPool:
+    """
+    Esegue le funzioni di watermarking (CPU-bound) fuori dall'event loop
+
+    Configurazione tramite variabili d'ambiente:
+    - WATERMARK_EXECUTOR: "process" (default) oppure "thread"
+    - WATERMARK_WORKERS: numero di worker (default: numero di CPU)
+    - WATERMARK_MAX_PENDING: richieste in coda/esecuzione oltre cui si risponde 503
+    - WATERMARK_TIMEOUT: secondi massimi di attesa per richiesta (504 se superati)
+    - WATERMARK_CACHE_MB: memoria totale della cache delle immagini; con
+      "process" è divisa tra i worker, ognuno con la propria cache
+
+    Con "process" le statistiche della cache arrivano dai worker insieme ai
+    risultati: cache_stats somma l'ultima fotografia di ciascun processo.
+
+    Un task già partito non si può annullare: allo scadere del timeout il
+    process pool viene sostituito e i suoi processi terminati, così il worker
+    bloccato non resta occupato. Le altre richieste in corso su quel pool
+    ricevono 503. Con "thread" i thread non si possono fermare e il timeout
+    limita solo l'attesa della risposta, non l'occupazione del worker.
+    """
+
+    def __init__(self, kind: str = "process", size: int = None, max_pending: int = None, timeout: float = 120.0):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Executor non supportato: {kind}")
+        self.kind = kind
+        self.size = size or os.cpu_count() or 1
+        self.max_pending = max_pending or self.size * 4
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+        self._worker_caches = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "WorkerPool":
+        size = os.environ.get("WATERMARK_WORKERS")
+        max_pending = os.environ.get("WATERMARK_MAX_PENDING")
+        return cls(
+            kind=os.environ.get("WATERMARK_EXECUTOR", "process"),
+            size=int(size) if size else None,
+            max_pending=int(max_pending) if max_pending else None,
+            timeout=float(os.environ.get("WATERMARK_TIMEOUT", "120")),
+        )
+
+    def _get_executor(self):
+        # Creato alla prima richiesta, non all'import del modulo
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.size, initializer=_init_process_worker,
+                                                     initargs=(image_cache.max_bytes // self.size,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size)
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, func, *args):
+        """Esegue func(*args) su un worker rispettando limite di coda e timeout"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(status_code=503, detail="Server occupato, riprovare più tardi")
+            self._pending += 1
+
+        try:
+            executor = self._get_executor()
+            if self.kind == "process":
+                future = executor.submit(_run_in_process, func, *args)
+            else:
+                future = executor.submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # Il posto in coda si libera solo quando il worker ha davvero finito
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if not future.cancel():
+                self._recycle(executor)
+            raise HTTPException(status_code=504, detail="Elaborazione oltre il tempo massimo consentito")
+        except BrokenExecutor:
+            # Pool sostituito da _recycle mentre questa richiesta era in corso
+            raise HTTPException(status_code=503, detail="Server occupato, riprovare più tardi")
+
+        if self.kind != "process":
+            return result
+        result, pid, cache_stats = result
+        with self._lock:
+            self._worker_caches[pid] = cache_stats
+        return result
+
+    def _recycle(self, executor):
+        """Sostituisce il process pool con un task oltre il timeout e ne termina i processi"""
+        if self.kind != "process":
+            return
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            # Le cache dei processi terminati non esistono più
+            self._worker_caches.clear()
+        # terminate_workers esiste da Python 3.14; prima i processi sono solo in _processes
+        terminate = getattr(executor, "terminate_workers", None)
+        if terminate is not None:
+            terminate()
+            return
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.size,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "timeout": self.timeout,
+        }
+
+    def cache_stats(self) -> dict:
+        """Statistiche della cache delle immagini: quella del server o la somma dei worker"""
+        if self.kind != "process":
+            return image_cache.stats()
+        with self._lock:
+            snapshots = list(self._worker_caches.values())
+        totals = {name: sum(snapshot[name] for snapshot in snapshots)
+                  for name in ("entries", "bytes", "hits", "misses", "evictions")}
+        return {**totals, "max_bytes": (image_cache.max_bytes // self.size) * self.size,
+                "workers_reporting": len(snapshots)}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._worker_caches.clear()
+
+
+def _init_process_worker(cache_bytes: int):
+    # Il budget WATERMARK_CACHE_MB è per tutto il pool, non per processo
+    image_cache.max_bytes = cache_bytes
+
+
+def _run_in_process(func, *args) -> tuple:
+    """func(*args) nel worker, con pid e statistiche della sua cache"""
+    return func(*args), os.getpid(), image_cache.stats()